@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+对比两次基准结果
+老王说：光看一个数没意义，得和改之前比！变化超过阈值的标出来。
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+# (字段, 显示名, 越大越好?)
+METRICS = (
+    ('wall_time', '耗时(s)', False),
+    ('throughput', '吞吐(MB/s)', True),
+    ('cpu_time', 'CPU(s)', False),
+    ('peak_rss', '峰值内存(MB)', False),
+    ('db_writes', '写库语句', False),
+    ('db_commits', '提交次数', False),
+    ('syscalls_read', 'read调用', False),
+    ('syscalls_write', 'write调用', False),
+    ('disk_write_bytes', '写盘(MB)', False),
+    ('http_requests', 'HTTP请求', False),
+    ('bytes_redownloaded', '重复下载(MB)', False),
+)
+# 这些字段按MB显示
+MB_FIELDS = ('throughput', 'peak_rss', 'disk_write_bytes', 'bytes_redownloaded')
+
+
+def _load(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _display(key: str, value) -> str:
+    if value is None:
+        return '-'
+    if key in MB_FIELDS:
+        return f"{value / (1024 * 1024):.2f}"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def _change(old, new) -> Optional[float]:
+    if old is None or new is None or not old:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(base: Dict, head: Dict, threshold: float) -> List[str]:
+    """生成对比表的文本行"""
+    lines = []
+    for side, report in (('基准', base), ('对比', head)):
+        meta = report.get('meta', {})
+        commit = (meta.get('commit') or '?')[:10] + ('+改动' if meta.get('dirty') else '')
+        lines.append(f"{side}: {commit}  {meta.get('timestamp', '')}  scale={meta.get('scale')}  {meta.get('platform', '')}")
+    if base.get('meta', {}).get('scale') != head.get('meta', {}).get('scale'):
+        lines.append("[警告] 两次的 --scale 不一样，结果没法直接比")
+
+    for name, new in head.get('scenarios', {}).items():
+        old = base.get('scenarios', {}).get(name)
+        lines.append('')
+        lines.append(f"== {name} ==")
+        if old is None:
+            lines.append("  （基准里没有这个场景）")
+            continue
+        for result, side in ((old, '基准'), (new, '对比')):
+            if 'error' in result:
+                lines.append(f"  {side}出错: {result['error']}")
+            elif not result.get('ok'):
+                lines.append(f"  {side}有失败: 失败 {result.get('failed')} 损坏 {result.get('corrupt')}")
+        if 'error' in old or 'error' in new:
+            continue
+        for key, label, higher_better in METRICS:
+            if old.get(key) is None and new.get(key) is None:
+                continue
+            change = _change(old.get(key), new.get(key))
+            mark = ''
+            if change is not None and abs(change) >= threshold:
+                better = (change > 0) == higher_better
+                mark = '  ✓ 变好' if better else '  ✗ 变差'
+            change_text = f"{change:+.1f}%" if change is not None else ''
+            lines.append(f"  {label:<14}{_display(key, old.get(key)):>12}{_display(key, new.get(key)):>12}  {change_text:>8}{mark}")
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare', description='对比两次基准结果')
+    parser.add_argument('base', help='基准结果（改动前）')
+    parser.add_argument('head', help='对比结果（改动后）')
+    parser.add_argument('--threshold', type=float, default=5.0, help='变化超过多少百分比才标出来（默认5）')
+    args = parser.parse_args(argv)
+    for line in compare(_load(args.base), _load(args.head), args.threshold):
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+跑单个基准场景并采集指标
+老王说：一个场景一个进程（run.py负责起进程），不然峰值内存、CPU时间全是前面场景留下的，量了等于白量！
+
+流程：起本地源站子进程 -> 用 DownloadEngine/TaskManager 把场景里的文件全下完 -> 逐字节校验内容 -> 输出JSON
+带 kill_at 的场景先起一个子进程下载，下到比例后 SIGKILL 掉，本进程再接着续传，只量续传这一段
+
+单独跑：python -m benchmarks.harness small_1000x100k --scale 0.1
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.range_server import expected_bytes
+from benchmarks.scenarios import SCENARIOS, scaled, file_list
+from downloader.cli import CliRunner
+from downloader.core.download_engine import DownloadEngine
+from downloader.core.task_manager import TaskManager
+from downloader.database.db_manager import DatabaseManager
+from downloader.utils.config import ConfigManager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 校验时每次读多少字节和预期内容比（整个文件都比，续传时补错/漏写一段也能查出来）
+VERIFY_BLOCK_SIZE = 1024 * 1024
+# 硬杀场景里轮询源站进度的间隔（秒）
+KILL_POLL_INTERVAL = 0.02
+
+
+class CountingDatabaseManager(DatabaseManager):
+    """数SQL语句的数据库管理器（每个连接挂trace回调）"""
+
+    WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+    def __init__(self, db_path: str):
+        self.sql_counts = {'connections': 0, 'reads': 0, 'writes': 0, 'commits': 0}
+        self._count_lock = threading.Lock()
+        super().__init__(db_path)
+
+    def _connect(self):
+        conn = super()._connect()
+        conn.set_trace_callback(self._trace)
+        with self._count_lock:
+            self.sql_counts['connections'] += 1
+        return conn
+
+    def _trace(self, statement: str):
+        verb = statement.lstrip()[:7].upper()
+        if verb.startswith('SELECT'):
+            key = 'reads'
+        elif verb.startswith(self.WRITE_VERBS):
+            key = 'writes'
+        elif verb.startswith('COMMIT'):
+            key = 'commits'
+        else:
+            return
+        with self._count_lock:
+            self.sql_counts[key] += 1
+
+
+# ==================== 进程资源 ====================
+
+def _read_proc_io() -> Dict[str, int]:
+    """Linux的 /proc/self/io（系统调用次数、实际读写磁盘字节）；别的平台返回空"""
+    try:
+        with open('/proc/self/io') as f:
+            return {key: int(value) for key, value in (line.split(':') for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+
+def _peak_rss() -> Optional[int]:
+    """本进程峰值内存（字节），拿不到返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux单位是KB
+
+
+def _ctx_switches() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+
+def snapshot() -> Dict:
+    """当前进程的资源计数"""
+    times = os.times()
+    return {
+        'wall': time.perf_counter(),
+        'cpu_user': times.user,
+        'cpu_system': times.system,
+        'ctx_switches': _ctx_switches(),
+        'io': _read_proc_io(),
+    }
+
+
+def resource_delta(before: Dict, after: Dict) -> Dict:
+    """两次快照之间的差"""
+    result = {
+        'wall_time': round(after['wall'] - before['wall'], 4),
+        'cpu_user': round(after['cpu_user'] - before['cpu_user'], 4),
+        'cpu_system': round(after['cpu_system'] - before['cpu_system'], 4),
+        'peak_rss': _peak_rss(),
+        'ctx_switches': None,
+        'syscalls_read': None,
+        'syscalls_write': None,
+        'disk_read_bytes': None,
+        'disk_write_bytes': None,
+    }
+    result['cpu_time'] = round(result['cpu_user'] + result['cpu_system'], 4)
+    if before['ctx_switches'] is not None:
+        result['ctx_switches'] = after['ctx_switches'] - before['ctx_switches']
+    for key, name in (('syscr', 'syscalls_read'), ('syscw', 'syscalls_write'),
+                      ('read_bytes', 'disk_read_bytes'), ('write_bytes', 'disk_write_bytes')):
+        if key in before['io'] and key in after['io']:
+            result[name] = after['io'][key] - before['io'][key]
+    return result
+
+
+# ==================== 源站 ====================
+
+class OriginProcess:
+    """源站子进程（和被测引擎分开，不吃被测进程的CPU）"""
+
+    def __init__(self, options: Dict):
+        cmd = [sys.executable, '-m', 'benchmarks.range_server', '--port', '0']
+        if not options.get('ranges', True):
+            cmd.append('--no-ranges')
+        for key in ('latency', 'jitter', 'bandwidth', 'error_rate', 'drop_rate', 'seed'):
+            if options.get(key):
+                cmd += ['--' + key.replace('_', '-'), str(options[key])]
+        self.proc = subprocess.Popen(cmd, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+        line = self.proc.stdout.readline().split()
+        if len(line) != 2 or line[0] != 'PORT':
+            self.proc.kill()
+            raise RuntimeError("源站启动失败")
+        self.base_url = f"http://127.0.0.1:{line[1]}"
+
+    def stats(self) -> Dict[str, int]:
+        with urllib.request.urlopen(f"{self.base_url}/__stats", timeout=5) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+# ==================== 下载 ====================
+
+def make_config(work_dir: str, scenario: Dict) -> ConfigManager:
+    """场景专用配置（目录全在工作目录里，不碰用户自己的配置和下载目录）"""
+    config = ConfigManager(os.path.join(work_dir, 'config.json'))
+    config.download_dir = os.path.join(work_dir, 'out')
+    config.set('temp_dir', os.path.join(work_dir, 'temp'))
+    config.thread_count = scenario['threads']
+    config.set('max_connections_per_host', 64)
+    config.speed_limit = 0
+    return config
+
+
+def download(work_dir: str, scenario: Dict, urls: List[str], resume: bool = False) -> Tuple[Dict, List[Dict]]:
+    """
+    用引擎把任务跑完
+    Args:
+        resume: True时不加新任务，把数据库里没完成的接着下
+    Returns:
+        (SQL计数, 任务记录列表)
+    """
+    db = CountingDatabaseManager(os.path.join(work_dir, 'downloads.db'))
+    engine = DownloadEngine(db, make_config(work_dir, scenario))
+    task_manager = TaskManager(engine, db, scenario['concurrent'])
+    runner = CliRunner(task_manager, quiet=True)
+    try:
+        if resume:
+            runner.resume_unfinished()
+        else:
+            for url in urls:
+                runner.add(url, None, None, 'md5')
+        runner.wait()
+    finally:
+        runner.stop()
+    tasks = [task.to_dict() for task in map(task_manager.get_task, runner.watched) if task]
+    return dict(db.sql_counts), tasks
+
+
+def seed_and_kill(work_dir: str, name: str, scale: float, origin: OriginProcess, total_bytes: int,
+                  kill_at: float) -> int:
+    """
+    起子进程下载，源站发出 kill_at 比例的字节后硬杀它（模拟崩溃/断电）
+    Returns:
+        杀掉时源站已发出的字节数
+    """
+    cmd = [sys.executable, '-m', 'benchmarks.harness', name, '--scale', str(scale),
+           '--work-dir', work_dir, '--base-url', origin.base_url, '--seed-only']
+    child = subprocess.Popen(cmd, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    target = total_bytes * kill_at
+    sent = 0
+    while child.poll() is None:
+        sent = origin.stats()['bytes_sent']
+        if sent >= target:
+            break
+        time.sleep(KILL_POLL_INTERVAL)
+    child.kill()
+    child.wait()
+    return origin.stats()['bytes_sent']
+
+
+def verify(tasks: List[Dict], sizes: Dict[str, int]) -> Dict:
+    """核对下载结果：大小对不对，内容逐字节对不对（在量完时间之后做，不算进耗时）"""
+    completed = [task for task in tasks if task['status'] == 'completed']
+    bad = []
+    for task in completed:
+        path = task['save_path']
+        size = sizes.get(task['url'])
+        try:
+            if os.path.getsize(path) != size:
+                bad.append(task['filename'])
+                continue
+            with open(path, 'rb') as f:
+                offset = 0
+                while offset < size:
+                    data = f.read(VERIFY_BLOCK_SIZE)
+                    if not data or data != expected_bytes(offset, len(data)):
+                        bad.append(task['filename'])
+                        break
+                    offset += len(data)
+        except OSError:
+            bad.append(task['filename'])
+    errors = {}
+    for task in tasks:
+        if task['status'] != 'completed':
+            reason = f"{task['status']}: {task['error_message'] or ''}".rstrip(': ')
+            errors[reason] = errors.get(reason, 0) + 1
+    return {
+        'completed': len(completed),
+        'failed': len(tasks) - len(completed),
+        'failure_reasons': errors,
+        'corrupt': len(bad),
+        'corrupt_files': bad[:20],
+    }
+
+
+def run(name: str, scale: float = 1.0, keep: bool = False) -> Dict:
+    """跑一个场景，返回指标"""
+    scenario = scaled(SCENARIOS[name], scale)
+    sizes_list = file_list(scenario)
+    total_bytes = sum(sizes_list)
+    work_dir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    origin = OriginProcess(scenario['server'])
+    try:
+        urls = [f"{origin.base_url}/{size}/f{i:05d}.bin" for i, size in enumerate(sizes_list)]
+        result = {'scenario': name, 'scale': scale, 'files': len(urls), 'bytes': total_bytes}
+
+        if scenario.get('kill_at'):
+            result['bytes_before_kill'] = seed_and_kill(work_dir, name, scale, origin, total_bytes,
+                                                        scenario['kill_at'])
+
+        origin_before = origin.stats()
+        before = snapshot()
+        sql_counts, tasks = download(work_dir, scenario, urls, resume=bool(scenario.get('kill_at')))
+        after = snapshot()
+        origin_after = origin.stats()
+
+        result.update(resource_delta(before, after))
+        result['throughput'] = round(total_bytes / result['wall_time'], 1) if result['wall_time'] else None
+        result['db_connections'] = sql_counts['connections']
+        result['db_reads'] = sql_counts['reads']
+        result['db_writes'] = sql_counts['writes']
+        result['db_commits'] = sql_counts['commits']
+        for key, value in origin_after.items():
+            result['http_' + key] = value - origin_before.get(key, 0)
+        if 'bytes_before_kill' in result:
+            # 续传多下了多少（崩溃前已经收到、但没来得及落盘/记账的那部分）
+            result['bytes_redownloaded'] = max(0, result['bytes_before_kill'] + result['http_bytes_sent'] - total_bytes)
+            result['throughput'] = None  # 续传只下了一部分，吞吐没意义，看wall_time和重复下载量
+
+        result.update(verify(tasks, dict(zip(urls, sizes_list))))
+        result['ok'] = result['failed'] == 0 and result['corrupt'] == 0
+        return result
+    finally:
+        origin.stop()
+        if keep:
+            print(f"[基准] 工作目录保留在: {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.harness', description='跑单个基准场景，结果JSON打到标准输出')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--scale', type=float, default=1.0, help='文件大小/带宽缩放比例')
+    parser.add_argument('--keep', action='store_true', help='保留工作目录')
+    # 下面是硬杀场景内部用的：子进程只管下载，等着被杀
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--seed-only', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    # 引擎的日志全赶到标准错误，标准输出只留一行JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.seed_only:
+            scenario = scaled(SCENARIOS[args.scenario], args.scale)
+            urls = [f"{args.base_url}/{size}/f{i:05d}.bin" for i, size in enumerate(file_list(scenario))]
+            download(args.work_dir, scenario, urls)
+            return 0
+        result = run(args.scenario, args.scale, args.keep)
+    print(json.dumps(result, ensure_ascii=False), file=out, flush=True)
+    return 0 if result['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的本地HTTP源站
+老王说：拿公网测速度，今天快明天慢，两次提交根本没法比！本地起个可控的源站才有准数。
+
+- 文件不占内存也不占硬盘：路径 /<大小>/<文件名>，内容按偏移量现算（同一偏移永远是同一个字节）
+- 可调：是否支持Range、首字节延迟+抖动、每条连接的带宽上限、503注入、传输中途断连注入
+- GET /__stats 返回收到的请求数、发出的字节数、注入的故障数（JSON）
+
+单独跑：python -m benchmarks.range_server --port 8000 --latency 0.05 --bandwidth 2M
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+# 内容按这个长度循环（取素数：分块边界都是2的幂，错位写入不会刚好对上同样的内容）
+PATTERN_SIZE = 65521
+_PATTERN = random.Random(20240601).randbytes(PATTERN_SIZE)
+_PATTERN2 = _PATTERN * 2
+
+_PATH_RE = re.compile(r'^/(\d+)/[^/?]+$')
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def expected_bytes(offset: int, length: int) -> bytes:
+    """文件在offset处length个字节的内容（校验下载结果用）"""
+    parts = []
+    while length > 0:
+        start = offset % PATTERN_SIZE
+        n = min(length, PATTERN_SIZE)
+        parts.append(_PATTERN2[start:start + n])
+        offset += n
+        length -= n
+    return b''.join(parts)
+
+
+def parse_size(text: str) -> int:
+    """解析 500K / 2M / 1G / 1048576"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)B?', text.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+    return int(float(match.group(1)) * {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[match.group(2)])
+
+
+class ServerOptions:
+    """源站行为参数"""
+
+    def __init__(self, ranges: bool = True, latency: float = 0.0, jitter: float = 0.0,
+                 bandwidth: int = 0, error_rate: float = 0.0, drop_rate: float = 0.0, seed: int = 1):
+        """
+        Args:
+            ranges: 是否支持Range（False时HEAD不带Accept-Ranges，GET忽略Range回整个文件）
+            latency: 每个请求的首字节延迟（秒）
+            jitter: 延迟抖动（秒，在 [0, jitter) 里随机加）
+            bandwidth: 每条连接的带宽上限（字节/秒，0不限）
+            error_rate: GET直接回503（Retry-After: 1）的概率
+            drop_rate: 每发送1MB中途断开连接的概率
+            seed: 随机种子（故障注入可复现）
+        """
+        self.ranges = ranges
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    def roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self.random_lock:
+            return self.random.random() < probability
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self.random_lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+
+class ServerStats:
+    """源站计数（多线程累加）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'head_requests': 0, 'range_requests': 0, 'bytes_sent': 0,
+                       'injected_errors': 0, 'dropped_connections': 0}
+
+    def add(self, key: str, value: int = 1):
+        with self._lock:
+            self.counts[key] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'RangeServer'
+
+    def log_message(self, format, *args):
+        pass  # 上千个请求刷屏，不要
+
+    def _file_size(self) -> Optional[int]:
+        match = _PATH_RE.match(self.path)
+        return int(match.group(1)) if match else None
+
+    def _parse_range(self, size: int) -> Optional[Tuple[int, int]]:
+        header = self.headers.get('Range')
+        if not header or not self.server.options.ranges:
+            return None
+        match = _RANGE_RE.match(header.strip())
+        if not match or not (match.group(1) or match.group(2)):
+            return None
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start, end = max(0, size - int(match.group(2))), size - 1  # bytes=-N
+        return start, end
+
+    def _send_empty(self, code: int, headers: Optional[dict] = None):
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        size = self._file_size()
+        if size is None:
+            self._send_empty(404)
+            return
+        self.server.stats.add('head_requests')
+        time.sleep(self.server.options.delay())
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.send_header('Content-Type', 'application/octet-stream')
+        if self.server.options.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == '/__stats':
+            body = json.dumps(self.server.stats.snapshot()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        size = self._file_size()
+        if size is None:
+            self._send_empty(404)
+            return
+        options = self.server.options
+        stats = self.server.stats
+        stats.add('requests')
+        time.sleep(options.delay())
+
+        if options.roll(options.error_rate):
+            stats.add('injected_errors')
+            self._send_empty(503, {'Retry-After': '1'})
+            return
+
+        byte_range = self._parse_range(size)
+        if byte_range:
+            start, end = byte_range
+            if start >= size or start > end:
+                self._send_empty(416, {'Content-Range': f'bytes */{size}'})
+                return
+            stats.add('range_requests')
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.end_headers()
+        self._stream(start, end)
+
+    def _stream(self, start: int, end: int):
+        """按块发送，带宽上限靠发完每块后睡到该到的时间点"""
+        options = self.server.options
+        stats = self.server.stats
+        began = time.monotonic()
+        sent = 0
+        offset = start
+        drop_probability = options.drop_rate * PATTERN_SIZE / (1024 * 1024)  # 换算成每块的概率
+        while offset <= end:
+            piece = expected_bytes(offset, min(PATTERN_SIZE, end - offset + 1))
+            if options.roll(drop_probability):
+                stats.add('dropped_connections')
+                self.close_connection = True
+                return
+            try:
+                self.wfile.write(piece)
+            except OSError:
+                self.close_connection = True
+                return
+            offset += len(piece)
+            sent += len(piece)
+            stats.add('bytes_sent', len(piece))
+            if options.bandwidth:
+                ahead = sent / options.bandwidth - (time.monotonic() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+class RangeServer(ThreadingHTTPServer):
+    """可调行为的本地源站"""
+
+    daemon_threads = True
+    request_queue_size = 256  # 上千个小文件一起连进来，默认的5会被拒
+
+    def __init__(self, port: int = 0, options: Optional[ServerOptions] = None, host: str = '127.0.0.1'):
+        self.options = options or ServerOptions()
+        self.stats = ServerStats()
+        super().__init__((host, port), _RangeHandler)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.range_server', description='基准测试用的本地Range源站')
+    parser.add_argument('--port', type=int, default=0, help='端口（0随机，实际端口打印在第一行）')
+    parser.add_argument('--no-ranges', dest='ranges', action='store_false', help='不支持Range')
+    parser.add_argument('--latency', type=float, default=0.0, help='首字节延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟抖动（秒）')
+    parser.add_argument('--bandwidth', type=parse_size, default=0, help='每条连接的带宽上限，如 2M')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='GET回503的概率')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='每发送1MB中途断连的概率')
+    parser.add_argument('--seed', type=int, default=1, help='故障注入的随机种子')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    options = ServerOptions(ranges=args.ranges, latency=args.latency, jitter=args.jitter,
+                            bandwidth=args.bandwidth, error_rate=args.error_rate,
+                            drop_rate=args.drop_rate, seed=args.seed)
+    server = RangeServer(args.port, options)
+    # 第一行给父进程读端口
+    print(f"PORT {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试入口：每个场景单独起一个进程跑，结果汇总成一个JSON
+老王说：结果文件带上提交号，改代码前后各跑一次，用 benchmarks.compare 一比就知道是优化还是劣化！
+
+    python -m benchmarks.run                          # 默认场景（不含10G大文件）
+    python -m benchmarks.run single_10g mixed -o after.json
+    python -m benchmarks.run --scale 0.05 -o quick.json   # 文件缩小20倍，快速过一遍
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.scenarios import SCENARIOS, DEFAULT_SCENARIOS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def collect_meta(scale: float) -> Dict:
+    """跑分环境（不同机器的结果别拿来比）"""
+    status = _git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+    }
+
+
+def run_scenario(name: str, scale: float, timeout: float, verbose: bool, keep: bool) -> Dict:
+    """在独立进程里跑一个场景"""
+    cmd = [sys.executable, '-m', 'benchmarks.harness', name, '--scale', str(scale)]
+    if keep:
+        cmd.append('--keep')
+    try:
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True, timeout=timeout,
+                              stderr=None if verbose else subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        return {'scenario': name, 'ok': False, 'error': f'超时（{timeout:.0f}秒）'}
+    lines = proc.stdout.strip().splitlines()
+    try:
+        return json.loads(lines[-1])
+    except (IndexError, ValueError):
+        return {'scenario': name, 'ok': False, 'error': f'场景进程异常退出（退出码{proc.returncode}，加 -v 看日志）'}
+
+
+def _summary(result: Dict) -> str:
+    if 'error' in result:
+        return f"[失败] {result['scenario']}: {result['error']}"
+    from downloader.utils.file_utils import format_size, format_speed
+    line = (f"[{'完成' if result['ok'] else '失败'}] {result['scenario']}: {result['wall_time']:.2f}s"
+            f" | CPU {result['cpu_time']:.2f}s | 写库 {result['db_writes']}")
+    if result.get('throughput'):
+        line += f" | {format_speed(result['throughput'])}"
+    if result.get('peak_rss'):
+        line += f" | 峰值内存 {format_size(result['peak_rss'])}"
+    if 'bytes_redownloaded' in result:
+        line += f" | 重复下载 {format_size(result['bytes_redownloaded'])}"
+    if result['failed'] or result['corrupt']:
+        line += f" | 失败 {result['failed']} 损坏 {result['corrupt']}"
+    return line
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='下载引擎基准测试')
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO', help=f"场景名（默认: {' '.join(DEFAULT_SCENARIOS)}）")
+    parser.add_argument('--scale', type=float, default=1.0, help='文件大小/带宽缩放比例（默认1）')
+    parser.add_argument('-o', '--output', metavar='FILE', help='结果JSON写到文件（默认打到标准输出）')
+    parser.add_argument('--timeout', type=float, default=3600, help='单个场景超时秒数')
+    parser.add_argument('--list', action='store_true', help='列出所有场景')
+    parser.add_argument('--keep', action='store_true', help='保留下载的工作目录')
+    parser.add_argument('-v', '--verbose', action='store_true', help='显示引擎日志')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        from downloader.utils.file_utils import format_size
+        for name, scenario in SCENARIOS.items():
+            files = ', '.join(f"{count}x{format_size(size)}" for size, count in scenario['files'])
+            print(f"{name:20} {files}  server={scenario['server']}")
+        return 0
+
+    names = args.scenarios or DEFAULT_SCENARIOS
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}（--list 看全部）")
+
+    report = {'meta': collect_meta(args.scale), 'scenarios': {}}
+    for name in names:
+        print(f"[基准] 运行 {name} ...", file=sys.stderr, flush=True)
+        result = run_scenario(name, args.scale, args.timeout, args.verbose, args.keep)
+        report['scenarios'][name] = result
+        print(_summary(result), file=sys.stderr, flush=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"[基准] 结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0 if all(result.get('ok') for result in report['scenarios'].values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+基准场景定义
+老王说：场景一旦定下来就别随手改参数，改了以前的结果就全没法比了！要测新东西就加新场景。
+
+每个场景：
+    files       [(单个文件大小, 个数), ...]
+    server      源站参数（见 range_server.ServerOptions）
+    threads     每个任务的线程数
+    concurrent  同时下载任务数
+    kill_at     （可选）下到这个比例时硬杀下载进程，然后量续传那一段
+--scale 会把文件大小和带宽上限一起按比例缩小（场景的“形状”和大致耗时不变，省硬盘）
+"""
+from typing import Dict, List
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+SCENARIOS: Dict[str, Dict] = {
+    # 单个超大文件：看分块下载、落盘、合并的吞吐
+    'single_10g': {
+        'files': [(10 * GB, 1)],
+        'server': {},
+        'threads': 8,
+        'concurrent': 1,
+    },
+    # 大量小文件：看每个任务的固定开销（探测、建任务、数据库写入、线程调度）
+    'small_1000x100k': {
+        'files': [(100 * KB, 1000)],
+        'server': {},
+        'threads': 8,
+        'concurrent': 5,
+    },
+    # 大中小混着来
+    'mixed': {
+        'files': [(512 * MB, 2), (20 * MB, 20), (100 * KB, 200)],
+        'server': {'latency': 0.005},
+        'threads': 8,
+        'concurrent': 5,
+    },
+    # 下到一半进程被硬杀，重启续传：量续传这一段（重复下载了多少、多久恢复）
+    'resume_after_kill': {
+        'files': [(1 * GB, 2)],
+        'server': {'bandwidth': 16 * MB},
+        'threads': 8,
+        'concurrent': 2,
+        'kill_at': 0.5,
+    },
+    # 限速、高延迟、会抖会出错的源站：看重试、退避、限流自适应
+    'throttled_origin': {
+        'files': [(256 * MB, 2), (10 * MB, 10)],
+        'server': {'latency': 0.08, 'jitter': 0.04, 'bandwidth': 4 * MB, 'error_rate': 0.03, 'drop_rate': 0.02},
+        'threads': 8,
+        'concurrent': 3,
+    },
+    # 不支持Range的源站：只能单线程整文件下
+    'no_range': {
+        'files': [(256 * MB, 2)],
+        'server': {'ranges': False},
+        'threads': 8,
+        'concurrent': 2,
+    },
+}
+
+# 不传场景名时跑这些（single_10g要20G临时空间，得点名才跑）
+DEFAULT_SCENARIOS = ['small_1000x100k', 'mixed', 'resume_after_kill', 'throttled_origin', 'no_range']
+
+
+def scaled(scenario: Dict, scale: float) -> Dict:
+    """按比例缩小文件大小和带宽上限（最小1KB，带宽最小16KB/s）"""
+    if scale == 1:
+        return scenario
+    result = dict(scenario)
+    result['files'] = [(max(KB, int(size * scale)), count) for size, count in scenario['files']]
+    server = dict(scenario['server'])
+    if server.get('bandwidth'):
+        server['bandwidth'] = max(16 * KB, int(server['bandwidth'] * scale))
+    result['server'] = server
+    return result
+
+
+def file_list(scenario: Dict) -> List[int]:
+    """展开成每个文件的大小列表"""
+    return [size for size, count in scenario['files'] for _ in range(count)]
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+python -m downloader 入口（命令行版，不加载任何界面模块）
+"""
+import sys
+
+from downloader.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
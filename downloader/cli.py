@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+"""
+命令行入口（无界面）
+老王说：服务器上没显示器、CI里没桌面，下个文件还得先把Tk拉起来？扯淡！
+用法: python -m downloader URL [URL ...] [-i urls.txt] [-o 目录] [-t 线程数] ...
+      python -m downloader --daemon [--port 17890]   # 常驻服务，见 downloader/service/api_server.py
+      python -m downloader --verify-library [--rehash] [--redownload]   # 批量校验下完的文件
+
+退出码：0 全部完成；1 有任务失败；2 参数错误；130 被Ctrl+C中断（任务已暂停，下次 --resume 接着下）
+标准输出只打印完成文件的路径（一行一个），进度和日志都走标准错误，方便接管道。
+同一个数据库已经有实例在跑（界面/服务/另一个命令行）时，URL直接转发给它，打印任务ID后退出。
+"""
+import argparse
+import contextlib
+import os
+import signal
+import sys
+import threading
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from downloader.utils.config import ConfigManager, get_app_root
+from downloader.service.protocol import MODE_CLI
+from downloader.service.single_instance import InstanceLock, wait_for_instance, forward_urls
+from downloader.utils.file_utils import format_size, format_speed, get_hash_types
+
+if TYPE_CHECKING:
+    # 引擎（连带requests）只在真要自己下载时才加载，转发URL的路径保持轻快
+    from downloader.core.task_manager import TaskManager
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+# 到了这些状态任务就不会再动了
+FINAL_STATUSES = ('completed', 'failed', 'cancelled', 'verify_failed')
+# --resume 时接着下的状态
+RESUMABLE_STATUSES = ('pending', 'paused', 'failed', 'probing', 'verifying')
+
+# 进度刷新间隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """解析 500K / 2M / 1048576 这种大小（给argparse用）"""
+    value = text.strip().upper()
+    number = value.rstrip('KMGB')
+    unit = value[len(number):]
+    if not number or unit not in SIZE_UNITS:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+
+
+def read_url_file(path: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    读URL列表文件（'-'表示标准输入）
+    每行: URL [预期哈希]，空行和#开头的行忽略
+    """
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split()
+        entries.append((parts[0], parts[1] if len(parts) > 1 else None))
+    return entries
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(
+        prog='python -m downloader',
+        description='老王下载器命令行版：多线程分块下载，支持断点续传和批量任务',
+    )
+    parser.add_argument('urls', nargs='*', metavar='URL', help='下载链接')
+    parser.add_argument('-i', '--input-file', action='append', default=[], metavar='FILE',
+                        help='URL列表文件（每行: URL [预期哈希]，"-"表示标准输入），可重复')
+    parser.add_argument('-o', '--output-dir', help='保存目录（默认用配置里的下载目录）')
+    parser.add_argument('-t', '--threads', type=int, help='每个任务的线程数（1-16）')
+    parser.add_argument('-j', '--concurrent', type=int, help='同时下载任务数（1-5）')
+    parser.add_argument('--chunk-size', type=parse_size, metavar='SIZE',
+                        help='分片大小（支持K/M后缀），0表示按带宽时延积自动定')
+    parser.add_argument('--max-connections-per-host', type=int, metavar='N', help='每个主机的并发连接上限')
+    parser.add_argument('--speed-limit', type=parse_size, metavar='SIZE',
+                        help='每个连接的速度限制（字节/秒，支持K/M后缀），0表示不限速')
+    parser.add_argument('--hash', dest='expected_hash', metavar='HASH',
+                        help='预期哈希值（只能配合单个URL使用；批量请写在列表文件里）')
+    parser.add_argument('--hash-type', choices=get_hash_types(), type=str.lower, default='md5', help='哈希类型（默认md5）')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='同时接着下数据库里没完成的任务（等待/暂停/失败）')
+    parser.add_argument('--verify-library', action='store_true',
+                        help='批量校验所有下完的文件（上次没查完接着查），列出损坏/丢失的')
+    parser.add_argument('--rehash', action='store_true',
+                        help='配合 --verify-library：不用哈希缓存，全部重新读盘（查盘上的静默损坏）')
+    parser.add_argument('--redownload', action='store_true',
+                        help='配合 --verify-library：损坏/丢失的直接重新下载，不用确认')
+    parser.add_argument('-q', '--quiet', action='store_true', help='不显示进度')
+    parser.add_argument('--daemon', action='store_true',
+                        help='作为常驻下载服务运行，在127.0.0.1上提供HTTP控制接口（Ctrl+C停止）')
+    parser.add_argument('--port', type=int, help='服务端口（默认用配置里的api_port）')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper,
+                        help='日志级别（默认用配置里的log_level）')
+    parser.add_argument('--metrics', action='store_true',
+                        help='采集运行指标，控制接口的 GET /metrics 给Prometheus抓（不改配置文件）')
+    parser.add_argument('--trace', type=float, metavar='RATE',
+                        help='抽RATE比例（0~1）的任务记下载时间线，结束后写到data/traces（Chrome Trace格式，用Perfetto看）')
+    parser.add_argument('--config', metavar='PATH', help='配置文件路径')
+    parser.add_argument('--db', metavar='PATH', help='数据库路径（默认和图形界面共用）')
+    return parser
+
+
+class CliRunner:
+    """跑一批任务直到全部结束"""
+
+    def __init__(self, task_manager: 'TaskManager', quiet: bool = False):
+        self.task_manager = task_manager
+        self.quiet = quiet
+        self.watched = []  # 要等的任务ID（按添加顺序）
+        self._waiting = []  # 等着拿并发名额的续传任务
+        self._changed = threading.Event()
+        self._isatty = sys.stderr.isatty()
+        self._last_line_len = 0
+        self._library_done = threading.Event()
+
+        task_manager.set_task_added_callback(self._on_task_added)
+        task_manager.set_task_status_changed_callback(self._on_status_changed)
+        task_manager.set_library_callback(self._on_library_progress)
+
+    def _on_task_added(self, task_id: str):
+        """别的实例转发过来的任务也一起等（不然下完自己的就退出，把人家的任务暂停了）"""
+        if task_id not in self.watched:
+            self.watched.append(task_id)
+        self._changed.set()
+
+    def _on_status_changed(self, task_id: str, status: str, message: str):
+        """状态变化（引擎线程中调用）：非终端环境每次变化打一行，然后叫醒主循环"""
+        if task_id in self.watched and not self._isatty and not self.quiet:
+            task = self.task_manager.get_task(task_id)
+            name = task['filename'] if task else task_id
+            print(f"[{status}] {name} {message or ''}".rstrip(), file=sys.stderr, flush=True)
+        self._changed.set()
+
+    def add(self, url: str, save_dir: Optional[str], expected_hash: Optional[str], hash_type: str) -> bool:
+        """添加一个新任务"""
+        task_id = self.task_manager.add_task(url, save_path=save_dir,
+                                             expected_hash=expected_hash, hash_type=hash_type)
+        if not task_id:
+            print(f"[错误] 添加任务失败: {url}", file=sys.stderr)
+            return False
+        if task_id not in self.watched:
+            self.watched.append(task_id)
+        return True
+
+    def resume_unfinished(self):
+        """把数据库里没完成的任务也排上"""
+        for task in reversed(self.task_manager.get_all_tasks()):
+            if task['status'] in RESUMABLE_STATUSES and task['task_id'] not in self.watched:
+                self.watched.append(task['task_id'])
+                if task['status'] not in ('probing', 'verifying'):  # 这两种引擎启动时自己接着做
+                    self._waiting.append(task['task_id'])
+        self._pump()
+
+    def _pump(self):
+        """有并发名额就启动等着的续传任务"""
+        while self._waiting:
+            task = self.task_manager.get_task(self._waiting[0])
+            if not task or task['status'] not in ('pending', 'paused', 'failed'):
+                self._waiting.pop(0)
+                continue
+            if not self.task_manager.start_task(task['task_id']):
+                break
+            self._waiting.pop(0)
+
+    def _unfinished(self) -> List[str]:
+        result = []
+        for task_id in self.watched:
+            task = self.task_manager.get_task(task_id)
+            if task and task['status'] not in FINAL_STATUSES:
+                result.append(task_id)
+        return result
+
+    def wait(self):
+        """阻塞到所有任务结束"""
+        while self._unfinished() or self._waiting:
+            self._changed.wait(PROGRESS_INTERVAL)
+            self._changed.clear()
+            self._pump()
+            self._render_progress()
+        self.clear_progress()
+
+    def _on_library_progress(self, summary):
+        """批量校验进度（校验线程中调用）"""
+        if not summary['running']:
+            self._library_done.set()
+        elif not self.quiet and self._isatty:
+            self._show_line(f"[校验] {summary['checked']}/{summary['total']} | 损坏 {summary['corrupt']} "
+                            f"| 丢失 {summary['missing']}")
+
+    def verify_library(self, rehash: bool) -> List[str]:
+        """批量校验下载库，阻塞到查完；返回损坏/丢失的任务ID"""
+        self._library_done.clear()
+        if not self.task_manager.verify_library(rehash=rehash):
+            print("[错误] 批量校验已经在进行中", file=sys.stderr)
+            return []
+        while not self._library_done.wait(PROGRESS_INTERVAL):
+            if not self.task_manager.is_library_running():
+                break  # 没收到最后那次进度回调也别干等（比如校验队列被关了）
+        self.clear_progress()
+
+        report = self.task_manager.get_library_report()
+        print(f"[校验] 共{report['total']}个：完好 {report['ok']}，损坏 {report['corrupt']}，丢失 {report['missing']}，"
+              f"无基准 {report['unverified']}，出错 {report['error']}", file=sys.stderr)
+        for label, key in (('损坏', 'corrupt_ids'), ('丢失', 'missing_ids')):
+            for task_id in report[key]:
+                task = self.task_manager.get_task(task_id)
+                print(f"[{label}] {task['save_path'] if task else task_id}", file=sys.stderr)
+        return report['corrupt_ids'] + report['missing_ids']
+
+    def redownload(self, task_ids: List[str]) -> int:
+        """重新下载（探测完在状态回调里排队启动）"""
+        for task_id in task_ids:
+            if task_id not in self.watched:
+                self.watched.append(task_id)
+        return self.task_manager.redownload_tasks(task_ids)
+
+    def _render_progress(self):
+        """终端里用一行原地刷新的紧凑进度"""
+        if self.quiet or not self._isatty:
+            return
+        done = failed = active = verifying = 0
+        downloaded = total = 0
+        speed = 0.0
+        for task_id in self.watched:
+            task = self.task_manager.get_task(task_id)
+            if not task:
+                continue
+            status = task['status']
+            if status == 'completed':
+                done += 1
+            elif status in FINAL_STATUSES:
+                failed += 1
+            elif status == 'downloading':
+                active += 1
+                speed += task['speed'] or 0
+            elif status == 'verifying':
+                verifying += 1
+            downloaded += task['downloaded_size'] or 0
+            total += task['total_size'] or 0
+        percent = downloaded / total * 100 if total else 0.0
+        line = (f"[{done}/{len(self.watched)}] 下载中 {active} | {percent:.1f}% "
+                f"({format_size(downloaded)}/{format_size(total)}) | {format_speed(speed)}")
+        if verifying:
+            line += f" | 校验中 {verifying}"
+        if failed:
+            line += f" | 失败 {failed}"
+        self._show_line(line)
+
+    def _show_line(self, line: str):
+        """原地刷新一行"""
+        padding = max(0, self._last_line_len - len(line))
+        sys.stderr.write('\r' + line + ' ' * padding)
+        sys.stderr.flush()
+        self._last_line_len = len(line)
+
+    def clear_progress(self):
+        if self._last_line_len:
+            sys.stderr.write('\r' + ' ' * self._last_line_len + '\r')
+            sys.stderr.flush()
+            self._last_line_len = 0
+
+    def report(self, out) -> int:
+        """输出结果并返回退出码"""
+        exit_code = EXIT_OK
+        for task_id in self.watched:
+            task = self.task_manager.get_task(task_id)
+            if task and task['status'] == 'completed':
+                print(task['save_path'], file=out, flush=True)
+            else:
+                exit_code = EXIT_FAILED
+                reason = (task['error_message'] or task['status']) if task else '任务不存在'
+                name = task['url'] if task else task_id
+                print(f"[失败] {name}: {reason}", file=sys.stderr)
+        return exit_code
+
+    def stop(self):
+        """退出前把还在下的任务暂停（不是取消），下次 --resume 能接着下；排队的任务留着不动"""
+        self.task_manager.shutdown()
+
+
+def _confirm(prompt: str) -> bool:
+    """终端里问一句，不是终端（管道/CI）一律当没同意"""
+    if not sys.stdin.isatty():
+        return False
+    try:
+        return input(f"{prompt} [y/N] ").strip().lower() in ('y', 'yes')
+    except EOFError:
+        return False
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def run_daemon(task_manager: 'TaskManager', port: int) -> int:
+    """常驻服务模式：跑HTTP接口直到Ctrl+C/SIGTERM"""
+    from downloader.service.api_server import ApiServer
+
+    try:
+        server = ApiServer(task_manager, port=port)
+    except OSError as e:
+        print(f"[错误] 服务端口{port}启动失败（是不是已经有服务在跑了？）: {e}", file=sys.stderr)
+        task_manager.shutdown()
+        return EXIT_FAILED
+
+    # SIGTERM 也走和Ctrl+C一样的收尾（shutdown暂停在下的任务、排队的不动，下次接着下）
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    print(f"[服务] 下载服务已启动: {server.address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[服务] 正在停止...", file=sys.stderr)
+    finally:
+        server.stop()
+        task_manager.shutdown()
+    return EXIT_OK
+
+
+def forward_to_instance(args, entries, port: int) -> int:
+    """已有实例持有锁：把URL转发给它，打印任务ID"""
+    if args.daemon:
+        print("[错误] 这个数据库已经有实例在运行了", file=sys.stderr)
+        return EXIT_FAILED
+
+    client, info = wait_for_instance(port)
+    if client is None:
+        print("[错误] 已经有一个实例在运行，但连不上它的控制接口", file=sys.stderr)
+        return EXIT_FAILED
+
+    if args.threads is not None or args.concurrent is not None or args.speed_limit is not None \
+            or args.max_connections_per_host is not None:
+        print("[提示] 任务交给已运行的实例处理，线程/并发/限速参数以它的配置为准", file=sys.stderr)
+
+    exit_code = EXIT_OK
+    if entries:
+        entries = [(url, expected_hash or args.expected_hash) for url, expected_hash in entries]
+        task_ids = forward_urls(client, entries, save_path=args.output_dir, hash_type=args.hash_type)
+        for task_id in task_ids:
+            if task_id:
+                print(task_id, flush=True)
+            else:
+                exit_code = EXIT_FAILED
+    if args.resume:
+        try:
+            client.request('POST', 'tasks/resume_all')
+        except Exception as e:
+            print(f"[错误] 继续任务失败: {e}", file=sys.stderr)
+            exit_code = EXIT_FAILED
+    if args.verify_library:
+        try:
+            client.request('POST', 'library/verify', body={'rehash': args.rehash})
+            print("[转发] 批量校验在已运行的实例里进行，结果用 GET /api/library 查看", file=sys.stderr)
+        except Exception as e:
+            print(f"[错误] 批量校验启动失败: {e}", file=sys.stderr)
+            exit_code = EXIT_FAILED
+
+    print(f"[转发] 任务已交给正在运行的实例（{info.get('mode')}, pid={info.get('pid')}）", file=sys.stderr)
+    return exit_code
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行主函数，返回退出码"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    entries = [(url, None) for url in args.urls]
+    try:
+        for path in args.input_file:
+            entries.extend(read_url_file(path))
+    except OSError as e:
+        parser.print_usage(sys.stderr)
+        print(f"[错误] 读取URL列表失败: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if not entries and not args.resume and not args.daemon and not args.verify_library:
+        parser.print_usage(sys.stderr)
+        print("[错误] 没有要下载的URL（或者加 --resume 接着下没完成的任务）", file=sys.stderr)
+        return EXIT_USAGE
+    if args.expected_hash and len(entries) != 1:
+        print("[错误] --hash 只能配合单个URL使用", file=sys.stderr)
+        return EXIT_USAGE
+
+    # 单实例：同一个数据库已经有实例在跑就转发给它
+    config_manager = ConfigManager(args.config)
+    port = args.port or config_manager.api_port
+    db_path = args.db or os.path.join(get_app_root(), "data", "downloads.db")
+    lock = InstanceLock(db_path)
+    if not lock.acquire():
+        return forward_to_instance(args, entries, port)
+
+    try:
+        return _run_local(args, entries, config_manager, db_path, port)
+    finally:
+        lock.release()
+
+
+def _run_local(args, entries, config_manager: ConfigManager, db_path: str, port: int) -> int:
+    """本进程持有锁：自己跑引擎"""
+    from downloader.database.db_manager import DatabaseManager
+    from downloader.core.download_engine import DownloadEngine
+    from downloader.core.task_manager import TaskManager
+    from downloader.utils.log import setup_logging
+
+    # 日志走标准错误，同时写到数据库旁边的logs目录（JSON Lines）
+    setup_logging(args.log_level or config_manager.log_level, os.path.join(os.path.dirname(db_path) or '.', "logs"))
+
+    # 标准输出只留给结果，引擎的日志统统赶到标准错误
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.threads is not None:
+            config_manager.thread_count = args.threads
+        if args.chunk_size is not None:
+            config_manager.chunk_size = args.chunk_size
+        if args.speed_limit is not None:
+            config_manager.speed_limit = args.speed_limit
+        if args.max_connections_per_host is not None:
+            config_manager.set("max_connections_per_host", max(1, args.max_connections_per_host))
+        if args.metrics:
+            config_manager.metrics_enabled = True
+        if args.trace is not None:
+            config_manager.trace_sample_rate = args.trace
+
+        db_manager = DatabaseManager(db_path)
+        download_engine = DownloadEngine(db_manager, config_manager)
+        max_concurrent = args.concurrent if args.concurrent is not None else config_manager.max_concurrent_downloads
+        task_manager = TaskManager(download_engine, db_manager, max(1, min(5, max_concurrent)))
+
+        if args.daemon:
+            for url, expected_hash in entries:
+                task_manager.add_task(url, save_path=args.output_dir,
+                                      expected_hash=expected_hash or args.expected_hash, hash_type=args.hash_type)
+            return run_daemon(task_manager, port)
+
+        runner = CliRunner(task_manager, quiet=args.quiet)
+
+        # 批量下载期间也开着控制接口：再来的命令行/界面把任务交给这里，别另起引擎抢数据库
+        from downloader.service.api_server import ApiServer
+        server = None
+        try:
+            server = ApiServer(task_manager, port=port, mode=MODE_CLI)
+            server.start()
+        except OSError as e:
+            print(f"[警告] 控制接口启动失败（端口{port}被占用？）: {e}", file=sys.stderr)
+
+        unresolved = False  # 批量校验查出坏文件但没重下
+        try:
+            if args.verify_library:
+                bad = runner.verify_library(args.rehash)
+                if bad and (args.redownload or _confirm(f"重新下载这{len(bad)}个文件？")):
+                    runner.redownload(bad)
+                else:
+                    unresolved = bool(bad)
+            for url, expected_hash in entries:
+                runner.add(url, args.output_dir, expected_hash or args.expected_hash, args.hash_type)
+            if args.resume:
+                runner.resume_unfinished()
+            runner.wait()
+        except KeyboardInterrupt:
+            runner.clear_progress()
+            print("\n[中断] 任务已暂停，下次加 --resume 接着下", file=sys.stderr)
+            return EXIT_INTERRUPTED
+        finally:
+            if server:
+                server.stop()
+            runner.stop()
+
+        exit_code = runner.report(out)
+        return EXIT_FAILED if unresolved else exit_code
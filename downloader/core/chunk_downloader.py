@@ -3,10 +3,134 @@
 分块下载器
 老王说：这玩意儿是核心中的核心，写不好整个下载器都白搭！
 """
+import logging
 import os
-import requests
+import random
+import threading
 import time
+from email.utils import parsedate_to_datetime
 from typing import Callable, Optional
+from downloader.core.host_governor import (
+    HostGovernor, get_host_key, OUTCOME_SUCCESS, OUTCOME_THROTTLED, OUTCOME_ERROR, OUTCOME_IGNORED
+)
+from downloader.utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# 可以重试的HTTP状态码（超时/限流/服务端临时故障），其他4xx一律算永久错误
+TRANSIENT_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+# 退避参数：第n次重试最多等 min(上限, 基数 * 2^n) 秒，再乘个随机抖动
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+# Retry-After最多听它等这么久，防止服务器让你等一天
+RETRY_AFTER_CAP = 300.0
+
+# 追踪时间线上单独画出来的门槛（秒）：短于这个的只算进“接收数据”的汇总里，不然事件多到没法看
+TRACE_LIMITER_WAIT = 0.1
+TRACE_WRITE_STALL = 0.05
+
+# 指标（没开metrics_enabled时都是空操作）
+BYTES_RECEIVED = metrics.Counter('downloader_bytes_received_total', '收到并写进临时文件的字节数', ['host'])
+ACTIVE_CONNECTIONS = metrics.Gauge('downloader_active_connections', '正在进行的分块下载连接数', ['host'])
+REQUESTS = metrics.Counter('downloader_requests_total', '分块下载请求数（按响应状态码）', ['host', 'code'])
+REQUEST_TTFB = metrics.Histogram('downloader_request_ttfb_seconds', '分块请求的首字节延迟（发请求到响应头到达）', ['host'])
+CHUNK_RETRIES = metrics.Counter('downloader_chunk_retries_total', '分块重试次数（按原因）', ['cause'])
+CHUNK_FAILURES = metrics.Counter('downloader_chunk_failures_total', '分块最终失败次数（按原因）', ['cause'])
+LIMITER_WAIT = metrics.Counter('downloader_limiter_wait_seconds_total',
+                               '被限速/主机限流挡住的等待秒数（speed_limit=令牌桶，host_governor=熔断/并发名额推迟）',
+                               ['limiter'])
+
+
+_local = threading.local()
+
+
+def _get_session():
+    """
+    当前下载线程的requests会话
+    老王说：分片下完一片就要发下一个请求，每次新建连接光TLS握手就得几个来回，连接池复用上！
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        import requests
+        session = _local.session = requests.Session()
+    return session
+
+
+class ChunkDownloadError(Exception):
+    """
+    分块下载错误
+    Args:
+        message: 错误描述
+        transient: 是否是临时错误（值得重试）
+        status_code: HTTP状态码（非HTTP错误为None）
+        retry_after: 服务器要求的等待秒数（Retry-After）
+    """
+
+    def __init__(self, message: str, transient: bool = True,
+                 status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.transient = transient
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After响应头（秒数或HTTP日期）
+    Returns:
+        需要等待的秒数，解析不了返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient_error(error: Exception) -> bool:
+    """判断异常是否值得重试（网络抖动算，404/磁盘写满不算）"""
+    if isinstance(error, ChunkDownloadError):
+        return error.transient
+    import requests  # requests导入要100ms+，启动时用不着，第一次下载时才加载
+    if isinstance(error, (requests.ConnectionError, requests.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    # 文件写入失败之类的本地错误，重试也没用
+    return False
+
+
+def error_cause(error: Exception) -> str:
+    """把失败原因归成有限的几类（指标标签用）"""
+    if isinstance(error, ChunkDownloadError):
+        return f"http_{error.status_code}" if error.status_code is not None else 'interrupted'
+    import requests
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.exceptions.ChunkedEncodingError):
+        return 'chunked_encoding'
+    if isinstance(error, OSError):
+        return 'io'  # 写临时文件失败之类
+    return 'other'
+
+
+def compute_backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    计算重试等待时间（指数退避 + 全抖动）
+    Args:
+        attempt: 第几次重试（从0开始）
+        retry_after: 服务器给的Retry-After秒数
+    """
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RETRY_AFTER_CAP))
+    return delay
 
 
 class SpeedLimiter:
@@ -33,9 +157,11 @@ class SpeedLimiter:
         获取令牌（会阻塞直到有足够令牌）
         Args:
             bytes_count: 需要的字节数
+        Returns:
+            实际等待的秒数
         """
         if self.bytes_per_second <= 0:
-            return  # 不限速，直接返回
+            return 0.0  # 不限速，直接返回
 
         now = time.time()
         elapsed = now - self._last_time
@@ -51,8 +177,9 @@ class SpeedLimiter:
             wait_time = (bytes_count - self._tokens) / self.bytes_per_second
             time.sleep(wait_time)
             self._tokens = 0
-        else:
-            self._tokens -= bytes_count
+            return wait_time
+        self._tokens -= bytes_count
+        return 0.0
 
 
 class ChunkDownloader:
@@ -63,7 +190,9 @@ class ChunkDownloader:
                  timeout: int = 30, retry_times: int = 3,
                  user_agent: str = "PyDownloader/1.0",
                  speed_limit: int = 0,
-                 proxies: dict = None):
+                 proxies: dict = None,
+                 governor: Optional[HostGovernor] = None,
+                 shared_file: bool = False):
         """
         初始化分块下载器
         Args:
@@ -78,6 +207,9 @@ class ChunkDownloader:
             user_agent: User-Agent
             speed_limit: 速度限制（字节/秒），0表示不限速
             proxies: 代理配置，格式 {"http": "...", "https": "..."} 或 None
+            governor: 主机熔断/并发控制器（多个下载器共享），None表示不控制
+            shared_file: temp_file是整个任务共用的预分配文件（分片下载），按start_byte定位写入；
+                         False表示这个分块独占temp_file，从头写
         """
         self.chunk_id = chunk_id
         self.task_id = task_id
@@ -89,16 +221,31 @@ class ChunkDownloader:
         self.retry_times = retry_times
         self.user_agent = user_agent
         self.proxies = proxies  # 代理配置
+        self.governor = governor
+        self.shared_file = shared_file
+        self.host = get_host_key(url)
 
         self.downloaded_bytes = 0  # 已下载字节数
         self.is_paused = False  # 暂停标志
         self.is_cancelled = False  # 取消标志
+        self.status = 'pending'  # 结束状态：completed/paused/cancelled/failed/deferred
+        self.last_error: Optional[str] = None  # 最后一次失败原因
+        self.defer_delay = 0.0  # deferred时建议多久后重新排队（秒）
+        self._attempt = 0  # 当前失败次数（推迟后继续时保留）
+        self._last_latency: Optional[float] = None
+        self.range_ok: Optional[bool] = None  # 服务器对Range的实际反应（206为True，无视Range为False）
+        self._trace: Optional[tracing.TaskTrace] = None  # 这个任务被抽中追踪时才有
+        self.trace_tid = chunk_id + 1  # 时间线上画在第几行（第0行留给任务本身）
+        self.trace_name = f"分块{chunk_id}"
+        self._wake_event = threading.Event()  # 暂停/取消时打断重试等待
 
         # 速度限制器
         self.speed_limiter = SpeedLimiter(speed_limit)
 
         # 进度回调函数
         self.progress_callback: Optional[Callable] = None
+        # 重试回调函数
+        self.retry_callback: Optional[Callable] = None
 
     def set_progress_callback(self, callback: Callable):
         """
@@ -108,44 +255,157 @@ class ChunkDownloader:
         """
         self.progress_callback = callback
 
+    def set_retry_callback(self, callback: Callable):
+        """
+        设置重试回调函数
+        Args:
+            callback: 回调函数，签名为 callback(chunk_id, attempt, error)
+        """
+        self.retry_callback = callback
+
     def download(self, resume: bool = False) -> bool:
         """
         执行下载
         Args:
             resume: 是否为断点续传
         Returns:
-            True表示成功，False表示失败
+            True表示成功，False表示失败/暂停/取消（具体看self.status）
+
+        老王说：暂停不是在循环里干等，而是记下断点、关掉连接、把线程还回去！
         """
         # 确保临时文件目录存在
         temp_dir = os.path.dirname(self.temp_file)
         if temp_dir and not os.path.exists(temp_dir):
             os.makedirs(temp_dir, exist_ok=True)
 
-        # 如果是断点续传，获取已下载字节数
-        if resume and os.path.exists(self.temp_file):
+        # 如果是断点续传，临时文件大小就是断点（共用的分片文件是预分配的，大小不算数，片总是从头下）
+        if resume and not self.shared_file and os.path.exists(self.temp_file):
             self.downloaded_bytes = os.path.getsize(self.temp_file)
         else:
             self.downloaded_bytes = 0
 
-        # 计算实际的起始位置
-        actual_start = self.start_byte + self.downloaded_bytes
-
         # 如果已经下载完成，直接返回
-        if actual_start >= self.end_byte:
+        if self.start_byte + self.downloaded_bytes > self.end_byte:
+            self.status = 'completed'
             return True
 
-        # 开始下载（带重试）
-        for attempt in range(self.retry_times):
+        self._attempt = 0
+        return self._run_attempts()
+
+    def continue_download(self) -> bool:
+        """
+        被推迟（deferred）的分块重新排上队后继续下载
+        内存里的downloaded_bytes就是断点，不用再读临时文件
+        """
+        self.status = 'pending'
+        return self._run_attempts()
+
+    def _run_attempts(self) -> bool:
+        """
+        带重试的下载循环
+        老王说：每次重试都从当前断点续，别把已经写进文件的字节再要一遍！
+        """
+        trace = self._trace = tracing.trace_for(self.task_id)
+        tid = self.trace_tid
+        if trace:
+            trace.name_thread(tid, self.trace_name)
+
+        while True:
+            if self._check_stopped():
+                return False
+
+            # 主机熔断中或者并发名额满了：别在这干等也别白烧重试次数，让引擎过会儿再排队
+            if self.governor:
+                defer_delay = self.governor.acquire(self.host)
+                if defer_delay is not None:
+                    self.status = 'deferred'
+                    self.defer_delay = defer_delay
+                    LIMITER_WAIT.labels('host_governor').inc(defer_delay)
+                    if trace:
+                        trace.instant('主机限流推迟', tid, 'governor', {'delay': round(defer_delay, 3)})
+                    return False
+
+            bytes_before = self.downloaded_bytes
+            outcome = OUTCOME_IGNORED
+            self._last_latency = None
+            attempt_start = tracing.now()
+            error = None
             try:
-                if self._download_chunk(actual_start):
+                if self._download_chunk(self.start_byte + self.downloaded_bytes):
+                    outcome = OUTCOME_SUCCESS
+                    self.status = 'completed'
                     return True
+                if self._check_stopped():
+                    return False
+                error = ChunkDownloadError("下载中断")
             except Exception as e:
-                print(f"[错误] 分块{self.chunk_id}下载失败（尝试{attempt + 1}/{self.retry_times}）: {e}")
-                if attempt < self.retry_times - 1:
-                    time.sleep(1)  # 重试前等待1秒
-                else:
+                outcome = self._classify_outcome(e)
+                if self._check_stopped():
                     return False
+                error = e
+            finally:
+                if self.governor:
+                    self.governor.release(self.host, outcome, self._last_latency)
+                if trace:
+                    args = {'start': self.start_byte + bytes_before, 'bytes': self.downloaded_bytes - bytes_before,
+                            'outcome': outcome}
+                    if error is not None:
+                        args['error'] = str(error)
+                    trace.add('下载', attempt_start, tracing.now(), tid, 'chunk', args)
+
+            self.last_error = str(error)
+            # 这次失败前有进展，说明连接是好的，只是中途断了，重新计数
+            if self.downloaded_bytes > bytes_before:
+                self._attempt = 0
+            self._attempt += 1
+            attempt = self._attempt
+            cause = error_cause(error)
+            fields = {'task_id': self.task_id, 'chunk_id': self.chunk_id, 'host': self.host, 'cause': cause}
+
+            if not is_transient_error(error):
+                logger.error("分块%s下载失败（不可重试）: %s", self.chunk_id, error, extra=fields)
+                CHUNK_FAILURES.labels(cause).inc()
+                break
+            if attempt >= self.retry_times:
+                logger.error("分块%s下载失败（尝试%s/%s）: %s", self.chunk_id, attempt, self.retry_times, error,
+                             extra=fields)
+                CHUNK_FAILURES.labels(cause).inc()
+                break
+
+            delay = compute_backoff(attempt - 1, getattr(error, 'retry_after', None))
+            logger.warning("分块%s第%s次失败: %s，%.1f秒后从断点重试", self.chunk_id, attempt, error, delay,
+                           extra=fields)
+            CHUNK_RETRIES.labels(cause).inc()
+            if self.retry_callback:
+                self.retry_callback(self.chunk_id, attempt, error)
+
+            # 可被暂停/取消打断的等待
+            backoff_start = tracing.now()
+            self._wake_event.wait(delay)
+            if trace:
+                trace.add('重试退避', backoff_start, tracing.now(), tid, 'retry',
+                          {'attempt': attempt, 'cause': cause, 'error': str(error)})
+
+        self.status = 'failed'
+        return False
 
+    @staticmethod
+    def _classify_outcome(error: Exception) -> str:
+        """把异常归类成主机健康统计用的结果"""
+        if isinstance(error, ChunkDownloadError) and error.status_code in (429, 503):
+            return OUTCOME_THROTTLED
+        if is_transient_error(error):
+            return OUTCOME_ERROR
+        return OUTCOME_IGNORED
+
+    def _check_stopped(self) -> bool:
+        """检查是否被暂停或取消，是的话记下结束状态"""
+        if self.is_cancelled:
+            self.status = 'cancelled'
+            return True
+        if self.is_paused:
+            self.status = 'paused'
+            return True
         return False
 
     def _download_chunk(self, start: int) -> bool:
@@ -154,67 +414,143 @@ class ChunkDownloader:
         Args:
             start: 实际起始字节
         Returns:
-            True表示成功，False表示失败
+            True表示成功，False表示失败（或被暂停/取消）
         """
         headers = {
             'Range': f'bytes={start}-{self.end_byte}',
             'User-Agent': self.user_agent
         }
 
-        # 发起请求
-        response = requests.get(
-            self.url,
-            headers=headers,
-            stream=True,
-            timeout=self.timeout,
-            proxies=self.proxies  # 代理支持
-        )
-
-        # 检查状态码（206是部分内容，200是完整内容）
-        if response.status_code not in (200, 206):
-            print(f"[错误] 分块{self.chunk_id}请求失败: HTTP {response.status_code}")
-            return False
-
-        # 打开临时文件（追加模式）
-        mode = 'ab' if self.downloaded_bytes > 0 else 'wb'
-        with open(self.temp_file, mode) as f:
-            for data in response.iter_content(chunk_size=8192):
-                # 检查取消标志
-                if self.is_cancelled:
-                    return False
-
-                # 检查暂停标志
-                while self.is_paused:
-                    time.sleep(0.1)
-                    if self.is_cancelled:
-                        return False
-
-                # 写入数据
-                if data:
-                    # 限速：在写入前获取令牌
-                    self.speed_limiter.acquire(len(data))
-
-                    f.write(data)
-                    self.downloaded_bytes += len(data)
-
-                    # 调用进度回调
-                    if self.progress_callback:
-                        self.progress_callback(self.chunk_id, self.downloaded_bytes)
-
+        trace = self._trace
+        tid = self.trace_tid
+
+        # 发起请求（with保证不管怎么退出都会关闭连接；读完的连接回到本线程的连接池）
+        session = _get_session()
+        active_connections = ACTIVE_CONNECTIONS.labels(self.host)
+        active_connections.inc()
+        request_start = tracing.now()
+        try:
+            with session.get(
+                self.url,
+                headers=headers,
+                stream=True,
+                timeout=self.timeout,
+                proxies=self.proxies  # 代理支持
+            ) as response:
+                self._last_latency = tracing.now() - request_start  # 首字节延迟（响应头到达）
+                REQUEST_TTFB.labels(self.host).observe(self._last_latency)
+                REQUESTS.labels(self.host, response.status_code).inc()
+                if trace:
+                    # requests拿不到DNS/建连/TLS各自的时间，连接池复用时这段就只有首字节
+                    trace.add('请求→首字节', request_start, request_start + self._last_latency, tid, 'net',
+                              {'status': response.status_code})
+
+                # 检查状态码（206是部分内容，200是完整内容）
+                if response.status_code not in (200, 206):
+                    raise ChunkDownloadError(
+                        f"HTTP {response.status_code}",
+                        transient=response.status_code in TRANSIENT_STATUS_CODES,
+                        status_code=response.status_code,
+                        retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                    )
+
+                if response.status_code == 206:
+                    self.range_ok = True
+                # 分片只要文件的一段，回了完整内容：第0片从头的可以照写（后面多的不要），别的片没法用
+                # （引擎看到range_ok=False会把任务改成单线程从头下）
+                if response.status_code == 200 and self.shared_file:
+                    self.range_ok = False
+                    if start > 0:
+                        raise ChunkDownloadError("服务器不支持Range，无法分片下载", transient=False, status_code=200)
+                # 服务器无视Range返回了完整内容：从0开始的分块可以重头写，否则没法续
+                # （从0开始要整个文件时回200是合规的，那种不能算不支持）
+                if response.status_code == 200 and start > 0:
+                    self.range_ok = False
+                    if self.start_byte != 0:
+                        raise ChunkDownloadError("服务器不支持Range，无法续传", transient=False, status_code=200)
+                    self.downloaded_bytes = 0
+
+                bytes_received = BYTES_RECEIVED.labels(self.host)
+                limiter_wait = LIMITER_WAIT.labels('speed_limit')
+
+                body_start = tracing.now()
+                body_bytes = self.downloaded_bytes
+                throttled = 0.0
+                try:
+                    # 打开临时文件：共用的分片文件定位到断点写，独占的分块文件追加
+                    # 共用文件不带缓冲：续传断点就是downloaded_bytes，不能有字节还压在Python缓冲里
+                    # （文件是truncate预占的，没真写进去的地方是0，续传会直接跳过去）
+                    if self.shared_file:
+                        f = open(self.temp_file, 'r+b', buffering=0)
+                        f.seek(start)
+                    else:
+                        f = open(self.temp_file, 'ab' if self.downloaded_bytes > 0 else 'wb')
+                    with f:
+                        for data in response.iter_content(chunk_size=8192):
+                            # 暂停/取消：直接退出，断点就是已写入的字节数
+                            if self.is_paused or self.is_cancelled:
+                                return False
+
+                            # 写入数据（服务器多给的不要，共用文件里后面是别的片）
+                            remaining = self.end_byte - self.start_byte + 1 - self.downloaded_bytes
+                            if remaining <= 0:
+                                break  # 这一段已经够了（回的是整个文件时后面的别再收）
+                            if len(data) > remaining:
+                                data = data[:remaining]
+                            if data:
+                                # 限速：在写入前获取令牌
+                                waited = self.speed_limiter.acquire(len(data))
+                                if waited:
+                                    limiter_wait.inc(waited)
+                                    throttled += waited
+                                    if trace and waited >= TRACE_LIMITER_WAIT:
+                                        end = tracing.now()
+                                        trace.add('限速等待', end - waited, end, tid, 'limiter')
+
+                                write_start = tracing.now() if trace else 0.0
+                                written = f.write(data)
+                                while written < len(data):  # 不带缓冲的write可能只写了一部分
+                                    written += f.write(memoryview(data)[written:])
+                                if trace:
+                                    write_end = tracing.now()
+                                    if write_end - write_start >= TRACE_WRITE_STALL:
+                                        trace.add('写盘阻塞', write_start, write_end, tid, 'disk', {'bytes': len(data)})
+                                self.downloaded_bytes += len(data)
+                                bytes_received.inc(len(data))
+
+                                # 调用进度回调
+                                if self.progress_callback:
+                                    self.progress_callback(self.chunk_id, self.downloaded_bytes)
+                finally:
+                    if trace:
+                        trace.add('接收数据', body_start, tracing.now(), tid, 'net',
+                                  {'bytes': self.downloaded_bytes - body_bytes, 'limiter_wait': round(throttled, 3)})
+        finally:
+            active_connections.dec()
+            session.cookies.clear()  # 线程是各任务共用的，cookie别带到下一个请求里
+
+        # 连接提前结束但没报错：数据不够，按临时错误处理（下次从断点续）
+        if self.start_byte + self.downloaded_bytes <= self.end_byte:
+            raise ChunkDownloadError(
+                f"连接提前结束（还差{self.end_byte - self.start_byte - self.downloaded_bytes + 1}字节）"
+            )
         return True
 
     def pause(self):
-        """暂停下载"""
+        """暂停下载（下载线程会在下一个数据块处关闭连接并退出）"""
         self.is_paused = True
+        self._wake_event.set()
 
     def resume(self):
-        """继续下载"""
+        """清除暂停标志（已退出的下载器需要重新调用download(resume=True)）"""
         self.is_paused = False
+        self._wake_event.clear()
 
     def cancel(self):
         """取消下载"""
         self.is_cancelled = True
         self.is_paused = False  # 取消暂停状态，让线程退出
+        self._wake_event.set()
 
     def get_progress(self) -> float:
         """
@@ -3,16 +3,91 @@
 下载引擎
 老王说：这是整个下载器的大脑，得写得聪明点！
 """
+import logging
 import os
 import uuid
 import time
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import calendar
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Callable
 from downloader.core.chunk_downloader import ChunkDownloader
+from downloader.core.supervisor import Supervisor
+from downloader.core.host_governor import HostGovernor, get_host_key
+from downloader.core.host_profiles import HostProfiles
+from downloader.core.pieces import PieceMap, choose_piece_size
+from downloader.core.verifier import VerifyQueue
+from downloader.core.hash_cache import HashCache
 from downloader.database.db_manager import DatabaseManager
-from downloader.utils.config import ConfigManager
-from downloader.utils.file_utils import merge_chunks, get_filename_from_url, ensure_dir, calculate_file_hash
+from downloader.database.task_store import TaskStore
+from downloader.utils.config import ConfigManager, get_app_root
+from downloader.utils import metrics, tracing
+from downloader.utils.file_utils import merge_chunks, get_filename_from_url, ensure_dir, get_cached_hash, set_hash_cache
+
+logger = logging.getLogger(__name__)
+
+
+# 共享下载线程池上限：线程数上限(16) × 同时下载任务数上限(5)
+MAX_WORKERS = 16 * 5
+
+# 大文件的合并/校验动辄几十秒，分桶往上放宽
+_LONG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+PROBE_SECONDS = metrics.Histogram('downloader_probe_seconds', '探测文件信息（HEAD）耗时', ['result'])
+MERGE_SECONDS = metrics.Histogram('downloader_merge_seconds', '合并分块耗时', ['result'], buckets=_LONG_BUCKETS)
+VERIFY_SECONDS = metrics.Histogram('downloader_verify_seconds', '计算文件哈希耗时', ['hash_type'], buckets=_LONG_BUCKETS)
+VERIFY_QUEUE = metrics.Gauge('downloader_verify_queue', '排队中和正在计算哈希的文件数')
+
+
+def _sync_file(path: str, task_id: str) -> bool:
+    """把文件已写入的内容刷到盘上（分片文件是预先占好空间的，只刷数据就够）"""
+    try:
+        fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    except OSError as e:
+        logger.warning("刷盘失败: %s: %s", path, e, extra={'task_id': task_id})
+        return False
+    try:
+        getattr(os, 'fdatasync', os.fsync)(fd)
+        return True
+    except OSError as e:
+        logger.warning("刷盘失败: %s: %s", path, e, extra={'task_id': task_id})
+        return False
+    finally:
+        os.close(fd)
+
+
+class _TaskRun:
+    """
+    一次正在进行的下载（一个任务从开始到全部分块退出）
+    老王说：只在调度线程里改它，别的线程只读，省得到处加锁！
+    """
+
+    def __init__(self, task: dict, downloaders: list, base_downloaded: int, single: bool):
+        self.task = task
+        self.task_id = task['task_id']
+        self.downloaders = downloaders
+        self.pending = len(downloaders)  # 还没退出的分块数
+        self.deferred = set()  # 被推迟、等着重新排队的分块
+        self.base_downloaded = base_downloaded  # 之前已完成分块的字节数（续传时不在downloaders里）
+        self.single = single  # 单线程任务（完成后直接改名，不用合并）
+        self.last_downloaded = 0  # 上一个tick的已下载量，用来算速度
+        self.started = time.monotonic()
+        self.resumed = False  # 续传的这次不拿来学线程数（分块数不是完整的）
+        self.thread_count = len(downloaders)  # 这次开的连接数（分片下载时是同时在下的片数上限）
+        # 分片下载才有：downloaders里只放正在下的片，下完的从里面拿掉、字节数并进base_downloaded
+        self.pieces: Optional[PieceMap] = None
+        self.pieces_file = ''  # 整个任务共用的临时文件
+        self.piece_cursor = 0  # 派片游标：前面没下完的片要么在下、要么在retry_pieces里
+        self.retry_pieces: deque = deque()  # 派出去又没下完退回来的片（先派它们）
+        self.free_slots: list = []  # 空出来的连接编号（时间线上一个连接一行）
+        self.partial = {}  # 下了一半、还没派出去的片 {片序号: 已下字节数}（字节数也算在base_downloaded里）
+        self.exit_statuses = set()  # 没下完就退出的片的状态（paused/cancelled/failed）
+        self.last_error: Optional[str] = None  # 最后一个失败的片的错误
+        self.range_seen = set()  # 退出的片对Range的实际反应
+        self.synced_size = -1  # 上次刷盘时的已下载量（没变就不用再fsync）
+
+    def downloaded_size(self) -> int:
+        """当前已下载总量（纯内存计算，不查库）"""
+        return self.base_downloaded + sum(d.downloaded_bytes for d in self.downloaders)
 
 
 class DownloadEngine:
@@ -27,8 +102,28 @@ class DownloadEngine:
         """
         self.db = db_manager
         self.config = config_manager
+        if self.config.metrics_enabled:
+            metrics.enable()  # 要在建TaskStore之前开
+        tracing.configure(self.config.trace_sample_rate, os.path.join(get_app_root(), "data", "traces"))
+        self.tasks = TaskStore(db_manager)  # 任务记录走内存缓存，写穿透到数据库
         self.active_downloaders = {}  # {task_id: [ChunkDownloader, ...]}
-        self.thread_pools = {}  # {task_id: ThreadPoolExecutor}
+        self._runs = {}  # {task_id: _TaskRun}
+        self._resume_requested = set()  # 暂停后线程还没退干净就被要求继续的任务
+
+        # 所有任务共用一个下载线程池 + 一个调度线程，线程数不随任务数增长
+        self._worker_pool: Optional[ThreadPoolExecutor] = None
+        self.supervisor = Supervisor(tick_interval=1.0)
+        self.supervisor.set_tick_callback(self._on_tick, lambda: bool(self._runs))
+
+        # 主机熔断/并发控制，所有任务共享
+        self.governor = HostGovernor(max_connections_per_host=self.config.max_connections_per_host)
+        # 主机画像：下过的主机直接按上次学到的定线程数/分块大小
+        self.profiles = HostProfiles(db_manager)
+        # 哈希缓存：文件没变过就不重读（所有算哈希的地方都先查它）
+        set_hash_cache(HashCache(db_manager))
+        # 校验队列：按存储设备排队算哈希，不占下载线程
+        self.verifier = VerifyQueue(self.config.verify_workers_per_device)
+        VERIFY_QUEUE.set_function(self.verifier.pending_count)
 
         # 回调函数
         self.progress_callback: Optional[Callable] = None
@@ -58,8 +153,19 @@ class DownloadEngine:
         Returns:
             (是否支持Range, 文件大小)
         """
+        support_range, total_size, _, _ = self._head(url)
+        return support_range, total_size
+
+    def _head(self, url: str) -> tuple[bool, int, str, Optional[float]]:
+        """
+        HEAD探测
+        Returns:
+            (响应头说支不支持Range, 文件大小, 跳转后的最终URL, 首字节延迟)，失败时大小为0
+        """
+        import requests  # 延迟导入：requests很重，启动时不加载，第一次探测时才导入
         try:
             headers = {'User-Agent': self.config.user_agent}
+            start = time.monotonic()
             response = requests.head(
                 url,
                 headers=headers,
@@ -67,6 +173,7 @@ class DownloadEngine:
                 allow_redirects=True,
                 proxies=self.config.proxies  # 代理支持
             )
+            latency = time.monotonic() - start  # HEAD没有响应体，总耗时就是首字节延迟（含跳转）
 
             # 获取文件大小
             total_size = int(response.headers.get('Content-Length', 0))
@@ -75,23 +182,44 @@ class DownloadEngine:
             accept_ranges = response.headers.get('Accept-Ranges', '')
             support_range = accept_ranges == 'bytes'
 
-            return support_range, total_size
+            return support_range, total_size, response.url, latency
         except Exception as e:
-            print(f"[错误] 检查URL失败: {e}")
-            return False, 0
+            logger.error("检查URL失败: %s: %s", url, e)
+            return False, 0, url, None
 
     def create_download_task(self, url: str, filename: Optional[str] = None,
                             save_path: Optional[str] = None,
                             expected_hash: Optional[str] = None,
                             hash_type: str = "md5") -> Optional[str]:
         """
-        创建下载任务
+        创建下载任务（同步：探测完文件信息才返回）
         Args:
             url: 下载链接
             filename: 文件名（可选，不提供则从URL提取）
             save_path: 保存路径（可选，不提供则使用默认下载目录）
             expected_hash: 预期哈希值（可选，用于下载后校验）
-            hash_type: 哈希类型（md5/sha256）
+            hash_type: 哈希类型（md5/sha1/sha256/sha512/blake2b/blake3/crc32）
+        Returns:
+            任务ID，失败返回None
+        """
+        task_id = self.create_probing_task(url, filename, save_path, expected_hash, hash_type)
+        if not task_id:
+            return None
+
+        if not self.probe_task(task_id):
+            # 同步调用的老规矩：失败就当没建过
+            self.tasks.delete_task(task_id)
+            return None
+
+        return task_id
+
+    def create_probing_task(self, url: str, filename: Optional[str] = None,
+                            save_path: Optional[str] = None,
+                            expected_hash: Optional[str] = None,
+                            hash_type: str = "md5") -> Optional[str]:
+        """
+        创建占位任务（状态probing，不发网络请求，立即返回）
+        老王说：HEAD一个半死不活的服务器能卡30秒，这种事别在界面线程上干！
         Returns:
             任务ID，失败返回None
         """
@@ -108,26 +236,16 @@ class DownloadEngine:
         else:
             save_path = os.path.join(save_path, filename)
 
-        # 检查URL支持情况
-        support_range, total_size = self.check_url_support_range(url)
-
-        if total_size == 0:
-            if self.status_callback:
-                self.status_callback(task_id, 'failed', '无法获取文件大小')
-            return None
-
-        # 确定线程数
-        thread_count = self.config.thread_count if support_range else 1
-
-        # 创建任务记录
-        success = self.db.create_task(
+        # 创建任务记录（大小、分块等探测完再填）
+        success = self.tasks.create_task(
             task_id=task_id,
             url=url,
             filename=filename,
             save_path=save_path,
-            total_size=total_size,
-            support_range=support_range,
-            thread_count=thread_count
+            total_size=0,
+            support_range=False,
+            thread_count=1,
+            status='probing'
         )
 
         if not success:
@@ -135,33 +253,71 @@ class DownloadEngine:
 
         # 如果提供了预期哈希值，保存到数据库
         if expected_hash:
-            self.db.set_expected_hash(task_id, expected_hash, hash_type)
-
-        # 如果支持分块，创建分块记录
-        if support_range and thread_count > 1:
-            self._create_chunks(task_id, url, total_size, thread_count)
+            self.tasks.set_expected_hash(task_id, expected_hash, hash_type)
 
         return task_id
 
-    def _create_chunks(self, task_id: str, url: str, total_size: int, thread_count: int):
+    def probe_task_async(self, task_id: str):
+        """在下载线程池里探测任务（结果通过状态回调通知：pending或failed）"""
+        self._get_worker_pool().submit(self.probe_task, task_id)
+
+    def probe_task(self, task_id: str) -> bool:
         """
-        创建分块记录
-        Args:
-            task_id: 任务ID
-            url: 下载链接
-            total_size: 文件总大小
-            thread_count: 线程数
+        探测占位任务的文件信息并规划分块，完成后转为pending
+        Returns:
+            True表示探测成功，False表示失败（任务转为failed）
         """
-        chunk_size = total_size // thread_count
-        chunks = []
+        task = self.tasks.get_task(task_id)
+        if not task or task['status'] != 'probing':
+            return False
+
+        # 检查URL支持情况
+        probe_start = tracing.now()
+        support_range, total_size, final_url, latency = self._head(task['url'])
+        probe_end = tracing.now()
+        PROBE_SECONDS.labels('ok' if total_size else 'failed').observe(probe_end - probe_start)
+        trace = tracing.trace_for(task_id)
+        if trace:
+            trace.add('探测', probe_start, probe_end, cat='probe',
+                      args={'total_size': total_size, 'support_range': support_range})
+
+        # 探测期间任务被取消/删除了，结果扔掉
+        task = self.tasks.get_task(task_id)
+        if not task or task['status'] != 'probing':
+            return False
 
-        for i in range(thread_count):
-            start_byte = i * chunk_size
-            end_byte = (i + 1) * chunk_size - 1 if i < thread_count - 1 else total_size - 1
-            temp_file = os.path.join(self.config.temp_dir, f"{task_id}.part{i}")
-            chunks.append((i, start_byte, end_byte, temp_file))
+        if total_size == 0:
+            self.tasks.update_task_status(task_id, 'failed', '无法获取文件大小')
+            if self.status_callback:
+                self.status_callback(task_id, 'failed', '无法获取文件大小')
+            return False
+
+        # 按主机画像定线程数（下过的主机：实测的Range支持、最好的线程数、被限流后的并发上限、分块别小过带宽时延积）
+        host = get_host_key(task['url'])
+        self.profiles.record_probe(host, get_host_key(final_url), latency)
+        support_range, thread_count = self.profiles.plan(host, task['url'], total_size, support_range,
+                                                          self.config.thread_count)
+        profile = self.profiles.get(host)
+        if profile and profile['connection_limit']:
+            self.governor.seed_limit(host, profile['connection_limit'])
+
+        # 支持分块就切成固定大小的片（分片大小配置和带宽时延积取大的），线程数不用多过片数
+        piece_size = 0
+        if support_range and thread_count > 1:
+            piece_size = choose_piece_size(total_size, self.config.chunk_size, self.profiles.min_chunk_size(host))
+            thread_count = min(thread_count, -(-total_size // piece_size))
 
-        self.db.create_chunks(task_id, chunks)
+        if not self.tasks.update_task_probe(task_id, total_size, support_range, thread_count):
+            return False
+
+        if support_range and thread_count > 1:
+            temp_file = os.path.join(self.config.temp_dir, f"{task_id}.part")
+            self.db.create_piece_map(task_id, piece_size, -(-total_size // piece_size), temp_file)
+
+        self.tasks.update_task_status(task_id, 'pending')
+        if self.status_callback:
+            self.status_callback(task_id, 'pending', '等待下载')
+        return True
 
     def start_download(self, task_id: str, resume: bool = False) -> bool:
         """
@@ -173,108 +329,95 @@ class DownloadEngine:
             True表示启动成功，False表示失败
         """
         # 获取任务信息
-        task = self.db.get_task(task_id)
+        task = self.tasks.get_task(task_id)
         if not task:
-            print(f"[错误] 任务不存在: {task_id}")
+            logger.error("任务不存在: %s", task_id)
             return False
 
         # 更新任务状态为downloading
-        self.db.update_task_status(task_id, 'downloading')
+        self.tasks.update_task_status(task_id, 'downloading')
         if self.status_callback:
             self.status_callback(task_id, 'downloading', '开始下载')
 
-        # 判断是否支持分块
+        # 判断是否支持分块（分片表里没记录的是升级前建的任务，还按老的分块续）
         if task['support_range'] and task['thread_count'] > 1:
+            piece_map = self.db.get_piece_map(task_id)
+            if piece_map:
+                # 建任务之后才学到这个目录无视Range（上次分片下载就栽在这）：别再分片了，重试多少次都一样
+                support_range, _ = self.profiles.plan(get_host_key(task['url']), task['url'], task['total_size'],
+                                                      True, task['thread_count'])
+                if support_range:
+                    return self._start_piece_download(task, piece_map, resume)
+                if not self._drop_piece_map(task, piece_map['temp_file']):
+                    return False
+                return self._start_singlethread_download(self.tasks.get_task(task_id), resume=False)
             return self._start_multithread_download(task, resume)
         else:
             return self._start_singlethread_download(task, resume)
 
+    def _get_worker_pool(self) -> ThreadPoolExecutor:
+        """获取共享下载线程池（用到时才创建）"""
+        if self._worker_pool is None:
+            self._worker_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="download-worker")
+        return self._worker_pool
+
+    def _create_downloader(self, task: dict, chunk_id: int, start_byte: int, end_byte: int,
+                           temp_file: str, shared_file: bool = False) -> ChunkDownloader:
+        """按当前配置创建分块下载器（shared_file: 分片下载，写进整个任务共用的文件）"""
+        downloader = ChunkDownloader(
+            chunk_id=chunk_id,
+            task_id=task['task_id'],
+            url=task['url'],
+            start_byte=start_byte,
+            end_byte=end_byte,
+            temp_file=temp_file,
+            timeout=self.config.timeout,
+            retry_times=self.config.retry_times,
+            user_agent=self.config.user_agent,
+            speed_limit=self.config.speed_limit,
+            proxies=self.config.proxies,  # 代理支持
+            governor=self.governor,
+            shared_file=shared_file
+        )
+        if shared_file:
+            # 分片没有分块记录，重试次数按任务记在分片表里
+            downloader.set_retry_callback(
+                lambda chunk_id, attempt, error: self.db.increment_piece_retry(task['task_id']))
+        else:
+            downloader.set_retry_callback(self._on_chunk_retry)
+        return downloader
+
+    def _on_chunk_retry(self, chunk_id: int, attempt: int, error: Exception):
+        """分块重试回调（在下载线程中调用）：记录重试次数"""
+        # 单线程任务的chunk_id是0，没有分块记录
+        if chunk_id:
+            self.db.increment_chunk_retry(chunk_id)
+
     def _start_multithread_download(self, task: dict, resume: bool) -> bool:
         """多线程分块下载"""
         task_id = task['task_id']
 
         # 获取分块信息
+        all_chunks = self.db.get_chunks(task_id)
         if resume:
-            chunks = self.db.get_incomplete_chunks(task_id)
+            chunks = [chunk for chunk in all_chunks if chunk['status'] != 'completed']
         else:
-            chunks = self.db.get_chunks(task_id)
+            chunks = all_chunks
 
-        if not chunks:
-            print(f"[错误] 没有分块信息: {task_id}")
+        if not all_chunks:
+            logger.error("没有分块信息: %s", task_id)
             return False
 
         # 创建分块下载器
-        downloaders = []
-        for chunk in chunks:
-            downloader = ChunkDownloader(
-                chunk_id=chunk['chunk_id'],
-                task_id=task_id,
-                url=task['url'],
-                start_byte=chunk['start_byte'],
-                end_byte=chunk['end_byte'],
-                temp_file=chunk['temp_file'],
-                timeout=self.config.timeout,
-                retry_times=self.config.retry_times,
-                user_agent=self.config.user_agent,
-                speed_limit=self.config.speed_limit,
-                proxies=self.config.proxies  # 代理支持
-            )
-            # 设置进度回调
-            downloader.set_progress_callback(self._on_chunk_progress)
-            downloaders.append(downloader)
-
-        self.active_downloaders[task_id] = downloaders
-
-        # 创建线程池
-        thread_pool = ThreadPoolExecutor(max_workers=task['thread_count'])
-        self.thread_pools[task_id] = thread_pool
-
-        # 提交下载任务
-        start_time = time.time()
-        futures = {thread_pool.submit(d.download, resume): d for d in downloaders}
-
-        # 启动进度监控线程
-        import threading
-        monitor_thread = threading.Thread(
-            target=self._monitor_progress,
-            args=(task_id, task['total_size'], start_time),
-            daemon=True
-        )
-        monitor_thread.start()
-
-        # 等待所有分块完成（在后台线程中）
-        def wait_and_merge():
-            all_success = True
-            for future in as_completed(futures):
-                downloader = futures[future]
-                try:
-                    success = future.result()
-                    if success:
-                        self.db.update_chunk_progress(downloader.chunk_id, downloader.downloaded_bytes, 'completed')
-                    else:
-                        all_success = False
-                        self.db.update_chunk_progress(downloader.chunk_id, downloader.downloaded_bytes, 'failed')
-                except Exception as e:
-                    print(f"[错误] 分块下载异常: {e}")
-                    all_success = False
-
-            # 关闭线程池
-            thread_pool.shutdown(wait=False)
-            if task_id in self.thread_pools:
-                del self.thread_pools[task_id]
-            if task_id in self.active_downloaders:
-                del self.active_downloaders[task_id]
-
-            # 合并文件
-            if all_success:
-                self._merge_and_finish(task_id, task['save_path'], chunks)
-            else:
-                self.db.update_task_status(task_id, 'failed', '部分分块下载失败')
-                if self.status_callback:
-                    self.status_callback(task_id, 'failed', '下载失败')
-
-        # 在后台线程中等待
-        threading.Thread(target=wait_and_merge, daemon=True).start()
+        downloaders = [
+            self._create_downloader(task, chunk['chunk_id'], chunk['start_byte'], chunk['end_byte'],
+                                    chunk['temp_file'])
+            for chunk in chunks
+        ]
+        base_downloaded = sum(chunk['downloaded_bytes'] for chunk in all_chunks
+                              if chunk['status'] == 'completed' and resume)
+
+        self._launch(_TaskRun(task, downloaders, base_downloaded, single=False), resume)
         return True
 
     def _start_singlethread_download(self, task: dict, resume: bool) -> bool:
@@ -283,71 +426,418 @@ class DownloadEngine:
         temp_file = os.path.join(self.config.temp_dir, f"{task_id}.tmp")
 
         # 创建单线程下载器
-        downloader = ChunkDownloader(
-            chunk_id=0,
-            task_id=task_id,
-            url=task['url'],
-            start_byte=0,
-            end_byte=task['total_size'] - 1,
-            temp_file=temp_file,
-            timeout=self.config.timeout,
-            retry_times=self.config.retry_times,
-            user_agent=self.config.user_agent,
-            speed_limit=self.config.speed_limit,
-            proxies=self.config.proxies  # 代理支持
+        downloader = self._create_downloader(task, 0, 0, task['total_size'] - 1, temp_file)
+        self._launch(_TaskRun(task, [downloader], 0, single=True), resume)
+        return True
+
+    def _drop_piece_map(self, task: dict, temp_file: str) -> bool:
+        """
+        服务器对这个URL无视Range（分片请求回200）：分片记录和临时文件作废，任务改成单线程从头下
+        Returns:
+            False表示改不过来（写库失败，任务已标失败）
+        """
+        task_id = task['task_id']
+        logger.warning("服务器无视Range请求，改为单线程下载: %s", task['url'], extra={'task_id': task_id})
+        try:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        except OSError as e:
+            logger.warning("删除临时文件失败: %s: %s", temp_file, e, extra={'task_id': task_id})
+        if not (self.db.delete_piece_map(task_id)
+                and self.tasks.update_task_probe(task_id, task['total_size'], False, 1)):
+            self.tasks.update_task_status(task_id, 'failed', '服务器不支持Range，改单线程下载失败')
+            if self.status_callback:
+                self.status_callback(task_id, 'failed', '下载失败: 服务器不支持Range，改单线程下载失败')
+            return False
+        self.tasks.update_task_progress(task_id, 0, 0)
+        return True
+
+    def _start_piece_download(self, task: dict, piece_map: dict, resume: bool) -> bool:
+        """分片下载：线程从队列里领片，下完一片领下一片"""
+        task_id = task['task_id']
+        temp_file = piece_map['temp_file']
+        pieces = PieceMap(task['total_size'], piece_map['piece_size'], piece_map['bitfield'] if resume else None)
+        partial = piece_map['partial'] if resume else {}
+
+        # 第一次下（或者临时文件丢了）：整个文件的空间一次占好，各片直接定位写
+        if not resume or not os.path.exists(temp_file):
+            try:
+                ensure_dir(os.path.dirname(temp_file))
+                with open(temp_file, 'wb') as f:
+                    f.truncate(task['total_size'])
+            except OSError as e:
+                logger.error("创建临时文件失败: %s: %s", temp_file, e, extra={'task_id': task_id})
+                self.tasks.update_task_status(task_id, 'failed', '创建临时文件失败')
+                if self.status_callback:
+                    self.status_callback(task_id, 'failed', f'下载失败: 创建临时文件失败: {e}')
+                return False
+            if pieces.completed_count() or partial:
+                logger.warning("临时文件丢失，已下载的分片作废: %s", temp_file, extra={'task_id': task_id})
+                pieces.clear()
+                partial = {}
+            self.db.update_pieces_progress([(task_id, pieces.to_bytes(), partial)])
+
+        run = _TaskRun(task, [], pieces.completed_bytes() + sum(partial.values()), single=False)
+        run.pieces = pieces
+        run.pieces_file = temp_file
+        run.partial = partial
+        run.thread_count = min(task['thread_count'], pieces.missing_count()) or task['thread_count']
+        run.free_slots = list(range(run.thread_count, 0, -1))
+        self._launch(run, resume)
+        return True
+
+    def _launch(self, run: _TaskRun, resume: bool):
+        """登记下载并把分块丢进共享线程池，完成事件统一交给调度线程"""
+        task_id = run.task_id
+        # 续传时从上次的断点算起，不然第一个tick的速度会把之前下的全算进去
+        run.last_downloaded = (run.task['downloaded_size'] or 0) if resume else 0
+        run.resumed = resume
+        self._runs[task_id] = run
+        self.active_downloaders[task_id] = run.downloaders
+
+        if run.pieces is not None:
+            # 派片只在调度线程里做（下完一片也是在那里派下一片）
+            self.supervisor.post(self._schedule_pieces, run)
+            self.supervisor.start()
+            return
+
+        for downloader in run.downloaders:
+            self._submit_chunk(run, downloader, downloader.download, resume)
+
+        # 没有要下的分块（续传时全都下完了），直接进入收尾
+        if not run.downloaders:
+            self.supervisor.post(self._on_run_finished, run)
+        else:
+            self.supervisor.start()
+
+    def _submit_chunk(self, run: _TaskRun, downloader: ChunkDownloader, func: Callable, *args):
+        """把分块下载丢进共享线程池，退出事件交给调度线程"""
+        future = self._get_worker_pool().submit(func, *args)
+        future.add_done_callback(
+            lambda f: self.supervisor.post(self._on_chunk_done, run, downloader, f)
         )
-        downloader.set_progress_callback(self._on_chunk_progress)
-        self.active_downloaders[task_id] = [downloader]
 
-        # 在后台线程下载
-        def download_and_finish():
-            start_time = time.time()
-            success = downloader.download(resume)
+    # ==================== 调度线程里执行的事件处理 ====================
 
-            if task_id in self.active_downloaders:
-                del self.active_downloaders[task_id]
+    def _on_chunk_done(self, run: _TaskRun, downloader: ChunkDownloader, future):
+        """单个分块退出（成功/失败/暂停/取消/推迟）"""
+        try:
+            future.result()
+        except Exception as e:
+            logger.exception("分块下载异常: %s", e, extra={'task_id': run.task_id, 'chunk_id': downloader.chunk_id})
+            downloader.status = 'failed'
+
+        # 主机熔断或并发名额满了：过一会儿重新排队，线程先还给线程池
+        if downloader.status == 'deferred' and (downloader.is_paused or downloader.is_cancelled):
+            downloader.status = 'cancelled' if downloader.is_cancelled else 'paused'
+        if downloader.status == 'deferred':
+            run.deferred.add(downloader)
+            self.supervisor.call_later(downloader.defer_delay, self._resubmit_deferred, run, downloader)
+            return
+
+        self._on_chunk_exited(run, downloader)
+
+    def _resubmit_deferred(self, run: _TaskRun, downloader: ChunkDownloader):
+        """推迟的分块到点了，重新丢进线程池"""
+        if downloader not in run.deferred:
+            return  # 已经因为暂停/取消处理掉了
+        run.deferred.discard(downloader)
+        if self._runs.get(run.task_id) is not run:
+            return  # 任务已取消
+        self._submit_chunk(run, downloader, downloader.continue_download)
+
+    def _drain_deferred(self, run: _TaskRun):
+        """暂停/取消时，把还在等待重新排队的分块直接结束掉，别让暂停卡到冷却结束"""
+        if run.pieces is not None:
+            # 分片下载：别再派新片；暂停前一刻刚派出去的片没收到暂停标志，补上
+            run.exit_statuses.add('paused')
+            for downloader in run.downloaders:
+                downloader.pause()
+        for downloader in list(run.deferred):
+            run.deferred.discard(downloader)
+            downloader.status = 'cancelled' if downloader.is_cancelled else 'paused'
+            self._on_chunk_exited(run, downloader)
+
+    def _on_chunk_exited(self, run: _TaskRun, downloader: ChunkDownloader):
+        """分块下载线程真正结束了"""
+        if run.pieces is not None:
+            self._on_piece_exited(run, downloader)
+            return
+
+        # 记录分块断点（单线程任务没有分块记录）
+        if not run.single:
+            status = downloader.status if downloader.status != 'pending' else 'failed'
+            self.db.update_chunk_progress(downloader.chunk_id, downloader.downloaded_bytes, status)
+
+        run.pending -= 1
+        if run.pending == 0:
+            self._on_run_finished(run)
+
+    def _schedule_pieces(self, run: _TaskRun):
+        """空着的连接都派上片；没片可派、也没有在下的了，就收尾"""
+        task_id = run.task_id
+        stopped = run.exit_statuses or self._runs.get(task_id) is not run
+        while not stopped and run.free_slots:
+            index = self._next_piece(run)
+            if index is None:
+                break
+            start_byte, end_byte = run.pieces.piece_range(index)
+            done = run.partial.pop(index, 0)
+            if start_byte + done > end_byte:
+                run.pieces.set(index)  # 上次崩溃前已经下完、只是没来得及记进位图
+                continue
+            downloader = self._create_downloader(run.task, index, start_byte, end_byte, run.pieces_file,
+                                                 shared_file=True)
+            # 下了一半的片从断点接着下（这部分字节数从base_downloaded挪到下载器上）
+            run.base_downloaded -= done
+            downloader.downloaded_bytes = done
+            slot = run.free_slots.pop()
+            downloader.trace_tid = slot
+            downloader.trace_name = f"连接{slot}"
+            run.downloaders.append(downloader)
+            run.pending += 1
+            self._submit_chunk(run, downloader, downloader.continue_download)
+
+        if run.pending == 0:
+            self._on_run_finished(run)
+
+    @staticmethod
+    def _next_piece(run: _TaskRun) -> Optional[int]:
+        """下一个要派的片：先派退回来的，再顺着位图往后找"""
+        if run.retry_pieces:
+            return run.retry_pieces.popleft()
+        index = run.pieces.next_missing(run.piece_cursor)
+        if index is not None:
+            run.piece_cursor = index + 1
+        return index
+
+    def _on_piece_exited(self, run: _TaskRun, downloader: ChunkDownloader):
+        """一片退出了：下完的记进位图、派下一片；没下完的记下断点放回队列，续传时接着下"""
+        run.pending -= 1
+        run.free_slots.append(downloader.trace_tid)
+        if downloader.range_ok is not None:
+            run.range_seen.add(downloader.range_ok)
+
+        index = downloader.chunk_id
+        run.downloaders.remove(downloader)
+        run.base_downloaded += downloader.downloaded_bytes
+        if downloader.status == 'completed':
+            run.pieces.set(index)
+        else:
+            run.exit_statuses.add(downloader.status if downloader.status != 'pending' else 'failed')
+            if downloader.status == 'failed' and downloader.last_error:
+                run.last_error = downloader.last_error  # 收尾时报这个
+            if downloader.downloaded_bytes:
+                run.partial[index] = downloader.downloaded_bytes
+            run.retry_pieces.append(index)
+
+        self._schedule_pieces(run)
+
+    def _finish_piece_run(self, run: _TaskRun):
+        """分片下载的全部片都退出了：位图落库，决定下一步"""
+        task_id = run.task_id
+        task = run.task
+        self._flush_pieces([run])
+
+        completed = run.pieces.is_complete()
+        if completed or 'failed' in run.exit_statuses:
+            self._record_host_profile(run, completed=completed)
+
+        # 有片回了200（服务器无视Range）：分片这条路走不通，画像已经记下这个目录，直接改单线程从头下
+        if not completed and False in run.range_seen and run.exit_statuses <= {'failed'}:
+            if self._drop_piece_map(task, run.pieces_file):
+                self.start_download(task_id)
+            return
 
-            if success:
-                # 移动文件到目标位置
-                ensure_dir(os.path.dirname(task['save_path']))
-                os.replace(temp_file, task['save_path'])
+        if completed:
+            self.tasks.update_task_progress(task_id, run.downloaded_size(), 0)
+            self._get_worker_pool().submit(self._move_and_finish, task_id, run.pieces_file, task['save_path'])
+        elif 'cancelled' in run.exit_statuses:
+            pass
+        elif 'paused' in run.exit_statuses:
+            self._on_download_paused(task_id, task, run.downloaded_size())
+        else:
+            reason = run.last_error or '未知错误'
+            self.tasks.update_task_status(task_id, 'failed', f'部分分片下载失败: {reason}')
+            if self.status_callback:
+                self.status_callback(task_id, 'failed', f'下载失败: {reason}')
+
+    def _flush_pieces(self, runs: list):
+        """
+        分片断点（位图 + 下了一半的片）一次写库；位图没变就不重写（10万片也有12KB）
+        老王说：先记下断点、再把临时文件刷到盘上、最后才写库，顺序不能乱！
+        库里记的断点必须是盘上真有的数据，不然断电后续传会跳过一段全是0的地方。
+        """
+        updates = []
+        flushed = []
+        for run in runs:
+            if run.pieces is None:
+                continue
+            # 断点在刷盘之前取：取到的字节都已经write过了，刷完盘就都落地了
+            downloaded_size = run.downloaded_size()
+            partial = dict(run.partial)
+            partial.update((d.chunk_id, d.downloaded_bytes) for d in run.downloaders if d.downloaded_bytes)
+            bitfield = run.pieces.to_bytes() if run.pieces.dirty else None
+            if downloaded_size != run.synced_size and not _sync_file(run.pieces_file, run.task_id):
+                continue  # 没刷上盘的断点不能记，下个tick再来
+            updates.append((run.task_id, bitfield, partial))
+            flushed.append((run, downloaded_size, bitfield is not None))
+        # 写库失败的话位图还是脏的，下个tick重写
+        if self.db.update_pieces_progress(updates):
+            for run, downloaded_size, wrote_bitfield in flushed:
+                run.synced_size = downloaded_size
+                if wrote_bitfield:
+                    run.pieces.dirty = False
+
+    def _on_run_finished(self, run: _TaskRun):
+        """一个任务的全部分块都退出了，决定下一步：收尾/暂停/失败"""
+        task_id = run.task_id
+        task = run.task
+
+        # 取消时cancel_download已经把登记删了，这里别误删新一轮的下载
+        cancelled = self._runs.get(task_id) is not run
+        if not cancelled:
+            del self._runs[task_id]
+            self.active_downloaders.pop(task_id, None)
+
+        if run.pieces is not None:
+            if cancelled:
+                run.exit_statuses.add('cancelled')
+            self._finish_piece_run(run)
+            return
 
-                # 校验并完成任务（复用相同逻辑）
-                self._verify_and_finish(task_id, task['save_path'])
+        statuses = {d.status for d in run.downloaders}
+        if statuses <= {'completed'} or 'failed' in statuses:
+            self._record_host_profile(run, completed=statuses <= {'completed'})
+
+        if statuses <= {'completed'}:
+            # 合并/改名/校验是重活，丢进线程池干，别堵住调度线程
+            self.tasks.update_task_progress(task_id, run.downloaded_size(), 0)
+            if run.single:
+                self._get_worker_pool().submit(self._move_and_finish, task_id, run.downloaders[0].temp_file,
+                                               task['save_path'])
             else:
-                self.db.update_task_status(task_id, 'failed', '下载失败')
-                if self.status_callback:
-                    self.status_callback(task_id, 'failed', '下载失败')
+                self._get_worker_pool().submit(self._merge_and_finish, task_id, task['save_path'],
+                                               self.db.get_chunks(task_id))
+        elif 'cancelled' in statuses:
+            # 取消的状态已经由cancel_download处理过了
+            pass
+        elif 'paused' in statuses:
+            # 暂停期间失败的分块续传时会重试，按暂停处理
+            self._on_download_paused(task_id, task)
+        else:
+            errors = [d.last_error for d in run.downloaders if d.status == 'failed' and d.last_error]
+            reason = errors[0] if errors else '未知错误'
+            prefix = '下载失败' if run.single else '部分分块下载失败'
+            self.tasks.update_task_status(task_id, 'failed', f'{prefix}: {reason}')
+            if self.status_callback:
+                self.status_callback(task_id, 'failed', f'下载失败: {reason}')
+
+    def _record_host_profile(self, run: _TaskRun, completed: bool):
+        """下完（或失败）一次，把这个主机的表现记进画像"""
+        host = get_host_key(run.task['url'])
+        observed = run.range_seen | {d.range_ok for d in run.downloaders if d.range_ok is not None}
+        range_ok = (False not in observed) if observed else None
+        size = 0
+        if completed and not run.resumed:
+            size = run.downloaded_size()
+        self.profiles.record_run(host, run.task['url'], range_ok, None if run.resumed else run.thread_count,
+                                 size, time.monotonic() - run.started, self.governor.get_host_state(host))
+
+    def _on_tick(self):
+        """
+        进度tick（有活动任务时每秒一次）
+        老王说：进度全从内存里算，一次性批量落库，别每8KB就开一次数据库连接！
+        """
+        for task_id, run in list(self._runs.items()):
+            downloaded_size = run.downloaded_size()
+            speed = max(0, downloaded_size - run.last_downloaded)
+            run.last_downloaded = downloaded_size
+
+            # 分块断点批量落库（暂停或崩溃后都能续；分片下载的断点是位图，下面一起写）
+            if not run.single and run.pieces is None:
+                self.db.update_chunks_progress(
+                    [(d.chunk_id, d.downloaded_bytes) for d in run.downloaders if d.status == 'pending']
+                )
+            self.tasks.update_task_progress(task_id, downloaded_size, speed)
 
-        import threading
-        threading.Thread(target=download_and_finish, daemon=True).start()
-        return True
+            # 调用进度回调
+            if self.progress_callback:
+                self.progress_callback(task_id, downloaded_size, run.task['total_size'], speed)
+
+        self._flush_pieces(list(self._runs.values()))
+        # 任务进度攒一个tick批量落库
+        self.tasks.flush()
+
+    # ==================== 收尾 ====================
+
+    def _on_download_paused(self, task_id: str, task: dict, downloaded_size: Optional[int] = None):
+        """
+        暂停后下载线程已全部退出：记录断点进度
+        如果退出期间用户又点了继续，直接按断点重新发起请求
+        Args:
+            downloaded_size: 断点（分片下载按内存里的进度传进来，None表示从分块记录/临时文件算）
+        """
+        if downloaded_size is None:
+            chunks = self.db.get_chunks(task_id)
+            if chunks:
+                downloaded_size = sum(chunk['downloaded_bytes'] for chunk in chunks)
+            else:
+                temp_file = os.path.join(self.config.temp_dir, f"{task_id}.tmp")
+                downloaded_size = os.path.getsize(temp_file) if os.path.exists(temp_file) else 0
+        self.tasks.update_task_progress(task_id, downloaded_size, 0)
+
+        if task_id in self._resume_requested:
+            self._resume_requested.discard(task_id)
+            self.start_download(task_id, resume=True)
+
+    def _move_and_finish(self, task_id: str, temp_file: str, save_path: str):
+        """单线程/分片下载完成：把临时文件挪到目标位置再校验"""
+        try:
+            save_dir = os.path.dirname(save_path)
+            if save_dir:
+                ensure_dir(save_dir)
+            os.replace(temp_file, save_path)
+        except Exception as e:
+            logger.error("移动文件失败: %s", e, extra={'task_id': task_id})
+            self.tasks.update_task_status(task_id, 'failed', '移动文件失败')
+            if self.status_callback:
+                self.status_callback(task_id, 'failed', '移动文件失败')
+            return
+
+        # 校验并完成任务（复用相同逻辑）
+        self._verify_and_finish(task_id, save_path)
 
     def _merge_and_finish(self, task_id: str, save_path: str, chunks: list):
         """合并文件并完成任务"""
-        print(f"[合并] 开始合并文件，目标路径: {save_path}")
+        logger.info("开始合并文件，目标路径: %s", save_path, extra={'task_id': task_id})
 
         # 确保目标目录存在
-        from downloader.utils.file_utils import ensure_dir
         save_dir = os.path.dirname(save_path)
         if save_dir:
             ensure_dir(save_dir)
-            print(f"[合并] 目标目录: {save_dir}")
+            logger.debug("合并目标目录: %s", save_dir)
 
         # 获取所有分块文件
         chunk_files = [chunk['temp_file'] for chunk in sorted(chunks, key=lambda x: x['chunk_index'])]
-        print(f"[合并] 分块文件数: {len(chunk_files)}")
+        logger.debug("分块文件数: %s", len(chunk_files))
 
         # 合并文件
-        if merge_chunks(chunk_files, save_path, delete_chunks=True):
-            print(f"[成功] 文件已保存到: {save_path}")
-            print(f"[检查] 文件是否存在: {os.path.exists(save_path)}")
+        merge_start = tracing.now()
+        merged = merge_chunks(chunk_files, save_path, delete_chunks=True)
+        merge_end = tracing.now()
+        MERGE_SECONDS.labels('ok' if merged else 'failed').observe(merge_end - merge_start)
+        trace = tracing.trace_for(task_id)
+        if trace:
+            trace.add('合并', merge_start, merge_end, cat='merge', args={'chunks': len(chunk_files), 'ok': merged})
+        if merged:
+            logger.info("文件已保存到: %s", save_path, extra={'task_id': task_id})
 
             # 校验并完成任务
             self._verify_and_finish(task_id, save_path)
         else:
-            print(f"[错误] 文件合并失败！")
-            self.db.update_task_status(task_id, 'failed', '文件合并失败')
+            logger.error("文件合并失败: %s", save_path, extra={'task_id': task_id})
+            self.tasks.update_task_status(task_id, 'failed', '文件合并失败')
             if self.status_callback:
                 self.status_callback(task_id, 'failed', '合并失败')
 
@@ -355,140 +845,158 @@ class DownloadEngine:
         """
         校验文件并完成任务
         老王说：校验这步很重要，下载了个假文件还不自知那才叫蠢！
+        哈希交给校验队列慢慢算，这里只改状态就返回，下载线程不陪着读盘。
         """
-        task = self.db.get_task(task_id)
+        task = self.tasks.get_task(task_id)
         if not task:
             return
 
-        expected_hash = task.get('expected_hash')
         hash_type = task.get('expected_hash_type', 'md5') or 'md5'
 
         # 更新状态为verifying
-        self.db.update_task_status(task_id, 'verifying')
+        self.tasks.update_task_status(task_id, 'verifying')
         if self.status_callback:
             self.status_callback(task_id, 'verifying', '正在校验...')
 
-        # 计算文件哈希
-        print(f"[校验] 开始计算{hash_type.upper()}哈希...")
-        actual_hash = calculate_file_hash(save_path, hash_type)
+        # 缓存里有（同一个文件已经算过）就不用去排队读盘了
+        cached_hash = get_cached_hash(save_path, hash_type)
+        if cached_hash:
+            logger.info("哈希缓存命中", extra={'task_id': task_id})
+            self._on_verified(task_id, save_path, hash_type, cached_hash, 0.0)
+            return
+
+        logger.info("排队计算%s哈希...", hash_type.upper(), extra={'task_id': task_id})
+        self.verifier.submit(
+            save_path, hash_type,
+            lambda actual_hash, elapsed: self._on_verified(task_id, save_path, hash_type, actual_hash, elapsed),
+            lambda processed, total, speed: self._on_verify_progress(task_id, processed, total, speed))
+
+    def verify_task(self, task_id: str) -> bool:
+        """重新排队校验（上次退出时还没校验完的任务），文件没了返回False"""
+        task = self.tasks.get_task(task_id)
+        if not task or not os.path.isfile(task['save_path']):
+            return False
+        self._verify_and_finish(task_id, task['save_path'])
+        return True
+
+    def _on_verify_progress(self, task_id: str, processed: int, total: int, speed: float):
+        """校验进度（校验线程里调用）：只改内存，界面按verified_size画进度条"""
+        self.tasks.update_verify_progress(task_id, processed)
+        if self.progress_callback:
+            self.progress_callback(task_id, total, total, 0)
+
+    def _on_verified(self, task_id: str, save_path: str, hash_type: str, actual_hash: str, elapsed: float):
+        """哈希算完（校验线程里调用）：比对并完成任务"""
+        verify_end = tracing.now()
+        if elapsed:
+            VERIFY_SECONDS.labels(hash_type).observe(elapsed)  # 缓存命中的不算
+        trace = tracing.trace_for(task_id)
+        if trace:
+            trace.add('校验', verify_end - elapsed, verify_end, cat='verify', args={'hash_type': hash_type})
+
+        if not actual_hash and self.verifier.is_stopped():
+            return  # 退出时被掐掉的，留着verifying状态下次启动重新排队
+        task = self.tasks.get_task(task_id)
+        if not task or task['status'] != 'verifying':
+            return  # 算的时候任务被删了
+        expected_hash = task.get('expected_hash')
 
         if actual_hash:
-            print(f"[校验] 文件哈希: {actual_hash}")
+            logger.info("文件哈希: %s", actual_hash, extra={'task_id': task_id})
             # 有预期哈希值，进行对比
             if expected_hash:
                 if actual_hash == expected_hash.lower():
                     # 校验通过
-                    print(f"[校验] 校验通过！")
-                    self.db.update_task_hash(task_id, actual_hash, 1)
+                    logger.info("校验通过", extra={'task_id': task_id})
+                    self.tasks.update_task_hash(task_id, actual_hash, 1)
                     self._finish_task(task_id, save_path, 'completed', '下载完成，校验通过')
                 else:
                     # 校验失败
-                    print(f"[校验] 校验失败！期望:{expected_hash}, 实际:{actual_hash}")
-                    self.db.update_task_hash(task_id, actual_hash, -1)
+                    logger.warning("校验失败！期望:%s, 实际:%s", expected_hash, actual_hash, extra={'task_id': task_id})
+                    self.tasks.update_task_hash(task_id, actual_hash, -1)
                     self._finish_task(task_id, save_path, 'verify_failed',
                                       f'校验失败：期望{expected_hash[:8]}...，实际{actual_hash[:8]}...')
             else:
                 # 没有预期哈希值，只记录实际哈希
-                self.db.update_task_hash(task_id, actual_hash, 0)
+                self.tasks.update_task_hash(task_id, actual_hash, 0)
                 self._finish_task(task_id, save_path, 'completed', '下载完成')
         else:
             # 哈希计算失败，也标记完成（但记录问题）
-            print(f"[警告] 哈希计算失败，跳过校验")
+            logger.warning("哈希计算失败，跳过校验", extra={'task_id': task_id})
             self._finish_task(task_id, save_path, 'completed', '下载完成（哈希计算失败）')
 
     def _finish_task(self, task_id: str, save_path: str, status: str, message: str):
         """完成任务的公共逻辑"""
-        task = self.db.get_task(task_id)
+        task = self.tasks.get_task(task_id)
         if task and task.get('started_at'):
             try:
-                elapsed_time = time.time() - time.mktime(time.strptime(task['started_at'], '%Y-%m-%d %H:%M:%S'))
+                # started_at是SQLite的CURRENT_TIMESTAMP（UTC），得按UTC解析
+                elapsed_time = time.time() - calendar.timegm(time.strptime(task['started_at'], '%Y-%m-%d %H:%M:%S'))
                 avg_speed = task['total_size'] / elapsed_time if elapsed_time > 0 else 0
                 self.db.add_history(task_id, task['filename'], task['total_size'], elapsed_time, avg_speed)
             except Exception as e:
-                print(f"[警告] 添加历史记录失败: {e}")
+                logger.warning("添加历史记录失败: %s", e, extra={'task_id': task_id})
 
-        self.db.update_task_status(task_id, status)
+        self.tasks.update_task_status(task_id, status)
         if self.status_callback:
             self.status_callback(task_id, status, message)
 
-    def _on_chunk_progress(self, chunk_id: int, downloaded_bytes: int):
-        """分块进度回调"""
-        self.db.update_chunk_progress(chunk_id, downloaded_bytes)
-
-    def _monitor_progress(self, task_id: str, total_size: int, start_time: float):
-        """监控下载进度（在后台线程中运行）"""
-        last_downloaded = 0
-        while task_id in self.active_downloaders:
-            time.sleep(1)  # 每秒更新一次
-
-            # 计算总下载量
-            chunks = self.db.get_chunks(task_id)
-            downloaded_size = sum(chunk['downloaded_bytes'] for chunk in chunks)
-
-            # 计算速度
-            speed = downloaded_size - last_downloaded
-            last_downloaded = downloaded_size
-
-            # 更新数据库
-            self.db.update_task_progress(task_id, downloaded_size, speed)
-
-            # 调用进度回调
-            if self.progress_callback:
-                self.progress_callback(task_id, downloaded_size, total_size, speed)
-
-            # 如果下载完成，退出
-            if downloaded_size >= total_size:
-                break
-
     def pause_download(self, task_id: str) -> bool:
-        """暂停下载"""
+        """
+        暂停下载
+        老王说：暂停就是让下载线程记下断点、关连接、退出，别占着茅坑不拉屎！
+        """
         if task_id in self.active_downloaders:
-            for downloader in self.active_downloaders[task_id]:
+            for downloader in list(self.active_downloaders[task_id]):  # 分片下载时调度线程会增删这个列表
                 downloader.pause()
-            self.db.update_task_status(task_id, 'paused')
+            self._resume_requested.discard(task_id)
+            run = self._runs.get(task_id)
+            if run:
+                self.supervisor.post(self._drain_deferred, run)
+            self.tasks.update_task_status(task_id, 'paused')
             if self.status_callback:
                 self.status_callback(task_id, 'paused', '已暂停')
             return True
         return False
 
     def resume_download(self, task_id: str) -> bool:
-        """继续下载"""
-        task = self.db.get_task(task_id)
+        """继续下载（按断点重新发起Range请求）"""
+        task = self.tasks.get_task(task_id)
         if not task:
             return False
 
         if task['status'] == 'paused':
-            # 如果正在暂停中，恢复
             if task_id in self.active_downloaders:
-                for downloader in self.active_downloaders[task_id]:
-                    downloader.resume()
-                self.db.update_task_status(task_id, 'downloading')
+                # 下载线程还在退出途中，等它们记完断点再重新启动
+                self._resume_requested.add(task_id)
+                self.tasks.update_task_status(task_id, 'downloading')
                 if self.status_callback:
                     self.status_callback(task_id, 'downloading', '继续下载')
                 return True
-            else:
-                # 重新启动（断点续传）
-                return self.start_download(task_id, resume=True)
+            # 重新启动（断点续传）
+            return self.start_download(task_id, resume=True)
         return False
 
     def cancel_download(self, task_id: str) -> bool:
         """取消下载"""
+        self._resume_requested.discard(task_id)
         if task_id in self.active_downloaders:
-            for downloader in self.active_downloaders[task_id]:
+            for downloader in list(self.active_downloaders[task_id]):
                 downloader.cancel()
 
-            # 关闭线程池
-            if task_id in self.thread_pools:
-                self.thread_pools[task_id].shutdown(wait=False)
-                del self.thread_pools[task_id]
-
+            # 分块线程会自己退出，这里先把登记删掉，好让队列里的下一个任务顶上
+            self._runs.pop(task_id, None)
             del self.active_downloaders[task_id]
 
-        self.db.update_task_status(task_id, 'cancelled')
+        self.tasks.update_task_status(task_id, 'cancelled')
         if self.status_callback:
             self.status_callback(task_id, 'cancelled', '已取消')
         return True
 
+    def get_host_stats(self) -> dict:
+        """获取各主机的健康状态 {host: {...}}（给UI/监控用）"""
+        return self.governor.snapshot()
+
     def shutdown(self):
         """
         退出时清理资源
@@ -501,17 +1009,24 @@ class DownloadEngine:
                 try:
                     downloader.cancel()
                 except Exception as e:
-                    print(f"[错误] 取消分块失败: task={task_id}, err={e}")
+                    logger.error("取消分块失败: %s", e, extra={'task_id': task_id})
 
         # 再把线程池关掉（cancel_futures=True 能把还没开始的任务直接掐掉）
-        for task_id, thread_pool in list(self.thread_pools.items()):
+        if self._worker_pool is not None:
             try:
-                thread_pool.shutdown(wait=False, cancel_futures=True)
+                self._worker_pool.shutdown(wait=False, cancel_futures=True)
             except TypeError:
                 # 兼容老版本Python（没有cancel_futures参数）
-                thread_pool.shutdown(wait=False)
+                self._worker_pool.shutdown(wait=False)
             except Exception as e:
-                print(f"[错误] 关闭线程池失败: task={task_id}, err={e}")
+                logger.error("关闭线程池失败: %s", e)
 
+        self.verifier.shutdown()
+        self.supervisor.stop()
+        runs = list(self._runs.values())
         self.active_downloaders.clear()
-        self.thread_pools.clear()
+        self._runs.clear()
+
+        # 没落库的进度别丢了
+        self._flush_pieces(runs)
+        self.tasks.flush()
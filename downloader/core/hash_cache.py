@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+文件哈希缓存
+老王说：几千个下完的文件再校验一遍，每次都从头读几个T，盘都要读冒烟了！
+文件的 路径+大小+修改时间(纳秒)+inode 都没变，就认为内容没变，直接用上次算的哈希；
+每次算完哈希都记一笔，下次只花一次stat。
+注意：只防得住“文件被改过/换过”，防不住盘上的静默损坏（位翻转不会改修改时间），那种得强制重读。
+"""
+import logging
+import os
+from typing import Dict
+
+from downloader.database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class HashCache:
+    """文件哈希缓存（存在数据库的file_hashes表里，file_utils算哈希时先查它）"""
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db = db_manager
+
+    def lookup(self, path: str, stat: os.stat_result) -> Dict[str, str]:
+        """
+        查缓存
+        Args:
+            path: 绝对路径
+            stat: 文件当前的stat结果
+        Returns:
+            {哈希类型: 哈希值}，文件变过或没算过返回空dict
+        """
+        try:
+            return self.db.get_file_hashes(path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        except Exception as e:
+            logger.warning("查哈希缓存失败: %s", e)
+            return {}
+
+    def store(self, path: str, stat: os.stat_result, hashes: Dict[str, str]):
+        """记下算好的哈希（stat是算之前取的，算的过程中文件被改了调用方自己别存）"""
+        if hashes:
+            self.db.save_file_hashes(path, stat.st_size, stat.st_mtime_ns, stat.st_ino, hashes)
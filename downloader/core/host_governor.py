@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+主机熔断与并发控制
+老王说：服务器都开始回429/503了，你还让几十个分块各自往上怼，这不是找封吗？
+同一个主机的所有分块共享一份健康状态：错误多了就熔断冷却，被限流了就减并发。
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+STATE_CLOSED = 'closed'  # 正常
+STATE_OPEN = 'open'  # 熔断中，所有请求直接推迟
+STATE_HALF_OPEN = 'half_open'  # 冷却结束，放一个探测请求试试水
+
+# 请求结果
+OUTCOME_SUCCESS = 'success'
+OUTCOME_THROTTLED = 'throttled'  # 429/503 限流
+OUTCOME_ERROR = 'error'  # 连接重置、超时、5xx
+OUTCOME_IGNORED = 'ignored'  # 404之类的资源错误，跟主机健康无关
+
+# 错误率/延迟的指数滑动平均系数
+EWMA_ALPHA = 0.2
+# 并发名额被占满时，分块推迟多久再来排队（秒）
+SLOT_RETRY_DELAY = 1.0
+
+
+def get_host_key(url: str) -> str:
+    """从URL提取主机标识（host:port）"""
+    return urlparse(url).netloc.lower()
+
+
+class HostState:
+    """单个主机的健康状态（只在HostGovernor的锁里读写）"""
+
+    __slots__ = ('host', 'state', 'limit', 'active', 'error_rate', 'latency',
+                 'consecutive_failures', 'open_until', 'cooldown', 'trips',
+                 'requests', 'errors', 'throttled', 'success_streak')
+
+    def __init__(self, host: str, limit: int, cooldown: float):
+        self.host = host
+        self.state = STATE_CLOSED
+        self.limit = limit  # 当前允许的并发连接数（动态调整）
+        self.active = 0  # 当前占用的连接数
+        self.error_rate = 0.0  # 错误率（EWMA）
+        self.latency = 0.0  # 首字节延迟（EWMA，秒）
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # 熔断到什么时候（monotonic时间）
+        self.cooldown = cooldown  # 下一次熔断的冷却时长
+        self.trips = 0  # 累计熔断次数
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.success_streak = 0
+
+    def to_dict(self) -> Dict:
+        """导出给UI/监控看的快照"""
+        return {
+            'host': self.host,
+            'state': self.state,
+            'limit': self.limit,
+            'active': self.active,
+            'error_rate': round(self.error_rate, 3),
+            'latency': round(self.latency, 3),
+            'open_remaining': round(max(0.0, self.open_until - time.monotonic()), 1),
+            'trips': self.trips,
+            'requests': self.requests,
+            'errors': self.errors,
+            'throttled': self.throttled,
+        }
+
+
+class HostGovernor:
+    """所有任务共享的主机状态表"""
+
+    def __init__(self, max_connections_per_host: int = 32, failure_threshold: int = 5,
+                 error_rate_threshold: float = 0.5, base_cooldown: float = 5.0,
+                 max_cooldown: float = 300.0):
+        """
+        Args:
+            max_connections_per_host: 每个主机的并发连接上限
+            failure_threshold: 连续失败多少次触发熔断
+            error_rate_threshold: 错误率超过多少触发熔断
+            base_cooldown: 第一次熔断的冷却时长（秒），之后每次翻倍
+            max_cooldown: 冷却时长上限（秒）
+        """
+        self.max_connections_per_host = max(1, max_connections_per_host)
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._hosts: Dict[str, HostState] = {}
+        self._lock = threading.Lock()
+
+    def set_max_connections_per_host(self, value: int):
+        """动态调整每主机并发上限"""
+        with self._lock:
+            self.max_connections_per_host = max(1, value)
+            for host_state in self._hosts.values():
+                host_state.limit = min(host_state.limit, self.max_connections_per_host)
+
+    def seed_limit(self, host: str, limit: int):
+        """用历史上学到的并发上限打底（只对这次运行还没见过的主机生效，之后照常加性增/乘性减）"""
+        with self._lock:
+            if host not in self._hosts:
+                self._get_state(host).limit = max(1, min(limit, self.max_connections_per_host))
+
+    def _get_state(self, host: str) -> HostState:
+        host_state = self._hosts.get(host)
+        if host_state is None:
+            host_state = HostState(host, self.max_connections_per_host, self.base_cooldown)
+            self._hosts[host] = host_state
+        return host_state
+
+    def acquire(self, host: str) -> Optional[float]:
+        """
+        申请一个到该主机的连接名额
+        Returns:
+            None表示拿到名额（用完必须release）；否则返回建议推迟的秒数
+        """
+        with self._lock:
+            host_state = self._get_state(host)
+            now = time.monotonic()
+
+            if host_state.state == STATE_OPEN:
+                if now < host_state.open_until:
+                    return host_state.open_until - now
+                # 冷却结束，进入半开状态
+                host_state.state = STATE_HALF_OPEN
+
+            # 半开状态只放一个探测请求
+            limit = 1 if host_state.state == STATE_HALF_OPEN else host_state.limit
+            if host_state.active >= limit:
+                return SLOT_RETRY_DELAY
+
+            host_state.active += 1
+            return None
+
+    def release(self, host: str, outcome: str, latency: Optional[float] = None):
+        """
+        归还连接名额并记录这次请求的结果
+        Args:
+            host: 主机标识
+            outcome: OUTCOME_* 之一
+            latency: 首字节延迟（秒），拿不到就传None
+        """
+        with self._lock:
+            host_state = self._get_state(host)
+            host_state.active = max(0, host_state.active - 1)
+
+            if outcome == OUTCOME_IGNORED:
+                return
+
+            host_state.requests += 1
+            if latency is not None:
+                if host_state.latency:
+                    host_state.latency += EWMA_ALPHA * (latency - host_state.latency)
+                else:
+                    host_state.latency = latency
+
+            if outcome == OUTCOME_SUCCESS:
+                self._on_success(host_state)
+            else:
+                self._on_failure(host_state, throttled=outcome == OUTCOME_THROTTLED)
+
+    def _on_success(self, host_state: HostState):
+        """成功：错误率衰减，半开则恢复，并发名额慢慢加回去（加性增）"""
+        host_state.error_rate *= (1 - EWMA_ALPHA)
+        host_state.consecutive_failures = 0
+        if host_state.state == STATE_HALF_OPEN:
+            host_state.state = STATE_CLOSED
+            host_state.cooldown = self.base_cooldown
+
+        host_state.success_streak += 1
+        if host_state.success_streak >= host_state.limit and host_state.limit < self.max_connections_per_host:
+            host_state.limit += 1
+            host_state.success_streak = 0
+
+    def _on_failure(self, host_state: HostState, throttled: bool):
+        """失败：错误率上升；被限流就把并发砍半（乘性减）；够条件就熔断"""
+        host_state.errors += 1
+        host_state.error_rate += EWMA_ALPHA * (1 - host_state.error_rate)
+        host_state.consecutive_failures += 1
+        host_state.success_streak = 0
+
+        if throttled:
+            host_state.throttled += 1
+            host_state.limit = max(1, host_state.limit // 2)
+
+        should_trip = (
+            host_state.state == STATE_HALF_OPEN
+            or host_state.consecutive_failures >= self.failure_threshold
+            or (host_state.requests >= 10 and host_state.error_rate >= self.error_rate_threshold)
+        )
+        if should_trip:
+            self._trip(host_state)
+
+    def _trip(self, host_state: HostState):
+        """熔断：冷却期内所有请求直接推迟，冷却时长逐次翻倍"""
+        host_state.state = STATE_OPEN
+        host_state.open_until = time.monotonic() + host_state.cooldown
+        host_state.cooldown = min(self.max_cooldown, host_state.cooldown * 2)
+        host_state.consecutive_failures = 0
+        host_state.trips += 1
+        logger.warning("主机%s错误过多，熔断暂停请求%.0f秒", host_state.host, host_state.open_until - time.monotonic(),
+                       extra={'host': host_state.host})
+
+    def get_host_state(self, host: str) -> Optional[Dict]:
+        """获取单个主机的状态快照"""
+        with self._lock:
+            host_state = self._hosts.get(host)
+            return host_state.to_dict() if host_state else None
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """获取所有主机的状态快照 {host: {...}}"""
+        with self._lock:
+            return {host: host_state.to_dict() for host, host_state in self._hosts.items()}
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+主机画像
+老王说：同一个站下了一百次，每次都从头摸索开几个线程、会不会被限流、支不支持Range，这不是傻吗？
+每个任务下完把这个主机的吞吐、最好的线程数、被限流后的并发上限、Range支持、首字节延迟、跳转去向记下来，
+下次探测完直接按画像定线程数和分块大小，开局就是全速。
+"""
+import posixpath
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from downloader.database.db_manager import DatabaseManager
+
+# host_profiles表的字段（updated_at由数据库填）
+PROFILE_FIELDS = (
+    'host', 'final_host', 'redirected', 'support_range', 'samples', 'avg_throughput',
+    'best_thread_count', 'best_throughput', 'max_thread_count', 'connection_limit', 'ttfb', 'error_rate',
+    'range_refused_path', 'range_ok_path',
+)
+
+# 小于这个的文件测不准吞吐（连接建立的时间占了大头），只记Range/延迟，不拿来比线程数
+MIN_LEARN_SIZE = 4 * 1024 * 1024
+# 分块最小大小：再小就是在给连接建立打工
+MIN_CHUNK_SIZE = 256 * 1024
+# 分块至少要够每条连接跑这么多个“首字节延迟”，不然握手时间赚不回来
+CHUNK_TTFB_FACTOR = 4
+# 吞吐提升超过这个比例才算换了更好的线程数（网速本身就有抖动）
+IMPROVE_RATIO = 1.1
+# 吞吐/延迟/错误率的滑动平均系数
+PROFILE_ALPHA = 0.3
+# 上次错误率到这么高的主机，开局线程数减半（连接开多了只是多几条在出错重试，限流器会再慢慢加回去）
+HIGH_ERROR_RATE = 0.2
+
+
+def get_url_dir(url: str) -> str:
+    """URL路径所在的目录（带结尾的/），同一主机不同路径可能是不同的后端，Range支持不一样"""
+    path = urlparse(url).path or '/'
+    return posixpath.dirname(path).rstrip('/') + '/'
+
+
+def _ewma(old: float, new: float) -> float:
+    return new if not old else old + PROFILE_ALPHA * (new - old)
+
+
+class HostProfiles:
+    """主机画像缓存（启动时整表读进内存，每个任务结束写一次）"""
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db = db_manager
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, Dict] = {row['host']: row for row in db_manager.get_host_profiles()}
+
+    def get(self, host: str) -> Optional[Dict]:
+        """主机画像（拷贝），没下过返回None"""
+        with self._lock:
+            profile = self._profiles.get(host)
+            return dict(profile) if profile else None
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {host: dict(profile) for host, profile in self._profiles.items()}
+
+    def plan(self, host: str, url: str, total_size: int, header_range: bool, max_threads: int) -> Tuple[bool, int]:
+        """
+        按画像定这个任务怎么下
+        Args:
+            host: 主机标识
+            url: 下载链接（看是不是在上次Range被无视的那个目录下）
+            total_size: 文件大小
+            header_range: 探测时响应头里有没有 Accept-Ranges: bytes
+            max_threads: 配置的线程数（上限）
+        Returns:
+            (是否分块下载, 线程数)
+        """
+        profile = self.get(host)
+
+        # 下载时实际拿到过206才算数：有的服务器不发Accept-Ranges但支持Range，有的发了却回200
+        # 学到的“支持/不支持”都只管当时那个目录：同一主机（尤其CDN）别的路径可能是另一套后端，还按响应头来；
+        # 不然一个目录回过206，整个主机都去分片；一个目录无视Range，整个主机都成了单线程
+        support_range = header_range
+        if profile:
+            url_dir = get_url_dir(url)
+            if profile['range_refused_path'] and url_dir.startswith(profile['range_refused_path']):
+                support_range = False
+            elif profile['range_ok_path'] and url_dir.startswith(profile['range_ok_path']):
+                support_range = True
+        if not support_range:
+            return False, 1
+
+        threads = max_threads
+        if profile:
+            # 试过更多线程反而不如少开：按最好的来；最好的就是试过最多的，说明还没到顶，按配置开
+            best = profile['best_thread_count']
+            if best and profile['max_thread_count'] and best < profile['max_thread_count']:
+                threads = min(threads, best)
+            if profile['connection_limit']:
+                threads = min(threads, profile['connection_limit'])  # 上次被限流后稳定下来的并发
+            if profile['error_rate'] >= HIGH_ERROR_RATE:
+                threads = max(1, threads // 2)
+
+        threads = max(1, min(threads, total_size // self.min_chunk_size(host)))
+        return True, threads
+
+    def min_chunk_size(self, host: str) -> int:
+        """
+        这个主机的分块最小大小
+        每条连接的吞吐 × 首字节延迟（带宽时延积）再乘个系数，不然每块都在等握手
+        """
+        profile = self.get(host)
+        min_chunk = MIN_CHUNK_SIZE
+        if profile and profile['avg_throughput'] and profile['ttfb'] and profile['best_thread_count']:
+            per_connection = profile['avg_throughput'] / profile['best_thread_count']
+            min_chunk = max(min_chunk, int(per_connection * profile['ttfb'] * CHUNK_TTFB_FACTOR))
+        return min_chunk
+
+    def record_probe(self, host: str, final_host: str, ttfb: Optional[float]):
+        """探测结果：跳转去向和首字节延迟（只更新内存，任务结束时一起落库）"""
+        with self._lock:
+            profile = self._profiles.setdefault(host, self._new_profile(host))
+            profile['final_host'] = final_host
+            profile['redirected'] = int(final_host != host)
+            if ttfb is not None and not profile['ttfb']:
+                profile['ttfb'] = ttfb  # 分块请求的延迟更准，有了就不拿HEAD的覆盖
+
+    def record_run(self, host: str, url: str, range_ok: Optional[bool], thread_count: Optional[int],
+                   size: int, elapsed: float, host_state: Optional[Dict]):
+        """
+        一次下载结束（分块全部退出）后更新画像并落库
+        Args:
+            url: 下载链接（Range被无视时记下它的目录）
+            range_ok: 分块请求实际拿到206为True，Range被无视为False，不知道为None
+            thread_count: 这次开的线程数（续传的不算，传None）
+            size: 这次下载的字节数（0表示没下完，不算吞吐）
+            elapsed: 这次下载用时（秒）
+            host_state: HostGovernor里这个主机的状态快照
+        """
+        with self._lock:
+            profile = self._profiles.setdefault(host, self._new_profile(host))
+            if range_ok is not None:
+                # 记下这个目录的结果；另一种结果要是管着这个目录，说明那条过时了，清掉
+                url_dir = get_url_dir(url)
+                profile['support_range'] = int(range_ok)
+                learned, stale = ('range_ok_path', 'range_refused_path') if range_ok else \
+                    ('range_refused_path', 'range_ok_path')
+                profile[learned] = url_dir
+                if profile[stale] and url_dir.startswith(profile[stale]):
+                    profile[stale] = None
+            if host_state:
+                if host_state['latency']:
+                    profile['ttfb'] = _ewma(profile['ttfb'], host_state['latency'])
+                profile['error_rate'] = host_state['error_rate']
+                # 被限流过就记下降下来的并发，没被限流就不设上限（服务器可能放开了）
+                profile['connection_limit'] = host_state['limit'] if host_state['throttled'] else None
+
+            if size and elapsed > 0:
+                profile['samples'] += 1
+                if size >= MIN_LEARN_SIZE and thread_count:
+                    throughput = size / elapsed
+                    profile['avg_throughput'] = _ewma(profile['avg_throughput'], throughput)
+                    profile['max_thread_count'] = max(profile['max_thread_count'] or 0, thread_count)
+                    if thread_count == profile['best_thread_count']:
+                        profile['best_throughput'] = _ewma(profile['best_throughput'], throughput)
+                    elif not profile['best_thread_count'] or throughput > profile['best_throughput'] * IMPROVE_RATIO:
+                        profile['best_thread_count'] = thread_count
+                        profile['best_throughput'] = throughput
+            snapshot = {key: profile[key] for key in PROFILE_FIELDS}
+        self.db.save_host_profile(snapshot)
+
+    @staticmethod
+    def _new_profile(host: str) -> Dict:
+        return {'host': host, 'final_host': None, 'redirected': 0, 'support_range': None, 'samples': 0,
+                'avg_throughput': 0.0, 'best_thread_count': None, 'best_throughput': 0.0,
+                'max_thread_count': None, 'connection_limit': None, 'ttfb': 0.0, 'error_rate': 0.0,
+                'range_refused_path': None, 'range_ok_path': None}
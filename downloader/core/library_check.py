@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+批量校验下载库
+老王说：盘出过事，几千个下完的文件哪些还是好的？一个个手动算哈希，算到明年去！
+下完的任务全部重新校验：有预期哈希的对预期哈希，没有的对下载完时记下的哈希；
+每块盘同时只读 verify_workers_per_device 个文件，不同的盘并行查，也不会把刚下完等着校验的任务堵在后面；
+查一个记一个结果，中途退出了下次接着查没查完的；查完列出坏了的和丢了的，只重下这些。
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from downloader.core.verifier import VerifyQueue, get_device_id
+from downloader.database.db_manager import DatabaseManager
+from downloader.database.task_store import TaskStore
+from downloader.utils.file_utils import get_cached_hash
+
+logger = logging.getLogger(__name__)
+
+# 参加批量校验的任务状态
+CHECK_STATUSES = ('completed', 'verify_failed')
+
+# 校验结果
+RESULT_OK = 'ok'  # 和预期哈希/下载时的哈希一致
+RESULT_CORRUPT = 'corrupt'  # 对不上
+RESULT_MISSING = 'missing'  # 文件没了
+RESULT_UNVERIFIED = 'unverified'  # 没有可对比的哈希，这次算的记下来当以后的基准
+RESULT_ERROR = 'error'  # 读文件/算哈希失败
+RESULT_SKIPPED = 'skipped'  # 查到它的时候任务已经被删了/重下了
+RESULTS = (RESULT_OK, RESULT_CORRUPT, RESULT_MISSING, RESULT_UNVERIFIED, RESULT_ERROR, RESULT_SKIPPED)
+
+# 攒够这么多个结果写一次库（中途被杀最多重查这么多个）
+FLUSH_BATCH = 100
+# 进度回调的最短间隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+
+class LibraryCheck:
+    """批量校验（同一时间只跑一轮）"""
+
+    def __init__(self, tasks: TaskStore, db_manager: DatabaseManager, verifier: VerifyQueue):
+        self.tasks = tasks
+        self.db = db_manager
+        self.verifier = verifier
+        self._lock = threading.Lock()
+        self._running = False
+        self._stopped = False
+        self._generation = 0  # 第几轮：stop后马上又start，上一轮还没回来的回调对不上号就扔掉
+        self._rehash = False
+        self._total = 0
+        self._remaining = 0
+        self._counts: Dict[str, int] = dict.fromkeys(RESULTS, 0)
+        self._queues: Dict[int, Deque[Tuple[str, str, str]]] = {}  # {设备: 等着读的 (task_id, 路径, 哈希类型)}
+        self._unsaved: List[Tuple[str, str]] = []  # 还没落库的结果
+        self._last_notify = 0.0
+
+        self.progress_callback: Optional[Callable[[Dict], None]] = None  # callback(summary)
+        self.status_callback: Optional[Callable[[str, str, str], None]] = None  # callback(task_id, status, message)
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self, rehash: bool = False, restart: bool = False) -> bool:
+        """
+        开始批量校验；上一轮没查完就接着查没查的
+        Args:
+            rehash: 不用哈希缓存，全部重读（查盘上的静默损坏得这样，缓存只认文件有没有被改过）
+            restart: 上一轮没查完也从头来
+        Returns:
+            False表示已经在查了
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+            self._stopped = False
+            self._rehash = rehash
+            self._generation += 1
+            generation = self._generation
+        threading.Thread(target=self._run, args=(restart, generation), name="library-check", daemon=True).start()
+        return True
+
+    def _is_current(self, generation: int) -> bool:
+        """还是这一轮、也没被stop"""
+        return generation == self._generation and not self._stopped
+
+    def _run(self, restart: bool, generation: int):
+        """列出要查的文件（后台线程：上万个文件光stat也要点时间）"""
+        try:
+            rows = [] if restart else self.db.get_library_checks()
+            pending = [row['task_id'] for row in rows if row['result'] is None]
+            counts = dict.fromkeys(RESULTS, 0)
+            if pending:
+                for row in rows:
+                    if row['result'] in counts:
+                        counts[row['result']] += 1
+                total = len(rows)
+                logger.info("接着上次的批量校验，还剩%s个", len(pending))
+            else:
+                pending = [task['task_id'] for task in self.tasks.get_all_tasks()
+                           if task['status'] in CHECK_STATUSES]
+                self.db.start_library_check(pending)
+                total = len(pending)
+                logger.info("开始批量校验%s个文件", total)
+        except Exception as e:
+            # 出了错也得收尾，不然一直算“在查”，再也开不了新的一轮
+            logger.exception("批量校验启动失败: %s", e)
+            self._finish(generation)
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._total = total
+            self._remaining = len(pending)
+            self._counts = counts
+            self._queues = {}
+        self._notify(force=True)
+        if not pending:
+            self._finish(generation)
+            return
+
+        for task_id in pending:
+            if not self._is_current(generation):
+                return
+            try:
+                self._check(generation, task_id)
+            except Exception as e:
+                logger.exception("批量校验出错: %s: %s", task_id, e)
+                self._record(generation, task_id, RESULT_ERROR)
+
+        # 每块盘先放满校验线程数那么多个，读完一个补一个（刚下完的任务不用排在几千个文件后面）
+        for device in list(self._queues):
+            for _ in range(self.verifier.workers_per_device):
+                self._submit_next(generation, device)
+
+    def _check(self, generation: int, task_id: str):
+        """查一个任务：丢了的、缓存里有的当场出结果，剩下的按盘排队读"""
+        task = self.tasks.get_task(task_id)
+        if not task or task['status'] not in CHECK_STATUSES:
+            self._record(generation, task_id, RESULT_SKIPPED)
+            return
+        path = task['save_path']
+        if not os.path.isfile(path):
+            self._set_status(task_id, 'verify_failed', '批量校验：文件不存在')
+            self._record(generation, task_id, RESULT_MISSING)
+            return
+        hash_type = task['expected_hash_type'] or 'md5'
+        cached_hash = '' if self._rehash else get_cached_hash(path, hash_type)
+        if cached_hash:
+            self._judge(generation, task_id, cached_hash)  # 文件没变过，不用排队读盘
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._queues.setdefault(get_device_id(path), deque()).append((task_id, path, hash_type))
+
+    def _submit_next(self, generation: int, device: int):
+        """这块盘再派一个文件去算（派不出去的记出错，接着派下一个）"""
+        while True:
+            with self._lock:
+                queue = self._queues.get(device)
+                if not self._is_current(generation) or not queue:
+                    return
+                task_id, path, hash_type = queue.popleft()
+            try:
+                self.verifier.submit(
+                    path, hash_type,
+                    lambda actual_hash, elapsed: self._on_hashed(generation, task_id, device, actual_hash),
+                    use_cache=not self._rehash)
+                return
+            except Exception as e:
+                logger.exception("批量校验排队失败: %s: %s", path, e)
+                self._record(generation, task_id, RESULT_ERROR)
+
+    def _on_hashed(self, generation: int, task_id: str, device: int, actual_hash: str):
+        """一个文件算完（校验线程里调用）"""
+        if not self._is_current(generation):
+            return  # 这一轮已经停了（或者已经是新的一轮了）
+        if not actual_hash and self.verifier.is_stopped():
+            self.stop()  # 校验队列已经关了，剩下的下次接着查
+            return
+        try:
+            self._judge(generation, task_id, actual_hash)
+        except Exception as e:
+            # 每个文件都得记上一个结果，不然剩余数减不到0，这一轮永远收不了尾
+            logger.exception("批量校验出错: %s: %s", task_id, e)
+            self._record(generation, task_id, RESULT_ERROR)
+        finally:
+            self._submit_next(generation, device)
+
+    def _judge(self, generation: int, task_id: str, actual_hash: str):
+        """拿算出来的哈希和基准比，改任务的校验结果"""
+        task = self.tasks.get_task(task_id)
+        if not task or task['status'] not in CHECK_STATUSES:
+            self._record(generation, task_id, RESULT_SKIPPED)
+            return
+        if not actual_hash:
+            self._record(generation, task_id, RESULT_ERROR)
+            return
+
+        expected_hash = task['expected_hash']
+        reference = expected_hash or task['actual_hash']
+        if not reference:
+            self.tasks.update_task_hash(task_id, actual_hash, 0)
+            self._record(generation, task_id, RESULT_UNVERIFIED)
+        elif actual_hash == reference.lower():
+            if expected_hash:
+                self.tasks.update_task_hash(task_id, actual_hash, 1)
+            if task['status'] == 'verify_failed':
+                self._set_status(task_id, 'completed', '批量校验通过')
+            self._record(generation, task_id, RESULT_OK)
+        else:
+            # 没有预期哈希的，下载完时记的哈希是唯一的基准，不能拿坏文件的哈希盖掉
+            self.tasks.update_task_hash(task_id, actual_hash if expected_hash else task['actual_hash'], -1)
+            self._set_status(task_id, 'verify_failed', '批量校验：文件已损坏')
+            self._record(generation, task_id, RESULT_CORRUPT)
+
+    def _set_status(self, task_id: str, status: str, message: str):
+        # 只是改校验结论，下载完成时间还是当初那个
+        self.tasks.update_task_status(task_id, status, message if status != 'completed' else None, stamp=False)
+        if self.status_callback:
+            try:
+                self.status_callback(task_id, status, message)
+            except Exception as e:
+                logger.error("批量校验状态回调失败: %s", e)
+
+    def _record(self, generation: int, task_id: str, result: str):
+        """记一个结果，攒够一批落库；最后一个查完了收尾（不抛异常；不是这一轮的不记）"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._counts[result] += 1
+            self._remaining -= 1
+            self._unsaved.append((task_id, result))
+            batch = None
+            if len(self._unsaved) >= FLUSH_BATCH or self._remaining <= 0:
+                batch, self._unsaved = self._unsaved, []
+            done = self._remaining <= 0
+        if batch:
+            self._save(batch)
+        if done:
+            self._finish(generation)
+        else:
+            self._notify()
+
+    def _save(self, batch: List[Tuple[str, str]]):
+        try:
+            self.db.update_library_checks(batch)
+        except Exception as e:
+            logger.error("批量校验结果落库失败（这%s个下次重查）: %s", len(batch), e)
+
+    def _finish(self, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._running = False
+            self._queues = {}
+        counts = self._counts
+        logger.info("批量校验完成：完好%s，损坏%s，丢失%s，出错%s", counts[RESULT_OK], counts[RESULT_CORRUPT],
+                    counts[RESULT_MISSING], counts[RESULT_ERROR])
+        self._notify(force=True)
+
+    def _notify(self, force: bool = False):
+        now = time.monotonic()
+        if not self.progress_callback or (not force and now - self._last_notify < PROGRESS_INTERVAL):
+            return
+        self._last_notify = now
+        try:
+            self.progress_callback(self.summary())
+        except Exception as e:
+            logger.error("批量校验进度回调失败: %s", e)
+
+    def summary(self) -> Dict:
+        """当前进度 {running, total, checked, ok, corrupt, missing, unverified, error, skipped}"""
+        with self._lock:
+            return dict(self._counts, running=self._running, total=self._total,
+                        checked=self._total - self._remaining)
+
+    def report(self) -> Dict:
+        """进度加上坏了的/丢了的任务ID（最近一轮的，落没落库都算）"""
+        results = {row['task_id']: row['result'] for row in self.db.get_library_checks()}
+        with self._lock:
+            results.update(self._unsaved)
+        report = self.summary()
+        if not report['running']:
+            # 这次启动还没查过的话，上一轮的结果只在库里
+            report.update(dict.fromkeys(RESULTS, 0), total=len(results),
+                          checked=sum(result is not None for result in results.values()))
+            for result in results.values():
+                if result in RESULTS:
+                    report[result] += 1
+        # 已经重下了（或者被删了）的不用再列
+        report['corrupt_ids'] = [task_id for task_id, result in results.items()
+                                 if result == RESULT_CORRUPT and self._still_bad(task_id)]
+        report['missing_ids'] = [task_id for task_id, result in results.items()
+                                 if result == RESULT_MISSING and self._still_bad(task_id)]
+        return report
+
+    def _still_bad(self, task_id: str) -> bool:
+        task = self.tasks.get_task(task_id)
+        return bool(task) and task['status'] == 'verify_failed'
+
+    def stop(self):
+        """退出时调用：不再派新文件，查完的结果落库（没查的下次接着查）"""
+        with self._lock:
+            self._stopped = True
+            self._running = False
+            self._queues = {}
+            batch, self._unsaved = self._unsaved, []
+        if batch:
+            self._save(batch)
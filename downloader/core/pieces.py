@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+分片
+老王说：按线程数平分成几大块，一块慢了整个任务陪着等，暂停一下还得记每块下到哪个字节。
+文件切成很多固定大小的片，线程下完一片就去队列里领下一片，快的多干慢的少干；
+哪片下完了用一位记下来，整个任务的断点就是一小段位图，一次写库完事。
+
+100G的文件切成10万片也别给每片建对象：片的起止按序号现算，完成状态就是位图里的一位，
+只有正在下的那几片才有下载器，派片靠一个游标往后扫位图。
+"""
+import math
+from typing import Iterator, Optional, Tuple
+
+# 片数上限：再多位图和调度开销就不划算了（10万片的位图才12KB出头）
+MAX_PIECES = 1 << 17
+
+
+def choose_piece_size(total_size: int, chunk_size: int, min_size: int) -> int:
+    """
+    定片大小
+    Args:
+        total_size: 文件大小
+        chunk_size: 配置的分块大小（0表示全按min_size）
+        min_size: 不能再小的片大小（带宽时延积算出来的）
+    """
+    return max(chunk_size, min_size, math.ceil(total_size / MAX_PIECES), 1)
+
+
+class PieceMap:
+    """
+    片完成位图（高位在前：第0片是第0字节的最高位）
+    只在调度线程里改，不加锁
+    """
+
+    __slots__ = ('total_size', 'piece_size', 'piece_count', '_bits', '_completed', 'dirty')
+
+    def __init__(self, total_size: int, piece_size: int, bitfield: Optional[bytes] = None):
+        self.total_size = total_size
+        self.piece_size = piece_size
+        self.piece_count = math.ceil(total_size / piece_size)
+        size = (self.piece_count + 7) // 8
+        self._bits = bytearray(bitfield[:size]) if bitfield else bytearray(size)
+        self._bits.extend(bytes(size - len(self._bits)))  # 位图长度对不上就当后面的没下
+        if self.piece_count % 8:
+            self._bits[-1] &= (0xFF << (8 - self.piece_count % 8)) & 0xFF  # 末尾凑整的位不算
+        self._completed = int.from_bytes(self._bits, 'big').bit_count()
+        self.dirty = False  # 有变化还没落库
+
+    def piece_range(self, index: int) -> Tuple[int, int]:
+        """第index片的 (起始字节, 结束字节)，闭区间"""
+        start = index * self.piece_size
+        return start, min(start + self.piece_size, self.total_size) - 1
+
+    def piece_length(self, index: int) -> int:
+        start, end = self.piece_range(index)
+        return end - start + 1
+
+    def has(self, index: int) -> bool:
+        return bool(self._bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def set(self, index: int):
+        if not self.has(index):
+            self._bits[index >> 3] |= 0x80 >> (index & 7)
+            self._completed += 1
+            self.dirty = True
+
+    def clear(self):
+        """全部作废（临时文件丢了）"""
+        self._bits = bytearray(len(self._bits))
+        self._completed = 0
+        self.dirty = True
+
+    def next_missing(self, start: int = 0) -> Optional[int]:
+        """从start开始第一个没下完的片，没有了返回None（整字节全满的直接跳过）"""
+        if start >= self.piece_count:
+            return None
+        byte_index = start >> 3
+        byte = self._bits[byte_index] | ~(0xFF >> (start & 7)) & 0xFF  # start前面的位当成已下完
+        while byte == 0xFF:
+            byte_index += 1
+            if byte_index >= len(self._bits):
+                return None
+            byte = self._bits[byte_index]
+        index = byte_index * 8 + (8 - (~byte & 0xFF).bit_length())
+        return index if index < self.piece_count else None
+
+    def missing(self) -> Iterator[int]:
+        """还没下完的片（按顺序）"""
+        index = self.next_missing()
+        while index is not None:
+            yield index
+            index = self.next_missing(index + 1)
+
+    def completed_count(self) -> int:
+        return self._completed
+
+    def completed_bytes(self) -> int:
+        """已完成的字节数（最后一片可能不满）"""
+        if not self._completed:
+            return 0
+        last = self.piece_count - 1
+        if self.has(last):
+            return (self._completed - 1) * self.piece_size + self.piece_length(last)
+        return self._completed * self.piece_size
+
+    def missing_count(self) -> int:
+        return self.piece_count - self._completed
+
+    def is_complete(self) -> bool:
+        return self._completed == self.piece_count
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+引擎调度器
+老王说：一个任务开三个线程盯着，一千个任务就是三千个线程，这谁顶得住？
+所有任务的完成事件、进度tick、状态流转统一丢进一个事件队列，一个线程全包了！
+"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """单线程事件循环（事件队列 + 定时器 + 进度tick）"""
+
+    def __init__(self, tick_interval: float = 1.0):
+        """
+        Args:
+            tick_interval: 进度tick间隔（秒）
+        """
+        self.tick_interval = tick_interval
+        self._events = queue.Queue()
+        self._timers = []  # 小顶堆 [(到期时间, 序号, callback, args), ...]
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._stopped = False  # stop()过了就不再启动（退出后才到的回调直接丢掉）
+        self._start_lock = threading.Lock()
+
+        # tick回调；tick_active返回False时不tick，空闲时线程一直睡在队列上
+        self._tick_callback: Optional[Callable] = None
+        self._tick_active: Optional[Callable[[], bool]] = None
+        self._next_tick = 0.0
+
+    def set_tick_callback(self, callback: Callable, active: Callable[[], bool]):
+        """
+        设置进度tick回调
+        Args:
+            callback: 每个tick调用一次，无参数
+            active: 返回是否需要tick（没有活动任务时返回False）
+        """
+        self._tick_callback = callback
+        self._tick_active = active
+
+    def start(self) -> bool:
+        """
+        启动调度线程（重复调用无副作用）
+        Returns:
+            False表示已经stop过了，不会再启动
+        """
+        with self._start_lock:
+            if self._stopped:
+                return False
+            if not self._running:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name="engine-supervisor", daemon=True)
+                self._thread.start()
+            return True
+
+    def stop(self):
+        """
+        停止调度线程（之后投递的事件都丢掉）
+        老王说：退出后下载线程的完成回调还会陆续投过来，要是又把循环拉起来，
+        老线程还没退干净，两个线程抢一个队列，调度线程只能有一个的前提就全完了！
+        """
+        with self._start_lock:
+            self._stopped = True
+            if not self._running:
+                return
+            self._running = False
+        self._events.put(None)  # 唤醒
+
+    def post(self, callback: Callable, *args):
+        """投递一个事件，在调度线程中执行 callback(*args)（任何线程都能调；stop之后投递的丢掉）"""
+        if not self.start():
+            logger.debug("调度器已停止，丢弃事件: %s", getattr(callback, '__name__', callback))
+            return
+        self._events.put((callback, args))
+
+    def call_later(self, delay: float, callback: Callable, *args):
+        """delay秒后在调度线程中执行 callback(*args)"""
+        self.post(self._add_timer, time.monotonic() + max(0.0, delay), callback, args)
+
+    def is_current_thread(self) -> bool:
+        """当前是否在调度线程中"""
+        return threading.current_thread() is self._thread
+
+    def _add_timer(self, due: float, callback: Callable, args: tuple):
+        heapq.heappush(self._timers, (due, next(self._seq), callback, args))
+
+    def _compute_timeout(self) -> Optional[float]:
+        """计算下一次需要醒来的时间，None表示一直等事件"""
+        now = time.monotonic()
+        deadlines = []
+        if self._timers:
+            deadlines.append(self._timers[0][0])
+        if self._tick_callback and self._tick_active and self._tick_active():
+            if self._next_tick <= 0:
+                self._next_tick = now + self.tick_interval
+            deadlines.append(self._next_tick)
+        else:
+            self._next_tick = 0.0
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def _run(self):
+        """事件循环主体"""
+        while self._running:
+            try:
+                event = self._events.get(timeout=self._compute_timeout())
+            except queue.Empty:
+                event = None
+
+            if event is not None:
+                callback, args = event
+                self._safe_call(callback, args)
+
+            now = time.monotonic()
+            # 到期的定时器
+            while self._timers and self._timers[0][0] <= now:
+                _, _, callback, args = heapq.heappop(self._timers)
+                self._safe_call(callback, args)
+
+            # 进度tick
+            if self._next_tick and now >= self._next_tick:
+                self._next_tick = now + self.tick_interval
+                self._safe_call(self._tick_callback, ())
+
+    @staticmethod
+    def _safe_call(callback: Callable, args: tuple):
+        """执行回调，异常不能把整个调度线程带走"""
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.exception("调度事件处理失败: %s", e)
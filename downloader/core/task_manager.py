@@ -3,10 +3,19 @@
 任务管理器
 老王说：队列管理得井井有条，不然乱套了！
 """
+import logging
+import os
 import threading
 from typing import List, Dict, Optional, Callable
 from downloader.core.download_engine import DownloadEngine
+from downloader.core.library_check import LibraryCheck
 from downloader.database.db_manager import DatabaseManager
+from downloader.utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+TASKS_RUNNING = metrics.Gauge('downloader_tasks_running', '占着并发名额的任务数')
+TASKS_FINISHED = metrics.Counter('downloader_tasks_finished_total', '结束的下载任务数（按最终状态）', ['status'])
 
 
 class TaskManager:
@@ -22,18 +31,49 @@ class TaskManager:
         """
         self.engine = engine
         self.db = db_manager
+        self.tasks = engine.tasks  # 和引擎共用一份任务缓存
         self.max_concurrent = max_concurrent
 
         self._lock = threading.Lock()
         self._running_tasks = set()  # 正在下载的任务ID集合
+        self._resume_waiting: List[str] = []  # 点了继续但名额满了、排队等着继续的暂停任务（先到先继续）
+        self._shutting_down = False  # 退出中：让出的名额不再启动新任务
+        TASKS_RUNNING.set_function(lambda: len(self._running_tasks))
 
         # 回调函数
         self.task_added_callback: Optional[Callable] = None
         self.task_status_changed_callback: Optional[Callable] = None
+        self.statistics_callback: Optional[Callable] = None
+
+        # 统计变化由任务缓存推过来，UI不用再轮询
+        self.tasks.add_stats_listener(self._on_stats_changed)
 
         # 设置引擎的状态回调
         self.engine.set_status_callback(self._on_engine_status_change)
 
+        # 批量校验下载库（和下载完的校验共用一个校验队列）
+        self.library = LibraryCheck(self.tasks, db_manager, engine.verifier)
+        self.library.status_callback = self._on_library_status_change
+
+        # 上次进程被杀/崩溃时还标着下载中的任务改回暂停，不然永远卡在“下载中”点不动
+        # （单实例锁保证没有别的引擎在下它们；分块断点按临时文件大小算，续传不丢数据）
+        for task in self.tasks.get_all_tasks(status='downloading'):
+            self.tasks.update_task_status(task['task_id'], 'paused')
+
+        # 上次退出时还没校验完的任务，重新排队校验（文件被挪走了就只能算失败）
+        for task in self.tasks.get_all_tasks(status='verifying'):
+            if not self.engine.verify_task(task['task_id']):
+                self.tasks.update_task_status(task['task_id'], 'failed', '文件不存在，无法校验')
+
+        # 上次退出时还没探测完的占位任务，接着探测
+        for task in self.tasks.get_all_tasks(status='probing'):
+            self.engine.probe_task_async(task['task_id'])
+
+    @property
+    def config(self):
+        """配置管理器（和引擎共用）"""
+        return self.engine.config
+
     def set_task_added_callback(self, callback: Callable):
         """设置任务添加回调"""
         self.task_added_callback = callback
@@ -42,23 +82,48 @@ class TaskManager:
         """设置任务状态变更回调"""
         self.task_status_changed_callback = callback
 
+    def set_progress_callback(self, callback: Callable):
+        """
+        设置进度回调（下载中每个tick一次）
+        Args:
+            callback: 回调函数，签名为 callback(task_id, downloaded_size, total_size, speed)
+        """
+        self.engine.set_progress_callback(callback)
+
+    def set_library_callback(self, callback: Callable):
+        """
+        设置批量校验进度回调
+        Args:
+            callback: 回调函数，签名为 callback(summary)，summary['running']为False表示查完了
+        """
+        self.library.progress_callback = callback
+
+    def set_statistics_callback(self, callback: Callable):
+        """
+        设置统计变化回调（状态切换、下载中每秒一次；空闲时不会被调用）
+        Args:
+            callback: 回调函数，签名为 callback(stats)，stats同get_statistics()并多一个open_hosts
+        """
+        self.statistics_callback = callback
+
     def add_task(self, url: str, filename: Optional[str] = None,
                  save_path: Optional[str] = None,
                  expected_hash: Optional[str] = None,
                  hash_type: str = "md5") -> Optional[str]:
         """
-        添加下载任务
+        添加下载任务（立即返回占位任务，文件信息在后台探测）
+        探测完成后任务通过状态回调变成pending（随后自动排队下载）或failed
         Args:
             url: 下载链接
             filename: 文件名（可选）
             save_path: 保存路径（可选）
             expected_hash: 预期哈希值（可选，用于下载后校验）
-            hash_type: 哈希类型（md5/sha256）
+            hash_type: 哈希类型（md5/sha1/sha256/sha512/blake2b/blake3/crc32）
         Returns:
             任务ID，失败返回None
         """
-        # 创建任务
-        task_id = self.engine.create_download_task(url, filename, save_path, expected_hash, hash_type)
+        # 创建占位任务（不碰网络）
+        task_id = self.engine.create_probing_task(url, filename, save_path, expected_hash, hash_type)
         if not task_id:
             return None
 
@@ -66,8 +131,8 @@ class TaskManager:
         if self.task_added_callback:
             self.task_added_callback(task_id)
 
-        # 尝试启动任务
-        self._try_start_next_task()
+        # 后台探测，探测完了在状态回调里排队启动
+        self.engine.probe_task_async(task_id)
 
         return task_id
 
@@ -79,7 +144,7 @@ class TaskManager:
         Returns:
             True表示成功，False表示失败
         """
-        task = self.db.get_task(task_id)
+        task = self.tasks.get_task(task_id)
         if not task:
             return False
 
@@ -87,10 +152,17 @@ class TaskManager:
         if task['status'] not in ('pending', 'paused', 'failed'):
             return False
 
+        # 连文件信息都没探测成功的任务，重试就是重新探测
+        if task['status'] == 'failed' and not task['total_size']:
+            return self._reprobe_task(task_id)
+
         # 检查并发限制
         with self._lock:
+            if task_id in self._running_tasks:
+                # 两个线程同时从等待队列里挑中了同一个任务，别的线程已经启动它了（再启动就下两遍、合并两遍）
+                return False
             if len(self._running_tasks) >= self.max_concurrent:
-                print(f"[提示] 已达到最大并发数，任务将等待: {task_id}")
+                logger.info("已达到最大并发数，任务将等待: %s", task_id)
                 return False
 
             self._running_tasks.add(task_id)
@@ -105,16 +177,59 @@ class TaskManager:
 
         return success
 
+    def _reprobe_task(self, task_id: str) -> bool:
+        """把探测失败的任务重新放回后台探测"""
+        if not self.tasks.update_task_status(task_id, 'probing'):
+            return False
+        if self.task_status_changed_callback:
+            self.task_status_changed_callback(task_id, 'probing', '获取文件信息')
+        self.engine.probe_task_async(task_id)
+        return True
+
     def pause_task(self, task_id: str) -> bool:
-        """暂停任务"""
+        """暂停任务（排队等着继续的也不排了）"""
+        with self._lock:
+            if task_id in self._resume_waiting:
+                self._resume_waiting.remove(task_id)
         return self.engine.pause_download(task_id)
 
     def resume_task(self, task_id: str) -> bool:
-        """继续任务"""
-        return self.engine.resume_download(task_id)
+        """
+        继续任务
+        暂停的任务已经把并发名额让出去了，继续时得重新占一个；
+        名额满了就排队（还是暂停状态），有任务让出名额时按点继续的先后接着下
+        Returns:
+            True表示已经继续下载，False表示没继续（排队了或者失败）
+        """
+        with self._lock:
+            full = task_id not in self._running_tasks and len(self._running_tasks) >= self.max_concurrent
+            newly_queued = full and task_id not in self._resume_waiting
+            if newly_queued:
+                self._resume_waiting.append(task_id)
+            elif not full:
+                self._running_tasks.add(task_id)
+                if task_id in self._resume_waiting:
+                    self._resume_waiting.remove(task_id)
+        if full:
+            if newly_queued:
+                logger.info("已达到最大并发数，排队等待继续: %s", task_id)
+                if self.task_status_changed_callback:
+                    self.task_status_changed_callback(task_id, 'paused', '已达到最大并发数，排队等待继续')
+            return False
+
+        success = self.engine.resume_download(task_id)
+
+        if not success:
+            with self._lock:
+                self._running_tasks.discard(task_id)
+
+        return success
 
     def cancel_task(self, task_id: str) -> bool:
         """取消任务"""
+        with self._lock:
+            if task_id in self._resume_waiting:
+                self._resume_waiting.remove(task_id)
         success = self.engine.cancel_download(task_id)
         if success:
             with self._lock:
@@ -122,35 +237,127 @@ class TaskManager:
             self._try_start_next_task()
         return success
 
-    def delete_task(self, task_id: str) -> bool:
+    def delete_task(self, task_id: str, delete_files: bool = False) -> bool:
         """
         删除任务
         Args:
             task_id: 任务ID
+            delete_files: 同时删除已下载的文件和临时分块文件
         Returns:
             True表示成功，False表示失败
         """
+        task = self.tasks.get_task(task_id)
+
         # 先取消下载
         self.cancel_task(task_id)
 
+        # 删除文件（如果要求了）
+        if delete_files and task and task['save_path']:
+            try:
+                if os.path.exists(task['save_path']):
+                    os.remove(task['save_path'])
+                    logger.info("文件已删除: %s", task['save_path'], extra={'task_id': task_id})
+
+                # 删除临时分块文件
+                if task['support_range']:
+                    for chunk in self.db.get_chunks(task_id):
+                        if chunk['temp_file'] and os.path.exists(chunk['temp_file']):
+                            os.remove(chunk['temp_file'])
+                    piece_map = self.db.get_piece_map(task_id)
+                    if piece_map and os.path.exists(piece_map['temp_file']):
+                        os.remove(piece_map['temp_file'])
+            except Exception as e:
+                logger.error("删除文件失败: %s: %s", task_id, e, extra={'task_id': task_id})
+
         # 删除数据库记录
-        return self.db.delete_task(task_id)
+        tracing.discard(task_id)
+        return self.tasks.delete_task(task_id)
+
+    def verify_library(self, rehash: bool = False, restart: bool = False) -> bool:
+        """
+        批量校验所有下完的任务（后台进行，进度走set_library_callback）
+        Args:
+            rehash: 不用哈希缓存全部重读（怀疑盘坏了用这个）
+            restart: 上一轮没查完也从头查
+        Returns:
+            False表示已经在查了
+        """
+        return self.library.start(rehash=rehash, restart=restart)
+
+    def is_library_running(self) -> bool:
+        """批量校验是不是还在进行"""
+        return self.library.is_running()
+
+    def get_library_report(self) -> Dict:
+        """最近一轮批量校验的结果（含损坏/丢失的任务ID）"""
+        return self.library.report()
+
+    def redownload_tasks(self, task_ids: List[str]) -> int:
+        """
+        重新下载（批量校验查出来坏了/丢了的文件）：从探测开始重来，下完覆盖原文件
+        Returns:
+            重新排上队的任务数
+        """
+        count = 0
+        for task_id in task_ids:
+            task = self.tasks.get_task(task_id)
+            if not task or task['status'] not in ('completed', 'verify_failed'):
+                continue
+            self.tasks.update_task_progress(task_id, 0, 0)
+            if task['expected_hash']:
+                self.tasks.update_task_hash(task_id, None, 0)
+            if self._reprobe_task(task_id):
+                count += 1
+        return count
+
+    def _on_library_status_change(self, task_id: str, status: str, message: str):
+        """批量校验改了任务状态：只通知界面，不动并发名额"""
+        if self.task_status_changed_callback:
+            self.task_status_changed_callback(task_id, status, message)
 
     def get_task(self, task_id: str) -> Optional[Dict]:
         """获取任务详情"""
-        return self.db.get_task(task_id)
+        return self.tasks.get_task(task_id)
 
     def get_all_tasks(self) -> List[Dict]:
         """获取所有任务"""
-        return self.db.get_all_tasks()
+        return self.tasks.get_all_tasks()
+
+    def query_tasks(self, cursor=None, limit: int = 50, **filters):
+        """
+        分页查询任务（按创建时间倒序）
+        Args:
+            cursor: 上一页返回的游标，None表示第一页
+            limit: 每页条数
+            **filters: status/host/created_after/created_before/filename_prefix
+        Returns:
+            (本页任务列表, 下一页游标)
+        """
+        return self.tasks.query_tasks(cursor=cursor, limit=limit, **filters)
+
+    def query_history(self, cursor=None, limit: int = 100):
+        """
+        分页查询下载历史（按完成时间倒序）
+        Returns:
+            (本页历史记录, 下一页游标)
+        """
+        return self.db.query_history(cursor=cursor, limit=limit)
+
+    def clear_history(self) -> bool:
+        """清空下载历史"""
+        return self.db.clear_history()
+
+    def get_host_stats(self) -> Dict[str, Dict]:
+        """获取各主机的健康状态（熔断/并发上限/错误率）"""
+        return self.engine.get_host_stats()
 
     def get_downloading_tasks(self) -> List[Dict]:
         """获取正在下载的任务"""
-        return self.db.get_all_tasks(status='downloading')
+        return self.tasks.get_all_tasks(status='downloading')
 
     def get_pending_tasks(self) -> List[Dict]:
         """获取等待中的任务"""
-        return self.db.get_all_tasks(status='pending')
+        return self.tasks.get_all_tasks(status='pending')
 
     def pause_all(self) -> int:
         """
@@ -171,7 +378,7 @@ class TaskManager:
         Returns:
             继续的任务数量
         """
-        paused_tasks = self.db.get_all_tasks(status='paused')
+        paused_tasks = self.tasks.get_all_tasks(status='paused')
         count = 0
         for task in paused_tasks:
             if self.resume_task(task['task_id']):
@@ -179,23 +386,45 @@ class TaskManager:
         return count
 
     def _try_start_next_task(self):
-        """尝试启动下一个等待中的任务"""
+        """尝试启动下一个等待中的任务（排队等着继续的暂停任务优先，它们是用户点过的）"""
         with self._lock:
-            if len(self._running_tasks) >= self.max_concurrent:
+            if self._shutting_down or len(self._running_tasks) >= self.max_concurrent:
+                return
+            waiting = list(self._resume_waiting)
+
+        for task_id in waiting:
+            task = self.tasks.get_task(task_id)
+            if not task or task['status'] != 'paused':
+                with self._lock:
+                    if task_id in self._resume_waiting:
+                        self._resume_waiting.remove(task_id)  # 被删了/已经用别的方式启动了
+                continue
+            if self.resume_task(task_id):
                 return
 
-        # 获取等待中的任务
-        pending_tasks = self.get_pending_tasks()
-        if pending_tasks:
-            task = pending_tasks[0]
-            self.start_task(task['task_id'])
+        # 获取等待中的任务（排在前面的被别的线程抢先启动了就接着往后挑）
+        for task in self.get_pending_tasks():
+            with self._lock:
+                if len(self._running_tasks) >= self.max_concurrent:
+                    return
+                if task['task_id'] in self._running_tasks:
+                    continue
+            if self.start_task(task['task_id']):
+                return
 
     def _on_engine_status_change(self, task_id: str, status: str, message: str):
         """引擎状态变更回调"""
-        # 如果任务完成或失败，从运行集合中移除
-        if status in ('completed', 'failed', 'cancelled'):
+        # 如果任务完成、失败或暂停，从运行集合中移除（暂停的任务不占线程也不占名额）
+        # 下完了在排队校验的也让出名额：校验只读本地盘，别让下一个任务干等着
+        if status in ('completed', 'failed', 'cancelled', 'paused', 'verify_failed', 'verifying'):
             with self._lock:
                 self._running_tasks.discard(task_id)
+            if status not in ('paused', 'verifying'):
+                TASKS_FINISHED.labels(status).inc()
+            # 抽中追踪的任务：结束时写出时间线（暂停也写一份，继续下载接着记；校验完再写）
+            if status != 'verifying':
+                task = self.tasks.get_task(task_id)
+                tracing.export(task_id, label=task['filename'] if task else '', keep=status == 'paused')
 
             # 尝试启动下一个任务
             self._try_start_next_task()
@@ -204,6 +433,10 @@ class TaskManager:
         if self.task_status_changed_callback:
             self.task_status_changed_callback(task_id, status, message)
 
+        # 占位任务探测完成，排队启动（先把pending通知出去，别让外面先看到downloading）
+        if status == 'pending':
+            self._try_start_next_task()
+
     def set_max_concurrent(self, max_concurrent: int):
         """
         设置最大并发数
@@ -216,7 +449,7 @@ class TaskManager:
 
     def get_statistics(self) -> Dict:
         """
-        获取统计信息
+        获取统计信息（计数在内存里增量维护，不扫任务表）
         Returns:
             {
                 'total': 总任务数,
@@ -224,40 +457,43 @@ class TaskManager:
                 'pending': 等待中,
                 'paused': 已暂停,
                 'completed': 已完成,
-                'failed': 失败
+                'failed': 失败,
+                'cancelled': 已取消,
+                'total_speed': 总速度（字节/秒）
             }
         """
-        all_tasks = self.get_all_tasks()
-        stats = {
-            'total': len(all_tasks),
-            'downloading': 0,
-            'pending': 0,
-            'paused': 0,
-            'completed': 0,
-            'failed': 0,
-            'cancelled': 0
-        }
-
-        for task in all_tasks:
-            status = task['status']
-            if status in stats:
-                stats[status] += 1
+        return self.tasks.get_statistics()
 
-        return stats
+    def _on_stats_changed(self, stats: Dict):
+        """任务缓存统计变化回调：补上主机熔断信息再转给外部"""
+        if self.statistics_callback:
+            stats['open_hosts'] = [host for host, state in self.get_host_stats().items()
+                                   if state['state'] != 'closed']
+            self.statistics_callback(stats)
 
     def shutdown(self):
         """
-        程序退出清理
+        程序退出清理：还在下的任务暂停（不是取消），下次启动/--resume 接着下
 
         老王说：点了退出就得真退出，别让线程池把进程吊着不放，恶心！
         """
-        # 先取消所有正在活跃的下载（避免ThreadPoolExecutor线程阻塞进程退出）
-        active_task_ids = list(self.engine.active_downloaders.keys())
-        for task_id in active_task_ids:
+        # 先挂上退出标志：下面暂停让出来的名额别又把排队的任务拉起来（拉起来紧接着就被掐，白下）
+        with self._lock:
+            self._shutting_down = True
+            self._resume_waiting.clear()
+
+        # 活跃的下载全部暂停（分块线程记完断点自己退出，避免ThreadPoolExecutor线程阻塞进程退出）
+        for task_id in list(self.engine.active_downloaders.keys()):
+            task = self.tasks.get_task(task_id)
+            if task and task['status'] == 'paused':
+                continue  # 已经暂停了，线程还在记断点退出
             try:
-                self.engine.cancel_download(task_id)
+                self.engine.pause_download(task_id)
             except Exception as e:
-                print(f"[错误] 取消任务失败: {task_id}, err={e}")
+                logger.error("暂停任务失败: %s: %s", task_id, e, extra={'task_id': task_id})
+
+        # 批量校验查完的结果先落库（没查的下次接着查）
+        self.library.stop()
 
         # 再兜底清理引擎资源
         try:
@@ -265,3 +501,5 @@ class TaskManager:
         finally:
             with self._lock:
                 self._running_tasks.clear()
+            # 进度都落完库了，关掉共用连接（WAL日志顺手并回主库）
+            self.db.close()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+校验队列
+老王说：几个任务一起下完，各自从头把整个文件读一遍算哈希，磁头来回跳，谁都快不了！
+校验统一排队：同一块盘上同时只算 verify_workers_per_device 个，不同的盘各排各的；
+用自己的线程，不占下载线程池，校验的时候别的任务照样满速下。
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from downloader.utils.file_utils import calculate_file_hash
+
+logger = logging.getLogger(__name__)
+
+# 进度回调的最短间隔（秒），别每读一块就刷一次界面
+PROGRESS_INTERVAL = 0.5
+
+
+def get_device_id(path: str) -> int:
+    """文件所在的存储设备（拿不到就都算同一块盘）"""
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return 0
+
+
+class VerifyQueue:
+    """按存储设备分队的哈希计算线程池"""
+
+    def __init__(self, workers_per_device: int = 1):
+        """
+        Args:
+            workers_per_device: 每块盘同时算几个文件（机械盘1个最快，SSD可以多开）
+        """
+        self.workers_per_device = max(1, workers_per_device)
+        self._pools: Dict[int, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+        self._pending = 0  # 排队中 + 正在算的
+        self._stopped = False
+
+    def pending_count(self) -> int:
+        return self._pending
+
+    def is_stopped(self) -> bool:
+        """已经shutdown了（这之后回调里拿到的空哈希是被掐掉的，不是算失败）"""
+        return self._stopped
+
+    def submit(self, file_path: str, hash_type: str, done_callback: Callable[[str, float], None],
+               progress_callback: Optional[Callable[[int, int, float], None]] = None, use_cache: bool = True):
+        """
+        排队计算文件哈希
+        Args:
+            done_callback: callback(actual_hash, elapsed)，在校验线程里调用；算失败时actual_hash是空串，
+                           elapsed是真正算哈希的秒数（不含排队）；一定会调一次，
+                           shutdown时掐掉的/shutdown之后才交进来的也回调空串（后者直接在调用方线程里）
+            progress_callback: callback(processed_bytes, total_bytes, bytes_per_second)
+            use_cache: 先查哈希缓存，False表示强制重读
+        """
+        device = get_device_id(file_path)
+        # 是否已停和计数必须在同一把锁里定下来：锁外再看_stopped，shutdown刚好插进来就白加了一个计数
+        with self._lock:
+            stopped = self._stopped
+            if not stopped:
+                pool = self._pools.get(device)
+                if pool is None:
+                    pool = self._pools[device] = ThreadPoolExecutor(
+                        max_workers=self.workers_per_device, thread_name_prefix=f"verify-{len(self._pools)}")
+                self._pending += 1
+        if stopped:
+            done_callback('', 0.0)
+            return
+        try:
+            future = pool.submit(self._run, file_path, hash_type, done_callback, progress_callback, use_cache)
+        except RuntimeError:
+            # 刚好碰上shutdown把线程池关了
+            self._on_cancelled(done_callback)
+            return
+        future.add_done_callback(lambda f: f.cancelled() and self._on_cancelled(done_callback))
+
+    def _on_cancelled(self, done_callback: Callable[[str, float], None]):
+        """排队中被shutdown掐掉的：计数减掉，回调一声"""
+        with self._lock:
+            self._pending -= 1
+        done_callback('', 0.0)
+
+    def _run(self, file_path: str, hash_type: str, done_callback: Callable[[str, float], None],
+             progress_callback: Optional[Callable[[int, int, float], None]], use_cache: bool):
+        start = time.monotonic()
+        last_report = start
+
+        def on_progress(processed: int, total: int) -> bool:
+            nonlocal last_report
+            if self._stopped:
+                return False  # 退出了，读到一半的也不算了
+            now = time.monotonic()
+            if progress_callback and (now - last_report >= PROGRESS_INTERVAL or processed >= total):
+                last_report = now
+                progress_callback(processed, total, processed / max(now - start, 1e-6))
+            return True
+
+        try:
+            actual_hash = calculate_file_hash(file_path, hash_type, on_progress, use_cache=use_cache)
+        except Exception as e:
+            logger.exception("计算哈希异常: %s: %s", file_path, e)
+            actual_hash = ''
+        finally:
+            with self._lock:
+                self._pending -= 1
+        done_callback(actual_hash, time.monotonic() - start)
+
+    def shutdown(self):
+        """
+        退出时不等校验算完：排队的直接掐掉，正在算的读完手上这块就停（都回调空串，调用方用is_stopped区分）
+        没算完的任务还是verifying状态，下次启动重新排队
+        """
+        with self._lock:
+            self._stopped = True
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
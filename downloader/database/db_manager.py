@@ -3,11 +3,54 @@
 数据库管理模块
 老王说：这玩意儿是整个项目的底层基础，千万别给我写出bug！
 """
+import functools
+import json
+import logging
 import sqlite3
 import os
+import time
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 import threading
+from urllib.parse import urlparse
+
+from downloader.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 表结构版本（存在 PRAGMA user_version 里）；改了表结构/索引记得加1，不然老库不会升级
+SCHEMA_VERSION = 8
+
+DB_WRITE_SECONDS = metrics.Histogram('downloader_db_write_seconds', '写库耗时（含等锁）', ['op'],
+                                     buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+DB_INFLIGHT_WRITES = metrics.Gauge('downloader_db_inflight_writes', '正在写库/排队等锁的写操作数')
+
+
+def get_url_host(url: str) -> str:
+    """从URL提取主机标识（host:port，小写）"""
+    try:
+        return urlparse(url).netloc.lower()
+    except Exception:
+        return ''
+
+
+def _timed_write(method):
+    """写操作计时：等锁的时间也算进去，锁争用一眼就能看出来"""
+    op = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not metrics.is_enabled():
+            return method(self, *args, **kwargs)
+        inflight = DB_INFLIGHT_WRITES.labels()
+        inflight.inc()
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            DB_WRITE_SECONDS.labels(op).observe(time.perf_counter() - start)
+            inflight.dec()
+    return wrapper
 
 
 class DatabaseManager:
@@ -21,6 +64,7 @@ class DatabaseManager:
         """
         self.db_path = db_path
         self._lock = threading.Lock()  # 艹，多线程访问必须加锁
+        self._conn: Optional[sqlite3.Connection] = None  # 整个进程共用的连接（只在持锁时用）
         self._ensure_db_dir()
         self._init_database()
 
@@ -30,18 +74,45 @@ class DatabaseManager:
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
+    def _connect(self) -> sqlite3.Connection:
+        """新开一个数据库连接"""
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row  # 返回字典形式的查询结果
         return conn
 
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        获取数据库连接（调用方持self._lock）
+        老王说：一千个小文件，每个状态切换都开一次连接、提交一次刷几遍盘，时间全耗在这上面了！
+        所有操作本来就排在一把锁后面，干脆共用一个连接；日志用WAL，提交只是往日志末尾追加，
+        synchronous=NORMAL下断电最多丢最后几次提交（断点只会往回退，不会超过盘上真有的数据），库不会坏。
+        """
+        if self._conn is None:
+            self._conn = self._connect()
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        elif self._conn.in_transaction:
+            # 上一次操作中途出错没提交，回滚掉，别被这次的提交一起带进库里
+            self._conn.rollback()
+        return self._conn
+
+    def close(self):
+        """关掉共用的连接（退出时调用；之后再有读写会重新连上）"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
     def _init_database(self):
         """初始化数据库表结构"""
         with self._lock:
             conn = self._get_connection()
             cursor = conn.cursor()
 
+            # 版本对得上就说明表、字段、索引都齐了，一条条CREATE/ALTER检查全省掉（启动快）
+            if cursor.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                return
+
             # 任务表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS download_tasks (
@@ -91,8 +162,65 @@ class DatabaseManager:
                 )
             ''')
 
+            # 主机画像表（每个任务下完更新一次，下次同一主机的任务直接按它定线程数/分块）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS host_profiles (
+                    host TEXT PRIMARY KEY,
+                    final_host TEXT,
+                    redirected INTEGER DEFAULT 0,
+                    support_range INTEGER,
+                    samples INTEGER DEFAULT 0,
+                    avg_throughput REAL DEFAULT 0,
+                    best_thread_count INTEGER,
+                    best_throughput REAL DEFAULT 0,
+                    max_thread_count INTEGER,
+                    connection_limit INTEGER,
+                    ttfb REAL DEFAULT 0,
+                    error_rate REAL DEFAULT 0,
+                    range_refused_path TEXT,
+                    range_ok_path TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # 分片表（一个任务一行：片完成情况是一段位图，下了一半的片记在partial里，断点一次写完）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS download_pieces (
+                    task_id TEXT PRIMARY KEY,
+                    piece_size INTEGER NOT NULL,
+                    piece_count INTEGER NOT NULL,
+                    bitfield BLOB NOT NULL,
+                    partial TEXT,
+                    temp_file TEXT NOT NULL,
+                    retry_count INTEGER DEFAULT 0,
+                    FOREIGN KEY (task_id) REFERENCES download_tasks(task_id) ON DELETE CASCADE
+                )
+            ''')
+
+            # 文件哈希缓存（路径+大小+修改时间+inode都对得上才算数，一个文件每种哈希一行）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT NOT NULL,
+                    hash_type TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (path, hash_type)
+                )
+            ''')
+
+            # 批量校验进度（一次校验一批：开始时把要查的任务都插进来，查完一个填一个结果，中断了接着查没结果的）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS library_checks (
+                    task_id TEXT PRIMARY KEY,
+                    result TEXT,
+                    checked_at TIMESTAMP
+                )
+            ''')
+
             # 创建索引
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_status ON download_tasks(status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_task ON download_chunks(task_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_status ON download_chunks(task_id, status)')
 
@@ -107,15 +235,55 @@ class DatabaseManager:
                 cursor.execute("ALTER TABLE download_tasks ADD COLUMN actual_hash TEXT")
                 cursor.execute("ALTER TABLE download_tasks ADD COLUMN hash_verified INTEGER DEFAULT 0")
 
+            # 兼容老版本数据库：添加主机字段（列表按主机筛选用），老数据从url回填
+            try:
+                cursor.execute("SELECT host FROM download_tasks LIMIT 1")
+            except sqlite3.OperationalError:
+                cursor.execute("ALTER TABLE download_tasks ADD COLUMN host TEXT")
+                rows = cursor.execute("SELECT task_id, url FROM download_tasks").fetchall()
+                cursor.executemany("UPDATE download_tasks SET host = ? WHERE task_id = ?",
+                                   [(get_url_host(row['url']), row['task_id']) for row in rows])
+
+            # 兼容老版本数据库：主机画像记下Range被无视的目录（老画像的“不支持”没有目录，不再拿来盖响应头）
+            try:
+                cursor.execute("SELECT range_refused_path FROM host_profiles LIMIT 1")
+            except sqlite3.OperationalError:
+                cursor.execute("ALTER TABLE host_profiles ADD COLUMN range_refused_path TEXT")
+
+            # 兼容老版本数据库：主机画像记下拿到过206的目录（老画像的“支持”没有目录，不再拿来盖响应头）
+            try:
+                cursor.execute("SELECT range_ok_path FROM host_profiles LIMIT 1")
+            except sqlite3.OperationalError:
+                cursor.execute("ALTER TABLE host_profiles ADD COLUMN range_ok_path TEXT")
+
+            # 兼容老版本数据库：分片下载的重试次数按任务记在分片表里（片没有分块记录）
+            try:
+                cursor.execute("SELECT retry_count FROM download_pieces LIMIT 1")
+            except sqlite3.OperationalError:
+                cursor.execute("ALTER TABLE download_pieces ADD COLUMN retry_count INTEGER DEFAULT 0")
+
+            # 分页查询用的索引（排序键都带上task_id，保证翻页游标唯一）
+            # 老王说：几万条任务按created_at排序没索引，每次都全表排序，启动能慢死人！
+            cursor.execute('DROP INDEX IF EXISTS idx_task_status')  # 被下面的(status, created_at)覆盖了
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_created ON download_tasks(created_at, task_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_status_created ON download_tasks(status, created_at, task_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_host_created ON download_tasks(host, created_at, task_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_filename ON download_tasks(filename, created_at, task_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_completed ON download_history(completed_at, id)')
+
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             conn.commit()
-            conn.close()
 
     # ==================== 任务表操作 ====================
 
+    @_timed_write
     def create_task(self, task_id: str, url: str, filename: str, save_path: str,
-                    total_size: int = 0, support_range: bool = True, thread_count: int = 8) -> bool:
+                    total_size: int = 0, support_range: bool = True, thread_count: int = 8,
+                    status: str = 'pending') -> bool:
         """
         创建下载任务
+        Args:
+            status: 初始状态（还没探测完文件信息的占位任务是probing）
         Returns:
             True表示创建成功，False表示失败
         """
@@ -125,14 +293,14 @@ class DatabaseManager:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO download_tasks
-                    (task_id, url, filename, save_path, total_size, support_range, thread_count)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (task_id, url, filename, save_path, total_size, 1 if support_range else 0, thread_count))
+                    (task_id, url, filename, save_path, total_size, support_range, thread_count, host, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (task_id, url, filename, save_path, total_size, 1 if support_range else 0, thread_count,
+                      get_url_host(url), status))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 创建任务失败: {e}")
+                logger.error("创建任务失败: %s", e)
                 return False
 
     def get_task(self, task_id: str) -> Optional[Dict]:
@@ -142,7 +310,6 @@ class DatabaseManager:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM download_tasks WHERE task_id = ?', (task_id,))
             row = cursor.fetchone()
-            conn.close()
             return dict(row) if row else None
 
     def get_all_tasks(self, status: Optional[str] = None) -> List[Dict]:
@@ -159,24 +326,87 @@ class DatabaseManager:
             else:
                 cursor.execute('SELECT * FROM download_tasks ORDER BY created_at DESC')
             rows = cursor.fetchall()
-            conn.close()
             return [dict(row) for row in rows]
 
-    def update_task_status(self, task_id: str, status: str, error_message: Optional[str] = None) -> bool:
-        """更新任务状态"""
+    def query_tasks(self, status=None, host: Optional[str] = None,
+                    created_after: Optional[str] = None, created_before: Optional[str] = None,
+                    filename_prefix: Optional[str] = None, cursor: Optional[Tuple[str, str]] = None,
+                    limit: int = 50, ids_only: bool = False) -> Tuple[List[Dict], Optional[Tuple[str, str]]]:
+        """
+        分页查询任务（按创建时间倒序，键集分页）
+        Args:
+            status: 状态筛选，字符串或状态列表
+            host: 主机筛选（host:port）
+            created_after: 创建时间下限（含），格式 'YYYY-MM-DD HH:MM:SS'（UTC）
+            created_before: 创建时间上限（不含）
+            filename_prefix: 文件名前缀
+            cursor: 上一页返回的游标，None表示第一页
+            limit: 每页条数
+            ids_only: 只返回task_id和created_at（走覆盖索引，不回表）
+        Returns:
+            (本页记录, 下一页游标)，没有下一页时游标为None
+
+        老王说：翻页别用OFFSET，翻到第一千页就是扫一千页，用上一页最后一条当游标！
+        """
+        conditions = []
+        params = []
+        if status:
+            statuses = [status] if isinstance(status, str) else list(status)
+            conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if host:
+            conditions.append("host = ?")
+            params.append(host.lower())
+        if created_after:
+            conditions.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            conditions.append("created_at < ?")
+            params.append(created_before)
+        if filename_prefix:
+            # 前缀匹配写成范围条件才能用上索引（LIKE默认大小写不敏感，用不上）
+            conditions.append("filename >= ? AND filename < ?")
+            params.extend([filename_prefix, filename_prefix + '\U0010ffff'])
+        if cursor:
+            conditions.append("(created_at, task_id) < (?, ?)")
+            params.extend(cursor)
+
+        columns = "task_id, created_at" if ids_only else "*"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT {columns} FROM download_tasks {where} ORDER BY created_at DESC, task_id DESC LIMIT ?"
+        params.append(limit + 1)  # 多取一条判断有没有下一页
+
+        with self._lock:
+            conn = self._get_connection()
+            rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['task_id'])
+        return rows, next_cursor
+
+    @_timed_write
+    def update_task_status(self, task_id: str, status: str, error_message: Optional[str] = None,
+                           stamp: bool = True) -> bool:
+        """
+        更新任务状态
+        Args:
+            stamp: 是否顺带记开始/完成时间（批量校验把早就下完的改回completed时别动完成时间，不然排序全乱了）
+        """
         with self._lock:
             try:
                 conn = self._get_connection()
                 cursor = conn.cursor()
 
                 # 根据状态更新时间戳
-                if status == 'downloading':
+                if stamp and status == 'downloading':
                     cursor.execute('''
                         UPDATE download_tasks
                         SET status = ?, started_at = CURRENT_TIMESTAMP, error_message = ?
                         WHERE task_id = ?
                     ''', (status, error_message, task_id))
-                elif status == 'completed':
+                elif stamp and status == 'completed':
                     cursor.execute('''
                         UPDATE download_tasks
                         SET status = ?, completed_at = CURRENT_TIMESTAMP, error_message = ?
@@ -190,12 +420,12 @@ class DatabaseManager:
                     ''', (status, error_message, task_id))
 
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 更新任务状态失败: {e}")
+                logger.error("更新任务状态失败: %s", e)
                 return False
 
+    @_timed_write
     def update_task_progress(self, task_id: str, downloaded_size: int, speed: float) -> bool:
         """更新任务进度"""
         with self._lock:
@@ -208,12 +438,36 @@ class DatabaseManager:
                     WHERE task_id = ?
                 ''', (downloaded_size, speed, task_id))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 更新任务进度失败: {e}")
+                logger.error("更新任务进度失败: %s", e)
                 return False
 
+    @_timed_write
+    def update_tasks_progress(self, updates: List[Tuple[str, int, float]]) -> bool:
+        """
+        批量更新任务进度（一次连接一次提交）
+        Args:
+            updates: [(task_id, downloaded_size, speed), ...]
+        """
+        if not updates:
+            return True
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE download_tasks
+                    SET downloaded_size = ?, speed = ?
+                    WHERE task_id = ?
+                ''', [(downloaded_size, speed, task_id) for task_id, downloaded_size, speed in updates])
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("批量更新任务进度失败: %s", e)
+                return False
+
+    @_timed_write
     def update_task_hash(self, task_id: str, actual_hash: str, hash_verified: int) -> bool:
         """
         更新任务哈希校验结果
@@ -233,19 +487,19 @@ class DatabaseManager:
                     WHERE task_id = ?
                 ''', (actual_hash, hash_verified, task_id))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 更新哈希失败: {e}")
+                logger.error("更新哈希失败: %s", e)
                 return False
 
+    @_timed_write
     def set_expected_hash(self, task_id: str, expected_hash: str, hash_type: str) -> bool:
         """
         设置预期哈希值
         Args:
             task_id: 任务ID
             expected_hash: 预期哈希值
-            hash_type: 哈希类型 (md5/sha256)
+            hash_type: 哈希类型 (md5/sha1/sha256/sha512/blake2b/blake3/crc32)
         """
         with self._lock:
             try:
@@ -257,12 +511,37 @@ class DatabaseManager:
                     WHERE task_id = ?
                 ''', (expected_hash.lower() if expected_hash else None, hash_type.lower() if hash_type else None, task_id))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 设置预期哈希失败: {e}")
+                logger.error("设置预期哈希失败: %s", e)
                 return False
 
+    @_timed_write
+    def update_task_probe(self, task_id: str, total_size: int, support_range: bool, thread_count: int) -> bool:
+        """
+        写入探测结果（文件大小、是否支持分块、线程数）
+        Args:
+            task_id: 任务ID
+            total_size: 文件大小
+            support_range: 是否支持Range
+            thread_count: 线程数
+        """
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE download_tasks
+                    SET total_size = ?, support_range = ?, thread_count = ?
+                    WHERE task_id = ?
+                ''', (total_size, 1 if support_range else 0, thread_count, task_id))
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("更新探测结果失败: %s", e)
+                return False
+
+    @_timed_write
     def delete_task(self, task_id: str) -> bool:
         """删除任务（级联删除分块信息）"""
         with self._lock:
@@ -270,15 +549,16 @@ class DatabaseManager:
                 conn = self._get_connection()
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM download_tasks WHERE task_id = ?', (task_id,))
+                cursor.execute('DELETE FROM download_pieces WHERE task_id = ?', (task_id,))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 删除任务失败: {e}")
+                logger.error("删除任务失败: %s", e)
                 return False
 
     # ==================== 分块表操作 ====================
 
+    @_timed_write
     def create_chunks(self, task_id: str, chunks: List[Tuple[int, int, int, str]]) -> bool:
         """
         批量创建分块记录
@@ -297,10 +577,9 @@ class DatabaseManager:
                         VALUES (?, ?, ?, ?, ?)
                     ''', (task_id, chunk_index, start_byte, end_byte, temp_file))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 创建分块失败: {e}")
+                logger.error("创建分块失败: %s", e)
                 return False
 
     def get_chunks(self, task_id: str) -> List[Dict]:
@@ -310,7 +589,6 @@ class DatabaseManager:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM download_chunks WHERE task_id = ? ORDER BY chunk_index', (task_id,))
             rows = cursor.fetchall()
-            conn.close()
             return [dict(row) for row in rows]
 
     def get_incomplete_chunks(self, task_id: str) -> List[Dict]:
@@ -324,9 +602,9 @@ class DatabaseManager:
                 ORDER BY chunk_index
             ''', (task_id,))
             rows = cursor.fetchall()
-            conn.close()
             return [dict(row) for row in rows]
 
+    @_timed_write
     def update_chunk_progress(self, chunk_id: int, downloaded_bytes: int, status: Optional[str] = None) -> bool:
         """更新分块进度"""
         with self._lock:
@@ -346,12 +624,36 @@ class DatabaseManager:
                         WHERE chunk_id = ?
                     ''', (downloaded_bytes, chunk_id))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 更新分块进度失败: {e}")
+                logger.error("更新分块进度失败: %s", e)
+                return False
+
+    @_timed_write
+    def update_chunks_progress(self, updates: List[Tuple[int, int]]) -> bool:
+        """
+        批量更新分块进度（一次连接一次提交）
+        Args:
+            updates: [(chunk_id, downloaded_bytes), ...]
+        """
+        if not updates:
+            return True
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE download_chunks
+                    SET downloaded_bytes = ?
+                    WHERE chunk_id = ?
+                ''', [(downloaded_bytes, chunk_id) for chunk_id, downloaded_bytes in updates])
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("批量更新分块进度失败: %s", e)
                 return False
 
+    @_timed_write
     def increment_chunk_retry(self, chunk_id: int) -> bool:
         """增加分块重试次数"""
         with self._lock:
@@ -360,14 +662,205 @@ class DatabaseManager:
                 cursor = conn.cursor()
                 cursor.execute('UPDATE download_chunks SET retry_count = retry_count + 1 WHERE chunk_id = ?', (chunk_id,))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 更新重试次数失败: {e}")
+                logger.error("更新重试次数失败: %s", e)
+                return False
+
+    # ==================== 分片表操作 ====================
+
+    @_timed_write
+    def increment_piece_retry(self, task_id: str) -> bool:
+        """分片下载的任务重试次数+1（哪一片重试都算这个任务的）"""
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.execute('UPDATE download_pieces SET retry_count = retry_count + 1 WHERE task_id = ?', (task_id,))
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("更新分片重试次数失败: %s", e)
+                return False
+
+    @_timed_write
+    def create_piece_map(self, task_id: str, piece_size: int, piece_count: int, temp_file: str) -> bool:
+        """创建任务的分片记录（位图全0）"""
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.execute('''
+                    INSERT OR REPLACE INTO download_pieces
+                    (task_id, piece_size, piece_count, bitfield, temp_file)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (task_id, piece_size, piece_count, bytes((piece_count + 7) // 8), temp_file))
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("创建分片记录失败: %s", e)
+                return False
+
+    def get_piece_map(self, task_id: str) -> Optional[Dict]:
+        """
+        获取任务的分片记录（老任务按分块下，没有这个，返回None）
+        partial解析成 {片序号: 已下字节数}
+        """
+        with self._lock:
+            conn = self._get_connection()
+            row = conn.execute('SELECT * FROM download_pieces WHERE task_id = ?', (task_id,)).fetchone()
+        if not row:
+            return None
+        piece_map = dict(row)
+        piece_map['partial'] = {int(index): done for index, done in json.loads(row['partial'] or '{}').items()}
+        return piece_map
+
+    @_timed_write
+    def delete_piece_map(self, task_id: str) -> bool:
+        """删除任务的分片记录（分片下载用不了、改成单线程下时调用）"""
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.execute('DELETE FROM download_pieces WHERE task_id = ?', (task_id,))
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("删除分片记录失败: %s", e)
+                return False
+
+    @_timed_write
+    def update_pieces_progress(self, updates: List[Tuple[str, bytes, Dict[int, int]]]) -> bool:
+        """
+        批量更新分片断点（一次连接一次提交）
+        Args:
+            updates: [(task_id, bitfield, {片序号: 已下字节数}), ...]，bitfield为None表示位图没变
+        """
+        if not updates:
+            return True
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.executemany('UPDATE download_pieces SET bitfield = COALESCE(?, bitfield), partial = ? '
+                                 'WHERE task_id = ?',
+                                 [(bitfield, json.dumps(partial) if partial else None, task_id)
+                                  for task_id, bitfield, partial in updates])
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("更新分片断点失败: %s", e)
+                return False
+
+    # ==================== 主机画像 ====================
+
+    def get_host_profiles(self) -> List[Dict]:
+        """获取所有主机画像"""
+        with self._lock:
+            conn = self._get_connection()
+            rows = conn.execute('SELECT * FROM host_profiles').fetchall()
+        return [dict(row) for row in rows]
+
+    @_timed_write
+    def save_host_profile(self, profile: Dict) -> bool:
+        """
+        保存主机画像（有就覆盖）
+        Args:
+            profile: host_profiles表的字段（updated_at不用传）
+        """
+        fields = [key for key in profile if key != 'updated_at']
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO host_profiles ({', '.join(fields)}, updated_at) "
+                    f"VALUES ({', '.join('?' * len(fields))}, CURRENT_TIMESTAMP)",
+                    [profile[key] for key in fields]
+                )
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("保存主机画像失败: %s", e)
+                return False
+
+    # ==================== 文件哈希缓存 ====================
+
+    def get_file_hashes(self, path: str, size: int, mtime_ns: int, inode: int) -> Dict[str, str]:
+        """
+        查文件的缓存哈希（文件改过就查不到）
+        Returns:
+            {哈希类型: 哈希值}
+        """
+        with self._lock:
+            conn = self._get_connection()
+            rows = conn.execute('SELECT hash_type, hash FROM file_hashes '
+                                'WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                                (path, size, mtime_ns, inode)).fetchall()
+        return {row['hash_type']: row['hash'] for row in rows}
+
+    @_timed_write
+    def save_file_hashes(self, path: str, size: int, mtime_ns: int, inode: int, hashes: Dict[str, str]) -> bool:
+        """
+        保存文件哈希（这个路径上旧文件的哈希一并清掉）
+        Args:
+            hashes: {哈希类型: 哈希值}
+        """
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.execute('DELETE FROM file_hashes WHERE path = ? AND (size != ? OR mtime_ns != ? OR inode != ?)',
+                             (path, size, mtime_ns, inode))
+                conn.executemany('INSERT OR REPLACE INTO file_hashes (path, hash_type, size, mtime_ns, inode, hash) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 [(path, hash_type, size, mtime_ns, inode, value) for hash_type, value in hashes.items()])
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("保存文件哈希失败: %s", e)
+                return False
+
+    # ==================== 批量校验 ====================
+
+    @_timed_write
+    def start_library_check(self, task_ids: List[str]) -> bool:
+        """开始新一轮批量校验（上一轮的结果清掉）"""
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.execute('DELETE FROM library_checks')
+                conn.executemany('INSERT INTO library_checks (task_id) VALUES (?)', [(task_id,) for task_id in task_ids])
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("开始批量校验失败: %s", e)
+                return False
+
+    def get_library_checks(self) -> List[Dict]:
+        """这一轮批量校验的所有记录（result为None的还没查）"""
+        with self._lock:
+            conn = self._get_connection()
+            rows = conn.execute('SELECT * FROM library_checks').fetchall()
+        return [dict(row) for row in rows]
+
+    @_timed_write
+    def update_library_checks(self, results: List[Tuple[str, str]]) -> bool:
+        """
+        批量写校验结果（一次连接一次提交）
+        Args:
+            results: [(task_id, result), ...]
+        """
+        if not results:
+            return True
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                conn.executemany('UPDATE library_checks SET result = ?, checked_at = CURRENT_TIMESTAMP WHERE task_id = ?',
+                                 [(result, task_id) for task_id, result in results])
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error("写批量校验结果失败: %s", e)
                 return False
 
     # ==================== 历史记录操作 ====================
 
+    @_timed_write
     def add_history(self, task_id: str, filename: str, file_size: int,
                     download_time: float, avg_speed: float) -> bool:
         """添加下载历史记录"""
@@ -381,22 +874,47 @@ class DatabaseManager:
                     VALUES (?, ?, ?, ?, ?)
                 ''', (task_id, filename, file_size, download_time, avg_speed))
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 添加历史记录失败: {e}")
+                logger.error("添加历史记录失败: %s", e)
                 return False
 
     def get_history(self, limit: int = 100) -> List[Dict]:
         """获取下载历史"""
+        rows, _ = self.query_history(limit=limit)
+        return rows
+
+    def query_history(self, cursor: Optional[Tuple[str, int]] = None,
+                      limit: int = 100) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        """
+        分页查询下载历史（按完成时间倒序，键集分页）
+        Args:
+            cursor: 上一页返回的游标，None表示第一页
+            limit: 每页条数
+        Returns:
+            (本页记录, 下一页游标)，没有下一页时游标为None
+        """
         with self._lock:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM download_history ORDER BY completed_at DESC LIMIT ?', (limit,))
-            rows = cursor.fetchall()
-            conn.close()
-            return [dict(row) for row in rows]
-
+            if cursor:
+                rows = conn.execute('''
+                    SELECT * FROM download_history
+                    WHERE (completed_at, id) < (?, ?)
+                    ORDER BY completed_at DESC, id DESC LIMIT ?
+                ''', (cursor[0], cursor[1], limit + 1)).fetchall()
+            else:
+                rows = conn.execute(
+                    'SELECT * FROM download_history ORDER BY completed_at DESC, id DESC LIMIT ?', (limit + 1,)
+                ).fetchall()
+
+        rows = [dict(row) for row in rows]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['completed_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    @_timed_write
     def clear_history(self) -> bool:
         """清空下载历史记录"""
         with self._lock:
@@ -405,8 +923,7 @@ class DatabaseManager:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM download_history')
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
-                print(f"[错误] 清空历史记录失败: {e}")
+                logger.error("清空历史记录失败: %s", e)
                 return False
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+任务状态缓存
+老王说：点个按钮查一次库、每秒全表扫一遍，数据库连接开了关关了开，这不是折腾吗？
+所有任务记录常驻内存，读直接走内存；写一律穿透到SQLite，进度这种高频写攒一批再落库。
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from downloader.database.db_manager import DatabaseManager
+from downloader.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# download_tasks表的字段（TaskRecord只保留这些属性）
+TASK_FIELDS = (
+    'task_id', 'url', 'filename', 'save_path', 'total_size', 'downloaded_size',
+    'status', 'support_range', 'thread_count', 'speed', 'created_at', 'started_at',
+    'completed_at', 'error_message', 'expected_hash', 'expected_hash_type',
+    'actual_hash', 'hash_verified', 'host',
+)
+# 只在内存里的运行时字段（不落库）：校验进度
+RUNTIME_FIELDS = ('verified_size',)
+RECORD_FIELDS = TASK_FIELDS + RUNTIME_FIELDS
+
+# 统计里总会出现的状态（没有任务也给0）
+STAT_STATUSES = ('downloading', 'pending', 'paused', 'completed', 'failed', 'cancelled')
+
+TASKS_BY_STATUS = metrics.Gauge('downloader_tasks', '各状态的任务数', ['status'])
+PENDING_PROGRESS = metrics.Gauge('downloader_db_pending_progress', '进度改了还没落库的任务数（写库队列深度）')
+
+
+def _utc_timestamp() -> str:
+    """和SQLite的CURRENT_TIMESTAMP同格式的UTC时间"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class TaskRecord:
+    """
+    单条任务记录（__slots__省内存）
+    支持 record['key'] / record.get('key') 读法，老代码当dict用也不用改
+    老王说：这是共享的缓存对象，只读！要改走TaskStore的方法！
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, row: Dict):
+        for field in RECORD_FIELDS:
+            setattr(self, field, row.get(field))
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in RECORD_FIELDS
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in RECORD_FIELDS else default
+
+    def keys(self):
+        return RECORD_FIELDS
+
+    def to_dict(self) -> Dict:
+        """导出成普通dict（拷贝）"""
+        return {field: getattr(self, field) for field in RECORD_FIELDS}
+
+
+class TaskStore:
+    """任务记录内存缓存（读走内存，写穿透到DatabaseManager）"""
+
+    def __init__(self, db_manager: DatabaseManager):
+        """
+        Args:
+            db_manager: 数据库管理器（持久化后端）
+        """
+        self.db = db_manager
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, TaskRecord] = {}  # 按创建时间升序
+        self._dirty_progress = set()  # 进度改了但还没落库的任务ID
+
+        # 统计计数（状态切换/进度tick时增量维护，不用每次数一遍）
+        self._status_counts: Dict[str, int] = {}
+        self._total_speed = 0.0  # 所有下载中任务的速度之和
+        self._stats_listeners: List[Callable[[Dict], None]] = []
+
+        self._load()
+
+        # 指标抓取时现取（读个计数，不用加锁）
+        TASKS_BY_STATUS.set_function(
+            lambda: {(status,): self._status_counts.get(status, 0)
+                     for status in (*STAT_STATUSES, *self._status_counts)})
+        PENDING_PROGRESS.set_function(lambda: len(self._dirty_progress))
+
+    def _load(self):
+        """启动时一次性把任务表读进内存"""
+        rows = self.db.get_all_tasks()
+        rows.reverse()  # get_all_tasks是按创建时间倒序的
+        with self._lock:
+            self._tasks = {row['task_id']: TaskRecord(row) for row in rows}
+            self._status_counts = {}
+            self._total_speed = 0.0
+            for record in self._tasks.values():
+                self._count_status(record.status, 1)
+                if record.status == 'downloading':
+                    self._total_speed += record.speed or 0
+
+    def _count_status(self, status: str, delta: int):
+        """调整某个状态的计数（调用方持锁）"""
+        self._status_counts[status] = self._status_counts.get(status, 0) + delta
+
+    # ==================== 读（纯内存） ====================
+
+    def get_task(self, task_id: str) -> Optional[TaskRecord]:
+        """获取任务记录（共享对象，只读）"""
+        return self._tasks.get(task_id)
+
+    def get_all_tasks(self, status: Optional[str] = None) -> List[TaskRecord]:
+        """
+        获取所有任务（按创建时间倒序，和DatabaseManager.get_all_tasks一致）
+        Args:
+            status: 可选，筛选特定状态的任务
+        """
+        with self._lock:
+            records = list(self._tasks.values())
+        records.reverse()
+        if status:
+            return [record for record in records if record.status == status]
+        return records
+
+    def query_tasks(self, cursor=None, limit: int = 50, **filters):
+        """
+        分页查询任务：数据库走覆盖索引只取ID，记录本身从内存拿
+        Args:
+            cursor: 上一页返回的游标
+            limit: 每页条数
+            **filters: 同DatabaseManager.query_tasks（status/host/created_after/created_before/filename_prefix）
+        Returns:
+            (本页TaskRecord列表, 下一页游标)
+        """
+        rows, next_cursor = self.db.query_tasks(cursor=cursor, limit=limit, ids_only=True, **filters)
+        records = [self._tasks.get(row['task_id']) for row in rows]
+        return [record for record in records if record is not None], next_cursor
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    # ==================== 统计（增量维护） ====================
+
+    def get_statistics(self) -> Dict:
+        """
+        获取统计信息（O(1)，不扫任务）
+        Returns:
+            {'total': 总数, 'downloading': .., 'pending': .., 'paused': .., 'completed': ..,
+             'failed': .., 'cancelled': .., 其他状态: .., 'total_speed': 总速度}
+        """
+        with self._lock:
+            stats = {status: 0 for status in STAT_STATUSES}
+            stats.update({status: count for status, count in self._status_counts.items() if count})
+            stats['total'] = len(self._tasks)
+            stats['total_speed'] = self._total_speed if stats['downloading'] else 0.0
+        return stats
+
+    def add_stats_listener(self, callback: Callable[[Dict], None]):
+        """
+        订阅统计变化（状态切换、进度tick时通知，没任务在下就没有通知）
+        Args:
+            callback: 回调函数，签名为 callback(stats)，在写入方的线程里调用
+        """
+        self._stats_listeners.append(callback)
+
+    def _notify_stats(self):
+        """通知订阅者统计变了"""
+        if not self._stats_listeners:
+            return
+        stats = self.get_statistics()
+        for callback in list(self._stats_listeners):
+            try:
+                callback(stats)
+            except Exception as e:
+                logger.error("统计回调失败: %s", e)
+
+    # ==================== 写（穿透到数据库） ====================
+
+    def create_task(self, task_id: str, url: str, filename: str, save_path: str,
+                    total_size: int = 0, support_range: bool = True, thread_count: int = 8,
+                    status: str = 'pending') -> bool:
+        """创建任务（先落库，成功后再进缓存）"""
+        if not self.db.create_task(task_id, url, filename, save_path, total_size, support_range, thread_count, status):
+            return False
+        row = self.db.get_task(task_id)  # 拿回数据库填的默认值（created_at等）
+        if not row:
+            return False
+        with self._lock:
+            self._tasks[task_id] = TaskRecord(row)
+            self._count_status(row['status'], 1)
+        self._notify_stats()
+        return True
+
+    def update_task_status(self, task_id: str, status: str, error_message: Optional[str] = None,
+                           stamp: bool = True) -> bool:
+        """
+        更新任务状态（同步写库）
+        Args:
+            stamp: 是否顺带记开始/完成时间（同DatabaseManager.update_task_status）
+        """
+        if not self.db.update_task_status(task_id, status, error_message, stamp):
+            return False
+        record = self._tasks.get(task_id)
+        if record:
+            with self._lock:
+                if stamp and status == 'downloading':
+                    record.started_at = _utc_timestamp()
+                elif stamp and status == 'completed':
+                    record.completed_at = _utc_timestamp()
+                if record.status == 'downloading':
+                    self._total_speed = max(0.0, self._total_speed - (record.speed or 0))
+                self._count_status(record.status, -1)
+                self._count_status(status, 1)
+                record.status = status
+                record.error_message = error_message
+                record.verified_size = 0 if status == 'verifying' else None
+                if status != 'downloading' and record.speed:
+                    record.speed = 0.0
+                    self._dirty_progress.add(task_id)
+
+        # 状态切换时顺手把这个任务攒着的进度也落库（停下来的任务不会再有tick了）
+        if task_id in self._dirty_progress:
+            self.flush(notify=False)
+        self._notify_stats()
+        return True
+
+    def update_task_progress(self, task_id: str, downloaded_size: int, speed: float) -> bool:
+        """更新任务进度（只改内存，flush时批量落库）"""
+        record = self._tasks.get(task_id)
+        if not record:
+            return False
+        with self._lock:
+            if record.status == 'downloading':
+                self._total_speed = max(0.0, self._total_speed + speed - (record.speed or 0))
+            record.downloaded_size = downloaded_size
+            record.speed = speed
+            self._dirty_progress.add(task_id)
+        return True
+
+    def update_verify_progress(self, task_id: str, verified_size: int) -> bool:
+        """更新校验进度（只在内存里，不落库）"""
+        record = self._tasks.get(task_id)
+        if not record:
+            return False
+        record.verified_size = verified_size
+        return True
+
+    def flush(self, notify: bool = True) -> bool:
+        """
+        把攒着的进度批量写进数据库（调度线程每个tick调一次，退出时再调一次）
+        Args:
+            notify: 有进度变化时是否通知统计订阅者（速度变了）
+        """
+        with self._lock:
+            if not self._dirty_progress:
+                return True
+            dirty = self._dirty_progress
+            self._dirty_progress = set()
+        updates = []
+        for task_id in dirty:
+            record = self._tasks.get(task_id)
+            if record:
+                updates.append((task_id, record.downloaded_size, record.speed))
+        success = self.db.update_tasks_progress(updates)
+        if notify:
+            self._notify_stats()
+        return success
+
+    def update_task_probe(self, task_id: str, total_size: int, support_range: bool, thread_count: int) -> bool:
+        """写入探测结果"""
+        if not self.db.update_task_probe(task_id, total_size, support_range, thread_count):
+            return False
+        record = self._tasks.get(task_id)
+        if record:
+            record.total_size = total_size
+            record.support_range = 1 if support_range else 0
+            record.thread_count = thread_count
+        return True
+
+    def update_task_hash(self, task_id: str, actual_hash: str, hash_verified: int) -> bool:
+        """更新哈希校验结果"""
+        if not self.db.update_task_hash(task_id, actual_hash, hash_verified):
+            return False
+        record = self._tasks.get(task_id)
+        if record:
+            record.actual_hash = actual_hash
+            record.hash_verified = hash_verified
+        return True
+
+    def set_expected_hash(self, task_id: str, expected_hash: str, hash_type: str) -> bool:
+        """设置预期哈希值"""
+        if not self.db.set_expected_hash(task_id, expected_hash, hash_type):
+            return False
+        record = self._tasks.get(task_id)
+        if record:
+            record.expected_hash = expected_hash.lower() if expected_hash else None
+            record.expected_hash_type = hash_type.lower() if hash_type else None
+        return True
+
+    def delete_task(self, task_id: str) -> bool:
+        """删除任务"""
+        if not self.db.delete_task(task_id):
+            return False
+        with self._lock:
+            record = self._tasks.pop(task_id, None)
+            self._dirty_progress.discard(task_id)
+            if record:
+                self._count_status(record.status, -1)
+                if record.status == 'downloading':
+                    self._total_speed = max(0.0, self._total_speed - (record.speed or 0))
+        self._notify_stats()
+        return True
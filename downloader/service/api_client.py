@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+下载服务的客户端
+老王说：界面连上常驻服务就只当个遥控器，引擎、数据库一概不碰。
+RemoteTaskManager 和 TaskManager 接口一样，MainWindow 拿哪个都能用。
+"""
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode, quote
+from downloader.service.protocol import DEFAULT_HOST, DEFAULT_PORT, encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# 事件流断了以后多久重连（秒），逐次翻倍到上限
+RECONNECT_DELAY = 1.0
+RECONNECT_DELAY_MAX = 30.0
+
+
+class ApiClientError(Exception):
+    """服务返回错误或连不上"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiClient:
+    """最小的JSON HTTP客户端（只用标准库）"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, query: Optional[Dict] = None, body: Optional[Dict] = None):
+        """
+        发请求并解析JSON响应
+        Raises:
+            ApiClientError: 连不上或服务返回错误
+        """
+        url = f"{self.base_url}/api/{path}"
+        if query:
+            query = {key: value for key, value in query.items() if value is not None}
+            if query:
+                url += '?' + urlencode(query)
+        data = None
+        headers = {}
+        if method == 'POST':
+            data = json.dumps(body or {}, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error', str(e))
+            except Exception:
+                message = str(e)
+            raise ApiClientError(message, e.code)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ApiClientError(f"连接下载服务失败: {e}")
+
+    def ping(self) -> bool:
+        """服务是否在线"""
+        try:
+            return bool(self.request('GET', 'ping').get('ok'))
+        except ApiClientError:
+            return False
+
+
+def find_running_service(port: int = DEFAULT_PORT, host: str = DEFAULT_HOST, timeout: float = 0.5) -> Optional[str]:
+    """
+    看看本机有没有在跑的下载服务
+    Returns:
+        服务地址，没有返回None
+    """
+    base_url = f"http://{host}:{port}"
+    return base_url if ApiClient(base_url, timeout=timeout).ping() else None
+
+
+class RemoteTaskManager:
+    """通过HTTP接口操作下载服务的任务管理器（接口同TaskManager）"""
+
+    def __init__(self, base_url: str, config=None):
+        """
+        Args:
+            base_url: 服务地址，如 http://127.0.0.1:17890
+            config: 本地配置管理器（设置对话框、关闭行为用；和服务读同一个配置文件）
+        """
+        if config is None:
+            from downloader.utils.config import ConfigManager
+            config = ConfigManager()
+        self.config = config
+        self.client = ApiClient(base_url)
+
+        self._tasks: Dict[str, Dict] = {}  # 任务缓存（事件流实时更新）
+        self._lock = threading.Lock()
+        self._stats: Optional[Dict] = None
+
+        # 回调函数
+        self.task_added_callback: Optional[Callable] = None
+        self.task_status_changed_callback: Optional[Callable] = None
+        self.progress_callback: Optional[Callable] = None
+        self.statistics_callback: Optional[Callable] = None
+        self.library_callback: Optional[Callable] = None
+
+        self._running = True
+        self._events_thread = threading.Thread(target=self._event_loop, name="api-events", daemon=True)
+        self._events_thread.start()
+
+    # ==================== 回调 ====================
+
+    def set_task_added_callback(self, callback: Callable):
+        self.task_added_callback = callback
+
+    def set_task_status_changed_callback(self, callback: Callable):
+        self.task_status_changed_callback = callback
+
+    def set_progress_callback(self, callback: Callable):
+        self.progress_callback = callback
+
+    def set_statistics_callback(self, callback: Callable):
+        self.statistics_callback = callback
+
+    def set_library_callback(self, callback: Callable):
+        self.library_callback = callback
+
+    # ==================== 任务操作 ====================
+
+    def _call(self, method: str, path: str, query: Optional[Dict] = None, body: Optional[Dict] = None):
+        """调接口，失败打日志返回None（和本地TaskManager一样用返回值表示失败）"""
+        try:
+            return self.client.request(method, path, query, body)
+        except ApiClientError as e:
+            logger.error("下载服务请求失败: %s %s: %s", method, path, e)
+            return None
+
+    def _cache(self, task: Optional[Dict]):
+        if task:
+            with self._lock:
+                self._tasks[task['task_id']] = task
+
+    def add_task(self, url: str, filename: Optional[str] = None,
+                 save_path: Optional[str] = None,
+                 expected_hash: Optional[str] = None,
+                 hash_type: str = "md5") -> Optional[str]:
+        """添加下载任务，返回任务ID（失败返回None）"""
+        result = self._call('POST', 'tasks', body={
+            'url': url, 'filename': filename, 'save_path': save_path,
+            'expected_hash': expected_hash, 'hash_type': hash_type,
+        })
+        if not result:
+            return None
+        self._cache(result.get('task'))
+        return result['task_id']
+
+    def _task_action(self, task_id: str, action: str) -> bool:
+        result = self._call('POST', f"tasks/{quote(task_id)}/{action}")
+        if not result:
+            return False
+        self._cache(result.get('task'))
+        return bool(result.get('ok'))
+
+    def start_task(self, task_id: str) -> bool:
+        return self._task_action(task_id, 'start')
+
+    def pause_task(self, task_id: str) -> bool:
+        return self._task_action(task_id, 'pause')
+
+    def resume_task(self, task_id: str) -> bool:
+        return self._task_action(task_id, 'resume')
+
+    def cancel_task(self, task_id: str) -> bool:
+        return self._task_action(task_id, 'cancel')
+
+    def delete_task(self, task_id: str, delete_files: bool = False) -> bool:
+        result = self._call('DELETE', f"tasks/{quote(task_id)}", {'delete_files': 1 if delete_files else 0})
+        with self._lock:
+            self._tasks.pop(task_id, None)
+        return bool(result and result.get('ok'))
+
+    def pause_all(self) -> int:
+        result = self._call('POST', 'tasks/pause_all')
+        return result['count'] if result else 0
+
+    def resume_all(self) -> int:
+        result = self._call('POST', 'tasks/resume_all')
+        return result['count'] if result else 0
+
+    def verify_library(self, rehash: bool = False, restart: bool = False) -> bool:
+        result = self._call('POST', 'library/verify', body={'rehash': rehash, 'restart': restart})
+        return bool(result and result.get('ok'))
+
+    def get_library_report(self) -> Dict:
+        return self._call('GET', 'library') or {}
+
+    def redownload_tasks(self, task_ids: List[str]) -> int:
+        result = self._call('POST', 'library/redownload', body={'task_ids': task_ids})
+        return result['count'] if result else 0
+
+    # ==================== 查询 ====================
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        """获取任务（先看缓存，没有再问服务）"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            task = self._call('GET', f"tasks/{quote(task_id)}")
+            self._cache(task)
+        return task
+
+    def query_tasks(self, cursor=None, limit: int = 50, **filters):
+        """分页查询任务，返回 (任务列表, 下一页游标)"""
+        query = dict(filters, cursor=encode_cursor(cursor), limit=limit)
+        result = self._call('GET', 'tasks', query)
+        if not result:
+            return [], None
+        for task in result['tasks']:
+            self._cache(task)
+        return result['tasks'], decode_cursor(result.get('next_cursor'))
+
+    def get_all_tasks(self) -> List[Dict]:
+        """获取所有任务（按页拉完）"""
+        tasks, cursor = self.query_tasks(limit=500)
+        while cursor:
+            page, cursor = self.query_tasks(cursor=cursor, limit=500)
+            tasks.extend(page)
+        return tasks
+
+    def query_history(self, cursor=None, limit: int = 100):
+        result = self._call('GET', 'history', {'cursor': encode_cursor(cursor), 'limit': limit})
+        if not result:
+            return [], None
+        return result['history'], decode_cursor(result.get('next_cursor'))
+
+    def clear_history(self) -> bool:
+        result = self._call('DELETE', 'history')
+        return bool(result and result.get('ok'))
+
+    def get_statistics(self) -> Dict:
+        if self._stats is None:
+            self._stats = self._call('GET', 'stats') or {
+                'total': 0, 'downloading': 0, 'pending': 0, 'paused': 0,
+                'completed': 0, 'failed': 0, 'cancelled': 0, 'total_speed': 0.0,
+            }
+        return dict(self._stats)
+
+    def get_host_stats(self) -> Dict[str, Dict]:
+        return self._call('GET', 'hosts') or {}
+
+    def shutdown(self):
+        """断开事件流（服务本身继续跑，下载不受影响）"""
+        self._running = False
+
+    # ==================== 事件流 ====================
+
+    def _event_loop(self):
+        """订阅 /api/events，断了自动重连"""
+        delay = RECONNECT_DELAY
+        connected_before = False
+        while self._running:
+            try:
+                req = urllib.request.Request(f"{self.client.base_url}/api/events")
+                with urllib.request.urlopen(req, timeout=60) as resp:
+                    delay = RECONNECT_DELAY
+                    if connected_before:
+                        self._refresh_cache()  # 断线期间的事件丢了，缓存重新拉
+                    connected_before = True
+                    self._read_events(resp)
+            except Exception as e:
+                if self._running:
+                    logger.warning("下载服务事件流断开，%.0f秒后重连: %s", delay, e)
+            if self._running:
+                time.sleep(delay)
+                delay = min(RECONNECT_DELAY_MAX, delay * 2)
+
+    def _read_events(self, resp):
+        """按SSE格式逐行解析"""
+        event, data = None, []
+        for raw in resp:
+            if not self._running:
+                return
+            line = raw.decode('utf-8').rstrip('\r\n')
+            if not line:
+                if event and data:
+                    self._on_event(event, json.loads('\n'.join(data)))
+                event, data = None, []
+            elif line.startswith(':'):
+                continue  # 心跳
+            elif line.startswith('event:'):
+                event = line[6:].strip()
+            elif line.startswith('data:'):
+                data.append(line[5:].strip())
+
+    def _refresh_cache(self):
+        """重连后把缓存里的任务重新拉一遍，并通知界面刷新"""
+        with self._lock:
+            task_ids = list(self._tasks)
+            self._tasks.clear()
+        for task_id in task_ids:
+            task = self.get_task(task_id)
+            if task and self.task_status_changed_callback:
+                self.task_status_changed_callback(task_id, task['status'], '')
+
+    def _on_event(self, event: str, data: Dict):
+        """先更新缓存，再回调（界面回调里读到的就是最新的）"""
+        try:
+            if event == 'added':
+                task = data.get('task')
+                self._cache(task)
+                if task and self.task_added_callback:
+                    self.task_added_callback(task['task_id'])
+            elif event == 'status':
+                self._cache(data.get('task'))
+                if self.task_status_changed_callback:
+                    self.task_status_changed_callback(data['task_id'], data['status'], data.get('message'))
+            elif event == 'progress':
+                task = self._tasks.get(data['task_id'])
+                if task is not None:
+                    task['downloaded_size'] = data['downloaded_size']
+                    task['total_size'] = data['total_size']
+                    task['speed'] = data['speed']
+                    task['verified_size'] = data.get('verified_size')
+                if self.progress_callback:
+                    self.progress_callback(data['task_id'], data['downloaded_size'], data['total_size'], data['speed'])
+            elif event == 'library':
+                if self.library_callback:
+                    self.library_callback(data)
+            elif event == 'stats':
+                self._stats = data
+                if self.statistics_callback:
+                    self.statistics_callback(dict(data))
+        except Exception as e:
+            logger.exception("处理服务事件失败: %s: %s", event, e)
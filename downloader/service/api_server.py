@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+本机下载服务（守护进程）的HTTP控制接口
+老王说：每个脚本自己拉一套引擎各下各的，抢同一个数据库、抢同一个带宽，不乱才怪！
+一台机器一个常驻服务，脚本/其他工具/图形界面都通过 127.0.0.1 上的 REST 接口提交和控制任务，
+进度用 SSE（/api/events）推送，不用轮询。
+只接受 Host 是 127.0.0.1:端口 / localhost:端口 的请求（挡DNS重绑定），带Origin的也得是这两个。
+
+接口一览（请求体和响应都是JSON）：
+    GET    /api/ping                        服务探活 {ok, mode, pid}
+    POST   /api/window/show                 把图形界面窗口调到前台（只有界面实例支持）
+    GET    /api/tasks?cursor=&limit=&status=&host=&filename_prefix=   分页列任务
+    GET    /api/tasks/<id>                  单个任务
+    GET    /api/tasks/<id>/trace            下载时间线（Chrome Trace格式，任务被抽中追踪才有）
+    POST   /api/tasks                       添加任务 {url, filename?, save_path?, expected_hash?, hash_type?}
+    POST   /api/tasks/<id>/start|pause|resume|cancel
+    DELETE /api/tasks/<id>?delete_files=1   删除任务
+    POST   /api/tasks/pause_all|resume_all
+    GET    /api/library                     最近一轮批量校验的结果（含损坏/丢失的任务ID）
+    POST   /api/library/verify              批量校验下完的文件 {rehash?, restart?}
+    POST   /api/library/redownload          重新下载 {task_ids?}，不传就是最近一轮查出的损坏+丢失
+    GET    /api/stats                       统计
+    GET    /api/hosts                       各主机健康状态
+    GET    /api/history?cursor=&limit=      下载历史
+    DELETE /api/history                     清空历史
+    GET    /api/events                      SSE事件流：added/status/progress/stats/library
+    GET    /metrics                         运行指标（Prometheus文本格式，配置里开了metrics_enabled才有）
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+from downloader.service.protocol import DEFAULT_HOST, DEFAULT_PORT, MODE_DAEMON, encode_cursor, decode_cursor
+from downloader.utils import metrics, tracing
+from downloader.utils.file_utils import get_hash_types
+
+logger = logging.getLogger(__name__)
+
+# 每个SSE订阅者最多积压多少事件（慢客户端丢事件，不能拖累引擎）
+SUBSCRIBER_QUEUE_SIZE = 1000
+# SSE心跳间隔（秒），顺便用来发现断开的客户端
+SSE_KEEPALIVE = 15.0
+
+
+def _chain(previous: Optional[Callable], callback: Callable) -> Callable:
+    """已有回调（比如界面的）照常调用，再调服务自己的"""
+    if previous is None:
+        return callback
+
+    def chained(*args):
+        previous(*args)
+        callback(*args)
+    return chained
+
+
+class EventHub:
+    """SSE事件分发：每个订阅者一个有界队列"""
+
+    def __init__(self):
+        self._subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def publish(self, event: str, data: Dict):
+        """广播事件（任何线程都能调，不阻塞）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        payload = (event, json.dumps(data, ensure_ascii=False))
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                pass  # 客户端太慢，丢掉；客户端重连后会重新拉全量
+
+
+class ApiError(Exception):
+    """接口错误（带HTTP状态码）"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _int_param(query: Dict, key: str, default: int) -> int:
+    """整数参数，解析不了就是400（不是500）"""
+    try:
+        return int(query.get(key, default))
+    except ValueError:
+        raise ApiError(400, f"参数{key}必须是整数")
+
+
+def _cursor_param(query: Dict):
+    """分页游标参数（上一页返回的next_cursor原样传回来）"""
+    try:
+        return decode_cursor(query.get('cursor'))
+    except (ValueError, TypeError):
+        raise ApiError(400, '参数cursor无效')
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """请求处理（每个连接一个线程）"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LaowangDownloader'
+
+    def log_message(self, format, *args):
+        pass  # 别把每个请求都打到控制台
+
+    @property
+    def service(self) -> 'ApiServer':
+        return self.server.service
+
+    # ==================== 收发 ====================
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_metrics(self):
+        if not metrics.is_enabled():
+            raise ApiError(404, '没开运行指标（配置里设 metrics_enabled: true 后重启）')
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            data = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            raise ApiError(400, '请求体不是合法的JSON')
+        if not isinstance(data, dict):
+            raise ApiError(400, '请求体必须是JSON对象')
+        return data
+
+    def _check_origin(self):
+        """
+        只认发给本机地址的请求
+        老王说：光靠只监听127.0.0.1挡不住DNS重绑定——恶意网页把自己的域名解析到127.0.0.1，
+        浏览器就当它是同源，照样能往这儿POST任务、把文件写到任意目录！这种请求的Host/Origin是它自己的域名。
+        """
+        if (self.headers.get('Host') or '').lower() not in self.service.allowed_hosts:
+            raise ApiError(403, 'Host不是本机地址')
+        origin = self.headers.get('Origin')
+        if origin is not None and urlparse(origin).netloc.lower() not in self.service.allowed_hosts:
+            raise ApiError(403, '不接受跨站请求')
+
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        parts = [p for p in parsed.path.split('/') if p]
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        try:
+            self._check_origin()
+            if method == 'GET' and parts == ['metrics']:
+                self._send_metrics()
+                return
+            if not parts or parts[0] != 'api':
+                raise ApiError(404, '接口不存在')
+            # 改状态的请求必须是JSON：浏览器里的网页没法不经预检就发这种请求，挡掉跨站伪造
+            if method == 'POST' and not (self.headers.get('Content-Type') or '').startswith('application/json'):
+                raise ApiError(415, 'Content-Type必须是application/json')
+            if method == 'GET' and parts[1:] == ['events']:
+                self._stream_events()
+                return
+            status, data = self.service.handle(method, parts[1:], query, self._read_json() if method == 'POST' else {})
+            self._send_json(status, data)
+        except ApiError as e:
+            self._send_json(e.status, {'error': e.message})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.exception("接口处理失败: %s %s: %s", method, self.path, e)
+            self._send_json(500, {'error': str(e)})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _stream_events(self):
+        """SSE：连上先推一次统计，然后有事件就推，空闲时发心跳"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        q = self.service.events.subscribe()
+        try:
+            self._write_event('stats', json.dumps(self.service.get_statistics(), ensure_ascii=False))
+            while self.service.running:
+                try:
+                    event, data = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                self._write_event(event, data)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            self.service.events.unsubscribe(q)
+
+    def _write_event(self, event: str, data: str):
+        self.wfile.write(f"event: {event}\ndata: {data}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+
+class ApiServer:
+    """把TaskManager包成本机HTTP服务"""
+
+    def __init__(self, task_manager, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 mode: str = MODE_DAEMON):
+        """
+        Args:
+            task_manager: 任务管理器（已经设置的回调会保留，服务的回调接在后面）
+            host: 监听地址
+            port: 监听端口（0表示随便挑一个空闲端口）
+            mode: 实例类型（MODE_*），客户端据此决定是转发后退出还是连上来当遥控器
+        Raises:
+            OSError: 端口被占用
+        """
+        self.task_manager = task_manager
+        self.mode = mode
+        self.events = EventHub()
+        self.running = False
+        self.show_window_callback: Optional[Callable] = None
+        self._httpd = ThreadingHTTPServer((host, port), _ApiHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.service = self
+        self._thread: Optional[threading.Thread] = None
+        # 请求头里的Host只认这几个（端口是实际监听的，传0时是系统挑的那个）
+        bound_port = self._httpd.server_address[1]
+        self.allowed_hosts = {f"{name}:{bound_port}" for name in (host.lower(), '127.0.0.1', 'localhost')}
+
+        task_manager.set_task_added_callback(_chain(task_manager.task_added_callback, self._on_task_added))
+        task_manager.set_task_status_changed_callback(
+            _chain(task_manager.task_status_changed_callback, self._on_task_status_changed))
+        task_manager.set_progress_callback(_chain(task_manager.engine.progress_callback, self._on_task_progress))
+        task_manager.set_statistics_callback(_chain(task_manager.statistics_callback, self._on_statistics_changed))
+        task_manager.set_library_callback(_chain(task_manager.library.progress_callback, self._on_library_progress))
+
+    def set_show_window_callback(self, callback: Callable):
+        """设置“调出窗口”回调（图形界面实例用，第二次启动时把窗口调到前台）"""
+        self.show_window_callback = callback
+
+    @property
+    def address(self) -> str:
+        """服务地址，如 http://127.0.0.1:17890"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """后台线程里跑服务"""
+        self.running = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="api-server", daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        """当前线程里跑服务（守护进程模式）"""
+        self.running = True
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """停止服务"""
+        self.running = False
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # ==================== 任务事件 → SSE ====================
+
+    def _on_task_added(self, task_id: str):
+        self.events.publish('added', {'task': self._task_dict(task_id)})
+
+    def _on_task_status_changed(self, task_id: str, status: str, message: str):
+        self.events.publish('status', {'task_id': task_id, 'status': status, 'message': message,
+                                       'task': self._task_dict(task_id)})
+
+    def _on_task_progress(self, task_id: str, downloaded_size: int, total_size: int, speed: float):
+        task = self.task_manager.get_task(task_id)
+        self.events.publish('progress', {'task_id': task_id, 'downloaded_size': downloaded_size,
+                                         'total_size': total_size, 'speed': speed,
+                                         'verified_size': task['verified_size'] if task else None})
+
+    def _on_statistics_changed(self, stats: Dict):
+        self.events.publish('stats', stats)
+
+    def _on_library_progress(self, summary: Dict):
+        self.events.publish('library', summary)
+
+    # ==================== 请求处理 ====================
+
+    def _task_dict(self, task_id: str) -> Optional[Dict]:
+        task = self.task_manager.get_task(task_id)
+        return task.to_dict() if task else None
+
+    def get_statistics(self) -> Dict:
+        stats = self.task_manager.get_statistics()
+        stats['open_hosts'] = [host for host, state in self.task_manager.get_host_stats().items()
+                               if state['state'] != 'closed']
+        return stats
+
+    def handle(self, method: str, path: List[str], query: Dict, body: Dict):
+        """
+        路由
+        Returns:
+            (HTTP状态码, 响应数据)
+        """
+        tm = self.task_manager
+
+        if path == ['ping'] and method == 'GET':
+            return 200, {'ok': True, 'mode': self.mode, 'pid': os.getpid()}
+
+        if path == ['window', 'show'] and method == 'POST':
+            if not self.show_window_callback:
+                raise ApiError(404, '这个实例没有窗口')
+            self.show_window_callback()
+            return 200, {'ok': True}
+
+        if path == ['stats'] and method == 'GET':
+            return 200, self.get_statistics()
+
+        if path == ['hosts'] and method == 'GET':
+            return 200, tm.get_host_stats()
+
+        if path == ['history']:
+            if method == 'GET':
+                history, next_cursor = tm.query_history(cursor=_cursor_param(query),
+                                                        limit=_int_param(query, 'limit', 100))
+                return 200, {'history': history, 'next_cursor': encode_cursor(next_cursor)}
+            if method == 'DELETE':
+                return 200, {'ok': tm.clear_history()}
+
+        if path and path[0] == 'tasks':
+            return self._handle_tasks(method, path[1:], query, body)
+
+        if path == ['library'] and method == 'GET':
+            return 200, tm.get_library_report()
+        if path == ['library', 'verify'] and method == 'POST':
+            return 200, {'ok': tm.verify_library(rehash=bool(body.get('rehash')), restart=bool(body.get('restart')))}
+        if path == ['library', 'redownload'] and method == 'POST':
+            task_ids = body.get('task_ids')
+            if task_ids is None:
+                report = tm.get_library_report()
+                task_ids = report['corrupt_ids'] + report['missing_ids']
+            return 200, {'count': tm.redownload_tasks(task_ids)}
+
+        raise ApiError(404, '接口不存在')
+
+    def _handle_tasks(self, method: str, path: List[str], query: Dict, body: Dict):
+        tm = self.task_manager
+
+        if not path:
+            if method == 'GET':
+                filters = {key: query[key] for key in ('status', 'host', 'created_after', 'created_before',
+                                                       'filename_prefix') if query.get(key)}
+                tasks, next_cursor = tm.query_tasks(cursor=_cursor_param(query),
+                                                    limit=_int_param(query, 'limit', 50), **filters)
+                return 200, {'tasks': [task.to_dict() for task in tasks], 'next_cursor': encode_cursor(next_cursor)}
+            if method == 'POST':
+                if not body.get('url'):
+                    raise ApiError(400, '缺少url')
+                if (body.get('hash_type') or 'md5').lower() not in get_hash_types():
+                    raise ApiError(400, f"不支持的哈希类型，可选: {', '.join(get_hash_types())}")
+                task_id = tm.add_task(body['url'], filename=body.get('filename'), save_path=body.get('save_path'),
+                                      expected_hash=body.get('expected_hash'),
+                                      hash_type=body.get('hash_type') or 'md5')
+                if not task_id:
+                    raise ApiError(500, '任务添加失败')
+                return 201, {'task_id': task_id, 'task': self._task_dict(task_id)}
+            raise ApiError(405, '不支持的方法')
+
+        if path == ['pause_all'] and method == 'POST':
+            return 200, {'count': tm.pause_all()}
+        if path == ['resume_all'] and method == 'POST':
+            return 200, {'count': tm.resume_all()}
+
+        task_id = path[0]
+        if not tm.get_task(task_id):
+            raise ApiError(404, '任务不存在')
+
+        if len(path) == 1:
+            if method == 'GET':
+                return 200, self._task_dict(task_id)
+            if method == 'DELETE':
+                delete_files = query.get('delete_files') in ('1', 'true')
+                return 200, {'ok': tm.delete_task(task_id, delete_files=delete_files)}
+            raise ApiError(405, '不支持的方法')
+
+        actions = {
+            'start': tm.start_task,
+            'pause': tm.pause_task,
+            'resume': tm.resume_task,
+            'cancel': tm.cancel_task,
+        }
+        if len(path) == 2 and path[1] in actions and method == 'POST':
+            return 200, {'ok': bool(actions[path[1]](task_id)), 'task': self._task_dict(task_id)}
+        if path[1:] == ['trace'] and method == 'GET':
+            trace = tracing.get_trace(task_id, label=tm.get_task(task_id)['filename'])
+            if trace is None:
+                raise ApiError(404, '没有追踪记录（没抽中，或者任务已结束、时间线已写到data/traces）')
+            return 200, trace
+
+        raise ApiError(404, '接口不存在')
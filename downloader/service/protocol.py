@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+服务端和客户端共用的常量/编码
+老王说：转发个URL的客户端别因为import了服务端把requests、引擎全拖进来，这个文件只准用标准库！
+"""
+import json
+from typing import Optional
+
+# 默认监听地址（只监听本机，别把下载器暴露到局域网上）
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 17890
+
+# 实例类型（/api/ping 返回）
+MODE_DAEMON = 'daemon'  # python -m downloader --daemon
+MODE_GUI = 'gui'  # 图形界面
+MODE_CLI = 'cli'  # 命令行批量下载
+
+
+def encode_cursor(cursor) -> Optional[str]:
+    """游标（元组）编码成字符串，给HTTP参数用"""
+    return json.dumps(list(cursor), ensure_ascii=False) if cursor else None
+
+
+def decode_cursor(text: Optional[str]):
+    """字符串还原成游标元组"""
+    if not text:
+        return None
+    return tuple(json.loads(text))
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+单实例锁 + 转发
+老王说：双击两次就起两个引擎抢同一个数据库、同一批分块，文件不坏才怪！
+同一个数据库只允许一个实例持有锁（操作系统文件锁，进程挂了自动释放，不会有残留锁）；
+后来的实例通过本机HTTP接口把URL交给已经在跑的实例，然后自己退出。
+这个文件只准用标准库，第二次启动要在几十毫秒内转发完走人，别把Tk、requests拖进来。
+"""
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from downloader.service.api_client import ApiClient, ApiClientError
+from downloader.service.protocol import DEFAULT_HOST
+
+# 拿不到锁时等已有实例的接口起来的最长时间（秒）：对方可能正在启动
+INSTANCE_WAIT = 5.0
+INSTANCE_POLL_INTERVAL = 0.1
+
+
+class InstanceLock:
+    """基于文件锁的单实例锁（锁文件放在数据库旁边）"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: 数据库路径（同一个数据库同一时间只能有一个实例）
+        """
+        self.path = os.path.abspath(db_path) + '.lock'
+        self._file = None
+
+    def acquire(self) -> bool:
+        """尝试加锁（不阻塞），成功返回True；锁一直持有到release或进程退出"""
+        if self._file is not None:
+            return True
+        lock_dir = os.path.dirname(self.path)
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        f = open(self.path, 'a+')
+        try:
+            if sys.platform == 'win32':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+
+        # 写上PID，方便人肉排查是谁占着
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        """释放锁"""
+        if self._file is None:
+            return
+        try:
+            if sys.platform == 'win32':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def wait_for_instance(port: int, timeout: float = INSTANCE_WAIT) -> Tuple[Optional[ApiClient], Optional[Dict]]:
+    """
+    连接已经在跑的实例（它可能还在启动，接口没起来就等一会儿）
+    Returns:
+        (客户端, ping结果)；等不到返回 (None, None)
+    """
+    client = ApiClient(f"http://{DEFAULT_HOST}:{port}", timeout=1.0)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            info = client.request('GET', 'ping')
+            if info.get('ok'):
+                return client, info
+        except ApiClientError:
+            pass
+        if time.monotonic() >= deadline:
+            return None, None
+        time.sleep(INSTANCE_POLL_INTERVAL)
+
+
+def forward_urls(client: ApiClient, urls: List[Tuple[str, Optional[str]]], save_path: Optional[str] = None,
+                 hash_type: str = 'md5') -> List[Optional[str]]:
+    """
+    把URL交给已经在跑的实例
+    Args:
+        client: 已连接的客户端
+        urls: [(URL, 预期哈希或None), ...]
+        save_path: 保存目录（None用对方的默认目录）
+        hash_type: 哈希类型
+    Returns:
+        每个URL对应的任务ID（失败为None）
+    """
+    task_ids = []
+    for url, expected_hash in urls:
+        try:
+            result = client.request('POST', 'tasks', body={
+                'url': url, 'save_path': save_path,
+                'expected_hash': expected_hash, 'hash_type': hash_type,
+            })
+            task_ids.append(result.get('task_id'))
+        except ApiClientError as e:
+            print(f"[错误] 转发任务失败: {url}: {e}", file=sys.stderr)
+            task_ids.append(None)
+    return task_ids
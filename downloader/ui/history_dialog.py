@@ -7,6 +7,9 @@ import customtkinter as ctk
 from typing import List, Dict
 from datetime import datetime
 
+# 历史记录每页加载多少条
+HISTORY_PAGE_SIZE = 100
+
 
 def format_file_size(size_bytes: int) -> str:
     """格式化文件大小"""
@@ -47,10 +50,15 @@ def format_speed(speed: float) -> str:
 class HistoryDialog(ctk.CTkToplevel):
     """下载历史对话框"""
 
-    def __init__(self, parent, db_manager):
+    def __init__(self, parent, history_source):
+        """
+        Args:
+            parent: 父窗口
+            history_source: 提供 query_history/clear_history 的对象（本地或远程的任务管理器）
+        """
         super().__init__(parent)
 
-        self.db_manager = db_manager
+        self.history_source = history_source
 
         # 设置窗口
         self.title("下载历史")
@@ -126,13 +134,15 @@ class HistoryDialog(ctk.CTkToplevel):
         close_btn.pack(side="right", padx=5)
 
     def _load_history(self):
-        """加载历史数据"""
+        """加载历史数据（第一页）"""
         # 清空现有内容
         for widget in self.history_frame.winfo_children():
             widget.destroy()
 
         # 获取历史记录
-        history = self.db_manager.get_history(limit=100)
+        history, self._history_cursor = self.history_source.query_history(limit=HISTORY_PAGE_SIZE)
+        self._history_count = 0
+        self._load_more_btn = ctk.CTkButton(self.history_frame, text="加载更多", command=self._load_more_history)
 
         if not history:
             # 无历史记录
@@ -146,8 +156,23 @@ class HistoryDialog(ctk.CTkToplevel):
             return
 
         # 创建历史列表
-        for idx, record in enumerate(history):
-            self._add_history_item(record, idx)
+        self._show_history_page(history)
+
+    def _load_more_history(self):
+        """加载下一页历史"""
+        history, self._history_cursor = self.history_source.query_history(
+            cursor=self._history_cursor, limit=HISTORY_PAGE_SIZE
+        )
+        self._show_history_page(history)
+
+    def _show_history_page(self, history: List[Dict]):
+        """显示一页历史记录，还有下一页就把“加载更多”挪到最后"""
+        self._load_more_btn.pack_forget()
+        for record in history:
+            self._add_history_item(record, self._history_count)
+            self._history_count += 1
+        if self._history_cursor:
+            self._load_more_btn.pack(pady=5)
 
     def _add_history_item(self, record: Dict, index: int):
         """添加历史记录项"""
@@ -202,7 +227,7 @@ class HistoryDialog(ctk.CTkToplevel):
 
         if messagebox.askyesno("确认", "确定要清空所有下载历史记录吗？\n此操作不可恢复！", parent=self):
             try:
-                self.db_manager.clear_history()
+                self.history_source.clear_history()
                 self._load_history()
                 messagebox.showinfo("成功", "历史记录已清空！", parent=self)
             except Exception as e:
@@ -6,22 +6,34 @@ GUI主窗口
 import customtkinter as ctk
 import os
 import subprocess
-import threading
 from tkinter import messagebox, filedialog
-from typing import Dict
-from downloader.core.task_manager import TaskManager
-from downloader.utils.file_utils import format_speed
-from downloader.ui.tray_manager import TrayManager
+from typing import Dict, Optional, TYPE_CHECKING
+from downloader.utils.file_utils import format_speed, get_hash_types
+from downloader.utils.startup_timer import StartupTimer
+from downloader.ui.task_list import VirtualTaskList
+from downloader.ui.update_bus import UIUpdateBus
+
+if TYPE_CHECKING:
+    from downloader.core.task_manager import TaskManager
+
+# 更新总线里状态栏用的key（和task_id不会撞）
+STATS_UPDATE_KEY = '__stats__'
+LIBRARY_UPDATE_KEY = '__library__'
 
 
 class MainWindow(ctk.CTk):
     """主窗口"""
 
-    def __init__(self, task_manager: TaskManager):
+    def __init__(self, task_manager: 'TaskManager', startup_timer: Optional[StartupTimer] = None):
+        """
+        Args:
+            task_manager: 任务管理器（本地TaskManager或连服务的RemoteTaskManager）
+            startup_timer: 启动计时器（main.py传进来接着记窗口各阶段）
+        """
         super().__init__()
 
         self.task_manager = task_manager
-        self.task_widgets = {}  # {task_id: widget}
+        self.startup_timer = startup_timer or StartupTimer()
 
         # 设置窗口
         self.title("老王下载器 v1.0")
@@ -34,25 +46,51 @@ class MainWindow(ctk.CTk):
         # 创建UI
         self._create_ui()
 
+        # 进度/状态/统计更新统一走总线，按帧率合并刷新
+        self.ui_bus = UIUpdateBus(self, self._apply_ui_updates)
+
         # 设置任务管理器回调
         self.task_manager.set_task_added_callback(self._on_task_added)
         self.task_manager.set_task_status_changed_callback(self._on_task_status_changed)
-        self.task_manager.engine.set_progress_callback(self._on_task_progress)
+        self.task_manager.set_progress_callback(self._on_task_progress)
+        self.task_manager.set_library_callback(self._on_library_progress)
+        self._library_summary: Optional[Dict] = None  # 批量校验进行中才有
 
-        # 加载现有任务
-        self._load_existing_tasks()
-
-        # 启动UI更新线程
-        self._start_ui_update_thread()
+        # 状态栏（订阅统计变化）
+        self._init_status_bar()
 
         # 绑定窗口关闭事件
         self.protocol("WM_DELETE_WINDOW", self._on_window_close)
 
+        # 任务列表、托盘等窗口画出来以后再加载，先让用户看见窗口
+        self.startup_timer.mark("创建窗口")
+        self.bind("<Map>", self._on_first_map, add="+")
+
+    def _on_first_map(self, event):
+        """窗口第一次显示：等这一轮重绘完再做剩下的初始化"""
+        if event.widget is not self or getattr(self, '_deferred_init_done', False):
+            return
+        self._deferred_init_done = True
+        self.after_idle(self._deferred_init)
+
+    def _deferred_init(self):
+        """首屏之后的初始化（在主线程，按顺序做，每步记耗时）"""
+        self.update_idletasks()  # 确保首屏已经画出来
+        self.startup_timer.mark("首屏绘制")
+
+        # 加载现有任务
+        self._load_existing_tasks()
+        self.startup_timer.mark("加载任务")
+
         # 初始化系统托盘
         self._init_tray()
+        self.startup_timer.mark("系统托盘")
+
+        self.startup_timer.report()
 
     def _init_tray(self):
-        """初始化系统托盘"""
+        """初始化系统托盘（pystray/PIL导入慢，用到时才导入）"""
+        from downloader.ui.tray_manager import TrayManager
         self.tray_manager = TrayManager("老王下载器")
         self.tray_manager.set_show_window_callback(self._show_from_tray)
         self.tray_manager.set_exit_callback(self._exit_app)
@@ -60,6 +98,10 @@ class MainWindow(ctk.CTk):
 
     def _show_from_tray(self):
         """从托盘恢复窗口"""
+        self.show_window()
+
+    def show_window(self):
+        """把窗口调到前台（任何线程都能调，比如再次启动时转发过来的请求）"""
         # 在主线程中执行UI操作
         self.after(0, self._restore_window)
 
@@ -82,8 +124,9 @@ class MainWindow(ctk.CTk):
             self.iconify()
 
     def _exit_app(self):
-        """退出程序（停止下载并释放资源）"""
+        """退出程序（在下的任务暂停、释放资源，下次启动接着下）"""
         try:
+            self.ui_bus.close()
             # 停止托盘
             if hasattr(self, 'tray_manager'):
                 self.tray_manager.stop()
@@ -117,6 +160,10 @@ class MainWindow(ctk.CTk):
         resume_all_btn = ctk.CTkButton(toolbar, text="▶ 继续全部", command=self._on_resume_all, width=100)
         resume_all_btn.pack(side="left", padx=5)
 
+        # 批量校验按钮
+        verify_btn = ctk.CTkButton(toolbar, text="🔍 校验下载库", command=self._on_verify_library, width=110)
+        verify_btn.pack(side="left", padx=5)
+
         # 设置按钮
         settings_btn = ctk.CTkButton(toolbar, text="⚙ 设置", command=self._on_settings, width=100)
         settings_btn.pack(side="right", padx=5)
@@ -125,9 +172,21 @@ class MainWindow(ctk.CTk):
         history_btn = ctk.CTkButton(toolbar, text="📜 历史", command=self._on_history, width=100)
         history_btn.pack(side="right", padx=5)
 
-        # 任务列表区域（使用Scrollable Frame）
-        self.task_list_frame = ctk.CTkScrollableFrame(self, label_text="下载任务列表")
-        self.task_list_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        # 任务列表区域（虚拟化列表，只为看得见的行建控件）
+        self.task_list = VirtualTaskList(
+            self,
+            fetch_page=lambda cursor, limit: self.task_manager.query_tasks(cursor=cursor, limit=limit),
+            get_task=self.task_manager.get_task,
+            get_total=lambda: self.task_manager.get_statistics()['total'],
+            actions={
+                'start': self._on_start_task,
+                'pause': self._on_pause_task,
+                'cancel': self._on_cancel_task,
+                'delete': self._on_delete_task,
+                'location': self._on_open_location,
+            },
+        )
+        self.task_list.pack(fill="both", expand=True, padx=10, pady=10)
 
         # 底部状态栏
         self.status_bar = ctk.CTkFrame(self, height=40)
@@ -142,16 +201,14 @@ class MainWindow(ctk.CTk):
         self.wait_window(dialog)
 
         if dialog.confirmed:
-            # 添加任务（带哈希校验参数）
+            # 添加任务（带哈希校验参数）；立即返回，文件信息在后台探测，结果看任务行状态
             task_id = self.task_manager.add_task(
                 url=dialog.url,
                 save_path=dialog.save_dir,
                 expected_hash=dialog.expected_hash,
                 hash_type=dialog.hash_type
             )
-            if task_id:
-                messagebox.showinfo("成功", "任务添加成功！")
-            else:
+            if not task_id:
                 messagebox.showerror("错误", "任务添加失败！")
 
     def _on_pause_all(self):
@@ -164,102 +221,41 @@ class MainWindow(ctk.CTk):
         count = self.task_manager.resume_all()
         messagebox.showinfo("提示", f"已继续 {count} 个任务")
 
+    def _on_verify_library(self):
+        """批量校验所有下完的文件（后台查，进度在状态栏）"""
+        if not self.task_manager.verify_library():
+            messagebox.showinfo("提示", "批量校验正在进行中")
+
+    def _on_library_progress(self, summary: Dict):
+        """批量校验进度回调（在工作线程中调用）"""
+        self.ui_bus.publish(LIBRARY_UPDATE_KEY, summary)
+
+    def _on_library_done(self, summary: Dict):
+        """批量校验查完：有坏的/丢的就问要不要重下"""
+        report = self.task_manager.get_library_report()
+        bad = report.get('corrupt_ids', []) + report.get('missing_ids', [])
+        text = (f"共校验 {summary['total']} 个文件：完好 {summary['ok']}，损坏 {summary['corrupt']}，"
+                f"丢失 {summary['missing']}，出错 {summary['error']}")
+        if not bad:
+            messagebox.showinfo("校验完成", text)
+        elif messagebox.askyesno("校验完成", f"{text}\n\n重新下载这 {len(bad)} 个损坏/丢失的文件？"):
+            self.task_manager.redownload_tasks(bad)
+
     def _on_settings(self):
         """打开设置对话框"""
         from downloader.ui.settings_dialog import SettingsDialog
-        dialog = SettingsDialog(self, self.task_manager.engine.config)
+        dialog = SettingsDialog(self, self.task_manager.config)
         self.wait_window(dialog)
 
     def _on_history(self):
         """打开下载历史对话框"""
         from downloader.ui.history_dialog import HistoryDialog
-        dialog = HistoryDialog(self, self.task_manager.db)
+        dialog = HistoryDialog(self, self.task_manager)
         self.wait_window(dialog)
 
     def _load_existing_tasks(self):
-        """加载现有任务"""
-        tasks = self.task_manager.get_all_tasks()
-        for task in tasks:
-            self._add_task_widget(task)
-
-    def _add_task_widget(self, task: Dict):
-        """添加任务UI组件"""
-        task_id = task['task_id']
-
-        # 创建任务卡片
-        task_frame = ctk.CTkFrame(self.task_list_frame)
-        task_frame.pack(fill="x", pady=5)
-
-        # 文件名标签
-        filename_label = ctk.CTkLabel(task_frame, text=task['filename'], font=("Arial", 14, "bold"))
-        filename_label.pack(anchor="w", padx=10, pady=5)
-
-        # 进度条和信息行
-        info_frame = ctk.CTkFrame(task_frame, fg_color="transparent")
-        info_frame.pack(fill="x", padx=10, pady=5)
-
-        # 文件位置按钮（一直显示，别搞“下载中没有入口”这种反人类设计）
-        location_btn = ctk.CTkButton(
-            info_frame,
-            text="文件位置",
-            width=110,
-            command=lambda: self._on_open_location(task_id),
-        )
-        location_btn.pack(side="right", padx=5)
-
-        # 进度条
-        progress_bar = ctk.CTkProgressBar(info_frame, width=400)
-        progress_bar.pack(side="left", padx=5)
-        progress_bar.set(0)
-
-        # 进度百分比
-        progress_label = ctk.CTkLabel(info_frame, text="0%", width=60)
-        progress_label.pack(side="left", padx=5)
-
-        # 速度
-        speed_label = ctk.CTkLabel(info_frame, text="0 KB/s", width=100)
-        speed_label.pack(side="left", padx=5)
-
-        # 状态
-        status_label = ctk.CTkLabel(info_frame, text=self._get_status_text(task['status']), width=80)
-        status_label.pack(side="left", padx=5)
-
-        # 按钮区域
-        button_frame = ctk.CTkFrame(task_frame, fg_color="transparent")
-        button_frame.pack(fill="x", padx=10, pady=5)
-
-        # 开始/暂停按钮
-        if task['status'] == 'downloading':
-            action_btn = ctk.CTkButton(button_frame, text="⏸ 暂停", width=80,
-                                      command=lambda: self._on_pause_task(task_id))
-        elif task['status'] in ('paused', 'failed', 'pending'):
-            action_btn = ctk.CTkButton(button_frame, text="▶ 开始", width=80,
-                                      command=lambda: self._on_start_task(task_id))
-        else:
-            action_btn = ctk.CTkButton(button_frame, text="✓ 完成", width=80, state="disabled")
-
-        action_btn.pack(side="left", padx=5)
-
-        # 取消按钮
-        cancel_btn = ctk.CTkButton(button_frame, text="✗ 取消", width=80,
-                                   command=lambda: self._on_cancel_task(task_id))
-        cancel_btn.pack(side="left", padx=5)
-
-        # 删除按钮
-        delete_btn = ctk.CTkButton(button_frame, text="🗑 删除", width=80,
-                                   command=lambda: self._on_delete_task(task_id))
-        delete_btn.pack(side="left", padx=5)
-
-        # 保存widget引用
-        self.task_widgets[task_id] = {
-            'frame': task_frame,
-            'progress_bar': progress_bar,
-            'progress_label': progress_label,
-            'speed_label': speed_label,
-            'status_label': status_label,
-            'action_btn': action_btn,
-            'location_btn': location_btn,
-        }
+        """加载现有任务（先取第一屏要用的ID，剩下的空闲时陆续取回）"""
+        self.task_list.reload(stream=True)
 
     def _on_start_task(self, task_id: str):
         """开始/继续任务"""
@@ -291,31 +287,11 @@ class MainWindow(ctk.CTk):
 
         # 获取用户选择
         if dialog.confirmed:
-            delete_file = dialog.delete_file
-
-            # 删除文件（如果用户选择了）
-            if delete_file and task['save_path']:
-                try:
-                    if os.path.exists(task['save_path']):
-                        os.remove(task['save_path'])
-                        print(f"[删除] 文件已删除: {task['save_path']}")
-
-                    # 删除临时分块文件
-                    if task['support_range']:
-                        chunks = self.task_manager.db.get_chunks(task_id)
-                        for chunk in chunks:
-                            if chunk['temp_file'] and os.path.exists(chunk['temp_file']):
-                                os.remove(chunk['temp_file'])
-                except Exception as e:
-                    messagebox.showerror("错误", f"删除文件失败: {e}")
-
-            # 删除数据库记录
-            self.task_manager.delete_task(task_id)
+            # 删除任务（用户选了就连文件一起删）
+            self.task_manager.delete_task(task_id, delete_files=dialog.delete_file)
 
             # 移除UI组件
-            if task_id in self.task_widgets:
-                self.task_widgets[task_id]['frame'].destroy()
-                del self.task_widgets[task_id]
+            self.task_list.remove_task(task_id)
 
     def _on_open_location(self, task_id: str):
         """打开文件位置（Windows资源管理器定位文件）"""
@@ -345,13 +321,11 @@ class MainWindow(ctk.CTk):
 
     def _on_task_added(self, task_id: str):
         """任务添加回调"""
-        task = self.task_manager.get_task(task_id)
-        if task:
-            self.after(0, lambda: self._add_task_widget(task))
+        self.after(0, lambda: self.task_list.insert_task(task_id))
 
     def _on_task_status_changed(self, task_id: str, status: str, message: str):
         """任务状态变更回调"""
-        self.after(0, lambda: self._update_task_status(task_id, status))
+        self.ui_bus.publish(task_id)
 
         # 下载完成时发送托盘通知
         if status == 'completed':
@@ -361,81 +335,54 @@ class MainWindow(ctk.CTk):
 
     def _on_task_progress(self, task_id: str, downloaded_size: int, total_size: int, speed: float):
         """任务进度回调"""
-        self.after(0, lambda: self._update_task_progress(task_id, downloaded_size, total_size, speed))
-
-    def _update_task_status(self, task_id: str, status: str):
-        """更新任务状态UI"""
-        if task_id not in self.task_widgets:
-            return
-
-        widgets = self.task_widgets[task_id]
-        widgets['status_label'].configure(text=self._get_status_text(status))
-
-        # 更新按钮
-        action_btn = widgets['action_btn']
-        if status == 'downloading':
-            action_btn.configure(text="⏸ 暂停", command=lambda: self._on_pause_task(task_id), state="normal")
-        elif status in ('paused', 'failed'):
-            action_btn.configure(text="▶ 继续", command=lambda: self._on_start_task(task_id), state="normal")
-        elif status == 'pending':
-            action_btn.configure(text="▶ 开始", command=lambda: self._on_start_task(task_id), state="normal")
-        elif status in ('completed', 'cancelled'):
-            action_btn.configure(text="✓ 完成", state="disabled")
-
-    def _update_task_progress(self, task_id: str, downloaded_size: int, total_size: int, speed: float):
-        """更新任务进度UI"""
-        if task_id not in self.task_widgets:
-            return
+        self.ui_bus.publish(task_id)
+
+    def _apply_ui_updates(self, updates: Dict):
+        """
+        一帧内攒下的更新一次性刷到界面（主线程）
+        任务行直接读内存里的最新记录，不在屏幕上的任务什么都不用做；值没变的控件行自己会跳过
+        """
+        stats = updates.pop(STATS_UPDATE_KEY, None)
+        library = updates.pop(LIBRARY_UPDATE_KEY, None)
+        for task_id in updates:
+            self.task_list.refresh_task(task_id)
+        if library is not None:
+            self._library_summary = library if library['running'] else None
+            if stats is None:
+                stats = self.task_manager.get_statistics()
+            if not library['running']:
+                self.after_idle(self._on_library_done, library)
+        if stats is not None:
+            self._render_status_bar(stats)
 
-        widgets = self.task_widgets[task_id]
+    def _init_status_bar(self):
+        """订阅统计变化刷新状态栏（不轮询，没任务在下时状态栏一动不动）"""
+        self.task_manager.set_statistics_callback(self._on_statistics_changed)
+        stats = self.task_manager.get_statistics()
+        stats['open_hosts'] = []
+        self._render_status_bar(stats)
 
-        # 更新进度条
-        progress = downloaded_size / total_size if total_size > 0 else 0
-        widgets['progress_bar'].set(progress)
+    def _on_statistics_changed(self, stats: Dict):
+        """统计变化回调（在工作线程中调用）"""
+        self.ui_bus.publish(STATS_UPDATE_KEY, stats)
 
-        # 更新百分比
-        widgets['progress_label'].configure(text=f"{progress * 100:.1f}%")
+    def _render_status_bar(self, stats: Dict):
+        """刷新状态栏"""
+        status_text = f"总速度: {format_speed(stats['total_speed'])} | 下载中: {stats['downloading']} | 等待: {stats['pending']}"
 
-        # 更新速度
-        widgets['speed_label'].configure(text=format_speed(speed))
+        # 有主机熔断或被限流时提示一下，不然用户只会觉得下载器卡了
+        if stats.get('open_hosts'):
+            status_text += f" | 熔断冷却: {', '.join(stats['open_hosts'])}"
 
-    def _start_ui_update_thread(self):
-        """启动UI更新线程（更新状态栏）"""
-        def update_status_bar():
-            while True:
-                threading.Event().wait(1)  # 每秒更新一次
+        if self._library_summary:
+            status_text += f" | 校验下载库: {self._library_summary['checked']}/{self._library_summary['total']}"
 
-                # 获取统计信息
-                stats = self.task_manager.get_statistics()
-                downloading_tasks = self.task_manager.get_downloading_tasks()
-
-                # 计算总速度
-                total_speed = sum(task['speed'] for task in downloading_tasks)
-
-                # 更新状态栏
-                status_text = f"总速度: {format_speed(total_speed)} | 下载中: {stats['downloading']} | 等待: {stats['pending']}"
-                self.after(0, lambda: self.status_label.configure(text=status_text))
-
-        thread = threading.Thread(target=update_status_bar, daemon=True)
-        thread.start()
-
-    @staticmethod
-    def _get_status_text(status: str) -> str:
-        """获取状态文本"""
-        status_map = {
-            'pending': '等待中',
-            'downloading': '下载中',
-            'paused': '已暂停',
-            'completed': '已完成',
-            'failed': '失败',
-            'cancelled': '已取消',
-            'verifying': '校验中'
-        }
-        return status_map.get(status, status)
+        if status_text != self.status_label.cget("text"):
+            self.status_label.configure(text=status_text)
 
     def _on_window_close(self):
         """窗口关闭事件"""
-        config = self.task_manager.engine.config
+        config = self.task_manager.config
         close_behavior = config.get("close_behavior", "ask")
 
         if close_behavior == "ask":
@@ -785,7 +732,7 @@ class AddTaskDialog(ctk.CTkToplevel):
         self.hash_type_var = ctk.StringVar(value="md5")
         hash_type_menu = ctk.CTkOptionMenu(
             hash_frame,
-            values=["md5", "sha256"],
+            values=get_hash_types(),
             variable=self.hash_type_var,
             width=80
         )
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+虚拟化任务列表
+老王说：一个任务十来个控件，几千个任务全建出来，窗口打开都得等半天，滚动跟放幻灯片似的！
+只建屏幕上看得见的那几行，滚动时把行控件挪给别的任务用，数据用到时才去拿。
+"""
+import math
+import customtkinter as ctk
+from typing import Callable, Dict, List, Optional
+from downloader.utils.file_utils import format_speed
+
+# 每行的固定高度（像素），虚拟化全靠它算可见范围
+ROW_HEIGHT = 128
+# 任务ID每次从数据库取多少条
+ID_PAGE_SIZE = 200
+# 首屏之后剩下的ID在后台一页页陆续取回，每页间隔（毫秒），别一口气卡住界面
+ID_STREAM_INTERVAL = 20
+
+STATUS_TEXT = {
+    'probing': '探测中',
+    'pending': '等待中',
+    'downloading': '下载中',
+    'paused': '已暂停',
+    'completed': '已完成',
+    'failed': '失败',
+    'cancelled': '已取消',
+    'verifying': '校验中',
+    'verify_failed': '校验失败',
+}
+
+
+def get_status_text(status: str) -> str:
+    """获取状态文本"""
+    return STATUS_TEXT.get(status, status)
+
+
+class TaskRow(ctk.CTkFrame):
+    """
+    可复用的任务行
+    绑定到哪个任务由bind_task决定，按钮回调永远作用于当前绑定的任务
+    """
+
+    def __init__(self, parent, actions: Dict[str, Callable[[str], None]]):
+        """
+        Args:
+            parent: 父控件
+            actions: 按钮回调 {'start'|'pause'|'cancel'|'delete'|'location': callback(task_id)}
+        """
+        super().__init__(parent, height=ROW_HEIGHT - 10)
+        self.pack_propagate(False)
+
+        self.task_id: Optional[str] = None
+        self._actions = actions
+        self._action = None  # 当前主按钮对应的动作
+        self._rendered = {}  # 上次渲染的值，没变就不碰控件
+
+        # 文件名标签
+        self.filename_label = ctk.CTkLabel(self, text="", font=("Arial", 14, "bold"), anchor="w")
+        self.filename_label.pack(anchor="w", fill="x", padx=10, pady=5)
+
+        # 进度条和信息行
+        info_frame = ctk.CTkFrame(self, fg_color="transparent")
+        info_frame.pack(fill="x", padx=10, pady=5)
+
+        # 文件位置按钮（一直显示，别搞“下载中没有入口”这种反人类设计）
+        self.location_btn = ctk.CTkButton(info_frame, text="文件位置", width=110,
+                                          command=lambda: self._run_action('location'))
+        self.location_btn.pack(side="right", padx=5)
+
+        # 进度条
+        self.progress_bar = ctk.CTkProgressBar(info_frame, width=400)
+        self.progress_bar.pack(side="left", padx=5)
+        self.progress_bar.set(0)
+
+        # 进度百分比
+        self.progress_label = ctk.CTkLabel(info_frame, text="0%", width=60)
+        self.progress_label.pack(side="left", padx=5)
+
+        # 速度
+        self.speed_label = ctk.CTkLabel(info_frame, text="0 KB/s", width=100)
+        self.speed_label.pack(side="left", padx=5)
+
+        # 状态
+        self.status_label = ctk.CTkLabel(info_frame, text="", width=80)
+        self.status_label.pack(side="left", padx=5)
+
+        # 按钮区域
+        button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        button_frame.pack(fill="x", padx=10, pady=5)
+
+        # 开始/暂停按钮
+        self.action_btn = ctk.CTkButton(button_frame, text="▶ 开始", width=80,
+                                        command=lambda: self._run_action(self._action))
+        self.action_btn.pack(side="left", padx=5)
+
+        # 取消按钮
+        cancel_btn = ctk.CTkButton(button_frame, text="✗ 取消", width=80,
+                                   command=lambda: self._run_action('cancel'))
+        cancel_btn.pack(side="left", padx=5)
+
+        # 删除按钮
+        delete_btn = ctk.CTkButton(button_frame, text="🗑 删除", width=80,
+                                   command=lambda: self._run_action('delete'))
+        delete_btn.pack(side="left", padx=5)
+
+    def _run_action(self, action: Optional[str]):
+        """执行按钮动作（作用于当前绑定的任务）"""
+        if action and self.task_id and action in self._actions:
+            self._actions[action](self.task_id)
+
+    def _set(self, key: str, value, apply: Callable):
+        """值变了才真正去改控件"""
+        if self._rendered.get(key) != value:
+            self._rendered[key] = value
+            apply(value)
+
+    def bind_task(self, task):
+        """把这一行绑定到某个任务并刷新显示"""
+        self.task_id = task['task_id']
+        status = task['status']
+        total_size = task['total_size'] or 0
+        downloaded_size = task['downloaded_size'] or 0
+        progress = min(1.0, downloaded_size / total_size) if total_size > 0 else 0
+        if status == 'verifying' and task.get('verified_size') is not None and total_size > 0:
+            progress = min(1.0, task['verified_size'] / total_size)  # 校验中显示哈希算到哪了
+        elif status == 'completed':
+            progress = 1.0
+        speed = task['speed'] if status == 'downloading' else 0
+
+        self._set('filename', task['filename'], lambda v: self.filename_label.configure(text=v))
+        self._set('progress', round(progress, 3), self.progress_bar.set)
+        self._set('percent', f"{progress * 100:.1f}%", lambda v: self.progress_label.configure(text=v))
+        self._set('speed', format_speed(speed or 0), lambda v: self.speed_label.configure(text=v))
+        self._set('status', get_status_text(status), lambda v: self.status_label.configure(text=v))
+
+        # 更新主按钮
+        if status == 'downloading':
+            button = ("⏸ 暂停", 'pause', "normal")
+        elif status in ('paused', 'failed'):
+            button = ("▶ 继续", 'start', "normal")
+        elif status == 'pending':
+            button = ("▶ 开始", 'start', "normal")
+        elif status == 'probing':
+            button = ("… 探测中", None, "disabled")
+        else:
+            button = ("✓ 完成", None, "disabled")
+        self._action = button[1]
+        self._set('button', button, lambda v: self.action_btn.configure(text=v[0], state=v[2]))
+
+
+class VirtualTaskList(ctk.CTkFrame):
+    """虚拟化任务列表（只为可见行创建控件）"""
+
+    def __init__(self, parent, fetch_page: Callable, get_task: Callable[[str], Optional[Dict]],
+                 get_total: Callable[[], int], actions: Dict[str, Callable[[str], None]]):
+        """
+        Args:
+            parent: 父控件
+            fetch_page: 取一页任务 fetch_page(cursor, limit) -> (任务列表, 下一页游标)
+            get_task: 按ID取任务记录
+            get_total: 任务总数（用来算滚动条）
+            actions: 行按钮回调，见TaskRow
+        """
+        super().__init__(parent)
+
+        self._fetch_page = fetch_page
+        self._get_task = get_task
+        self._get_total = get_total
+        self._actions = actions
+
+        self._task_ids: List[str] = []  # 已经取到的任务ID（按显示顺序）
+        self._cursor = None  # 下一页游标
+        self._has_more = True
+        self._stream_job = None  # 陆续取ID的after任务
+        self._first = 0  # 第一条可见行的下标
+        self._rows: List[TaskRow] = []
+        self._visible: Dict[str, TaskRow] = {}  # {task_id: 当前绑定它的行}
+
+        title = ctk.CTkLabel(self, text="下载任务列表")
+        title.pack(fill="x")
+
+        self._scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self._scrollbar.pack(side="right", fill="y")
+
+        self._body = ctk.CTkFrame(self, fg_color="transparent")
+        self._body.pack(side="left", fill="both", expand=True)
+        self._body.bind("<Configure>", self._on_resize)
+
+        self._empty_label = ctk.CTkLabel(self._body, text="暂无下载任务", text_color="gray")
+
+        # 滚轮（Windows/macOS是MouseWheel，Linux是Button-4/5）
+        self.bind_all("<MouseWheel>", self._on_mousewheel, add="+")
+        self.bind_all("<Button-4>", lambda e: self._on_wheel_units(e, -1), add="+")
+        self.bind_all("<Button-5>", lambda e: self._on_wheel_units(e, 1), add="+")
+
+    # ==================== 数据 ====================
+
+    def reload(self, stream: bool = False):
+        """
+        清空已取的ID，从第一页重新加载
+        Args:
+            stream: 首屏画完后是否在后台把剩下的ID陆续取完（拖滚动条到底不用现等）
+        """
+        if self._stream_job is not None:
+            self.after_cancel(self._stream_job)
+            self._stream_job = None
+        self._task_ids = []
+        self._cursor = None
+        self._has_more = True
+        self._first = 0
+        self._ensure_loaded(self._visible_count())
+        self._render()
+        if stream:
+            self._schedule_stream()
+
+    def _schedule_stream(self):
+        if self._stream_job is None and self._has_more:
+            self._stream_job = self.after(ID_STREAM_INTERVAL, self._stream_next_page)
+
+    def _stream_next_page(self):
+        """空闲时再取一页ID（一次只取一页，中间让界面喘口气）"""
+        self._stream_job = None
+        if not self._has_more:
+            return
+        self._ensure_loaded(len(self._task_ids) + ID_PAGE_SIZE)
+        self._render()
+        self._schedule_stream()
+
+    def _ensure_loaded(self, count: int):
+        """确保至少取到了count条ID（按页懒加载）"""
+        while len(self._task_ids) < count and self._has_more:
+            tasks, self._cursor = self._fetch_page(self._cursor, ID_PAGE_SIZE)
+            known = set(self._task_ids)
+            self._task_ids.extend(task['task_id'] for task in tasks if task['task_id'] not in known)
+            self._has_more = self._cursor is not None
+
+    def _total(self) -> int:
+        """列表总行数（没取完的按总数估算）"""
+        if not self._has_more:
+            return len(self._task_ids)
+        return max(len(self._task_ids), self._get_total())
+
+    def insert_task(self, task_id: str):
+        """新任务插到最上面"""
+        if task_id in self._task_ids:
+            return
+        self._task_ids.insert(0, task_id)
+        if self._first > 0:
+            self._first += 1  # 用户在往下翻，别让内容跳
+        self._render()
+
+    def remove_task(self, task_id: str):
+        """从列表移除任务"""
+        if task_id not in self._task_ids:
+            return
+        index = self._task_ids.index(task_id)
+        self._task_ids.pop(index)
+        if index < self._first:
+            self._first -= 1
+        self._render()
+
+    def refresh_task(self, task_id: str):
+        """任务数据变了：在屏幕上就重新绑定，不在就什么都不做"""
+        row = self._visible.get(task_id)
+        if row is None:
+            return
+        task = self._get_task(task_id)
+        if task:
+            row.bind_task(task)
+
+    def is_visible(self, task_id: str) -> bool:
+        """任务当前是否在屏幕上"""
+        return task_id in self._visible
+
+    # ==================== 渲染 ====================
+
+    def _visible_count(self) -> int:
+        """当前高度能放下几行"""
+        height = self._body.winfo_height()
+        if height <= 1:
+            height = 450  # 还没布局完，先按默认窗口高度估
+        return max(1, math.ceil(height / ROW_HEIGHT))
+
+    def _on_resize(self, event=None):
+        self._render()
+
+    def _render(self):
+        """按当前滚动位置把行控件绑到对应任务上"""
+        visible_count = self._visible_count()
+        self._ensure_loaded(self._first + visible_count)
+
+        max_first = max(0, len(self._task_ids) - visible_count)
+        self._first = max(0, min(self._first, max_first))
+
+        # 行控件不够就补，多了就藏起来（不销毁，下次还能用）
+        while len(self._rows) < visible_count:
+            self._rows.append(TaskRow(self._body, self._actions))
+
+        self._visible = {}
+        for i, row in enumerate(self._rows):
+            index = self._first + i
+            task = self._get_task(self._task_ids[index]) if i < visible_count and index < len(self._task_ids) else None
+            if task is None:
+                row.pack_forget()
+                row.task_id = None
+                continue
+            row.bind_task(task)
+            self._visible[task['task_id']] = row
+            if not row.winfo_ismapped():
+                row.pack(fill="x", pady=5)
+
+        if self._task_ids:
+            self._empty_label.pack_forget()
+        else:
+            self._empty_label.pack(pady=50)
+
+        total = self._total()
+        if total > 0:
+            self._scrollbar.set(self._first / total, min(1.0, (self._first + visible_count) / total))
+        else:
+            self._scrollbar.set(0, 1)
+
+    # ==================== 滚动 ====================
+
+    def _scroll_to(self, first: int):
+        if first != self._first:
+            self._first = max(0, first)
+            self._render()
+
+    def _on_scrollbar(self, *args):
+        """滚动条回调：('moveto', fraction) 或 ('scroll', n, 'units'|'pages')"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self._scroll_to(int(float(args[1]) * self._total()))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if len(args) > 2 and args[2] == 'pages':
+                step *= max(1, self._visible_count() - 1)
+            self._scroll_to(self._first + step)
+
+    def _is_inside(self, widget) -> bool:
+        """事件是不是发生在列表里（bind_all会收到所有窗口的滚轮）"""
+        return str(widget).startswith(str(self))
+
+    def _on_mousewheel(self, event):
+        if self._is_inside(event.widget):
+            self._scroll_to(self._first + (-1 if event.delta > 0 else 1))
+
+    def _on_wheel_units(self, event, step: int):
+        if self._is_inside(event.widget):
+            self._scroll_to(self._first + step)
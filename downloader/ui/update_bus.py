@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+UI更新总线
+老王说：每个任务每秒一个after(0)，一百个任务在下就是一百个回调往Tk队列里砸，界面不卡才怪！
+工作线程只管往字典里写最新状态（同一个key后来的覆盖先来的），主线程按固定帧率一次性刷完。
+"""
+import threading
+import time
+from typing import Callable, Dict, Hashable
+
+# 默认刷新帧率
+DEFAULT_FPS = 10
+
+
+class UIUpdateBus:
+    """按key合并更新，按帧率批量应用到Tk主线程"""
+
+    def __init__(self, widget, apply: Callable[[Dict], None], fps: int = DEFAULT_FPS):
+        """
+        Args:
+            widget: 任意Tk控件（用它的after调度到主线程）
+            apply: 批量应用回调 apply({key: 最新值})，在主线程调用
+            fps: 每秒最多刷新几次
+        """
+        self._widget = widget
+        self._apply = apply
+        self._interval = 1.0 / max(1, fps)
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, object] = {}
+        self._scheduled = False  # 已经排了一次刷新，别再排
+        self._last_flush = 0.0
+        self._closed = False
+
+    def publish(self, key: Hashable, value=None):
+        """
+        提交一个更新（任何线程都能调）
+        Args:
+            key: 更新对象（比如task_id），同一帧内只保留最后一次
+            value: 最新值
+        """
+        with self._lock:
+            self._pending[key] = value
+            if self._scheduled or self._closed:
+                return
+            self._scheduled = True
+            delay = max(0.0, self._last_flush + self._interval - time.monotonic())
+        try:
+            self._widget.after(int(delay * 1000), self._flush)
+        except Exception:
+            # 窗口已经销毁了，后面的更新也没地方画
+            with self._lock:
+                self._closed = True
+
+    def _flush(self):
+        """主线程：把攒着的更新一次性应用"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._scheduled = False
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            self._apply(pending)
+        except Exception as e:
+            print(f"[错误] 界面刷新失败: {e}")
+
+    def close(self):
+        """停止调度（窗口销毁前调用）"""
+        with self._lock:
+            self._closed = True
+            self._pending = {}
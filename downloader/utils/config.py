@@ -32,7 +32,7 @@ class ConfigManager:
         "thread_count": 8,  # 默认线程数
         "max_concurrent_downloads": 3,  # 同时下载任务数
         "retry_times": 3,  # 失败重试次数
-        "chunk_size": 1024 * 1024,  # 分块大小（1MB）
+        "chunk_size": 1024 * 1024,  # 分片大小（1MB），文件切成这么大的片由线程轮流领；0表示按带宽时延积自动定
         "timeout": 30,  # 请求超时（秒）
         "user_agent": "PyDownloader/1.0",  # User-Agent
         "proxy": {
@@ -42,6 +42,12 @@ class ConfigManager:
         },
         "close_behavior": "ask",  # 关闭行为：ask|minimize|exit
         "speed_limit": 0,  # 速度限制（字节/秒），0表示不限速
+        "max_connections_per_host": 32,  # 每个主机的并发连接上限（被限流时会自动降低）
+        "api_port": 17890,  # 本机下载服务的控制端口（只监听127.0.0.1）
+        "metrics_enabled": False,  # 采集运行指标，控制端口的 GET /metrics 给Prometheus抓
+        "log_level": "INFO",  # 日志级别：DEBUG|INFO|WARNING|ERROR（日志文件在数据库旁边的logs目录）
+        "trace_sample_rate": 0.0,  # 抽多大比例的任务记下载时间线（0~1，0关闭），导出到data/traces
+        "verify_workers_per_device": 1,  # 每块盘同时算几个文件的哈希（机械盘1个最快，SSD可以开大）
     }
 
     def __init__(self, config_path: str = None):
@@ -138,6 +144,15 @@ class ConfigManager:
     def thread_count(self, value: int):
         self._config["thread_count"] = max(1, min(16, value))  # 限制1-16
 
+    @property
+    def chunk_size(self) -> int:
+        """分片大小（字节），0表示全按主机的带宽时延积自动定"""
+        return self._config.get("chunk_size", 1024 * 1024)
+
+    @chunk_size.setter
+    def chunk_size(self, value: int):
+        self._config["chunk_size"] = max(0, int(value))
+
     @property
     def max_concurrent_downloads(self) -> int:
         """同时下载任务数"""
@@ -172,6 +187,51 @@ class ConfigManager:
         """设置速度限制"""
         self._config["speed_limit"] = max(0, value)  # 不能为负数
 
+    @property
+    def max_connections_per_host(self) -> int:
+        """每个主机的并发连接上限"""
+        return self._config.get("max_connections_per_host", 32)
+
+    @property
+    def api_port(self) -> int:
+        """本机下载服务的控制端口"""
+        return self._config.get("api_port", 17890)
+
+    @property
+    def metrics_enabled(self) -> bool:
+        """是否采集运行指标"""
+        return bool(self._config.get("metrics_enabled", False))
+
+    @metrics_enabled.setter
+    def metrics_enabled(self, value: bool):
+        self._config["metrics_enabled"] = bool(value)
+
+    @property
+    def log_level(self) -> str:
+        """日志级别"""
+        return str(self._config.get("log_level", "INFO")).upper()
+
+    @property
+    def trace_sample_rate(self) -> float:
+        """记下载时间线的任务比例（0~1）"""
+        try:
+            return min(1.0, max(0.0, float(self._config.get("trace_sample_rate", 0.0))))
+        except (TypeError, ValueError):
+            return 0.0
+
+    @trace_sample_rate.setter
+    def trace_sample_rate(self, value: float):
+        self._config["trace_sample_rate"] = min(1.0, max(0.0, float(value)))
+
+    @property
+    def verify_workers_per_device(self) -> int:
+        """每块盘同时校验的文件数"""
+        return max(1, int(self._config.get("verify_workers_per_device", 1)))
+
+    @verify_workers_per_device.setter
+    def verify_workers_per_device(self, value: int):
+        self._config["verify_workers_per_device"] = max(1, int(value))
+
     # ==================== 代理配置 ====================
 
     @property
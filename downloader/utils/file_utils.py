@@ -5,10 +5,15 @@
 """
 import os
 import hashlib
+import logging
 import threading
-from typing import List, Callable, Optional
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
 from urllib.parse import urlparse, unquote
 
+logger = logging.getLogger(__name__)
+
 
 def format_size(size_bytes: int) -> str:
     """
@@ -141,61 +146,201 @@ def get_file_size(file_path: str) -> int:
         return 0
 
 
+# 算哈希时每次读多少（页大小的整数倍；一次读大块，少来回几趟系统调用）
+HASH_READ_SIZE = 8 * 1024 * 1024
+
+# 支持的哈希类型（blake3要装了blake3包才有）
+HASH_TYPES = ('md5', 'sha1', 'sha256', 'sha512', 'blake2b', 'blake3', 'crc32')
+
+try:
+    import blake3 as _blake3
+except ImportError:
+    _blake3 = None
+
+# 哈希缓存（set_hash_cache装上才有）
+_hash_cache = None
+
+
+class _Crc32:
+    """crc32套个hashlib一样的壳（zlib.crc32在大块数据上也释放GIL）"""
+
+    def __init__(self):
+        self._value = 0
+
+    def update(self, data):
+        self._value = zlib.crc32(data, self._value)
+
+    def hexdigest(self) -> str:
+        return f"{self._value:08x}"
+
+
+def get_hash_types() -> List[str]:
+    """当前环境能用的哈希类型"""
+    return [hash_type for hash_type in HASH_TYPES if hash_type != 'blake3' or _blake3 is not None]
+
+
+def _new_hasher(hash_type: str):
+    if hash_type == 'crc32':
+        return _Crc32()
+    if hash_type == 'blake3':
+        if _blake3 is None:
+            raise ValueError("blake3需要先 pip install blake3")
+        return _blake3.blake3(max_threads=_blake3.blake3.AUTO)
+    if hash_type in HASH_TYPES:
+        return hashlib.new(hash_type)
+    raise ValueError(f"不支持的哈希类型: {hash_type}")
+
+
+def set_hash_cache(cache):
+    """
+    装上哈希缓存（引擎启动时装），之后算哈希都先查它、算完写回
+    Args:
+        cache: 有 lookup(path, stat) -> {哈希类型: 哈希值} 和 store(path, stat, hashes) 的对象，None表示不用缓存
+    """
+    global _hash_cache
+    _hash_cache = cache
+
+
+def get_cached_hash(file_path: str, hash_type: str) -> str:
+    """只查缓存不读文件，没有返回空字符串"""
+    if _hash_cache is None:
+        return ""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return ""
+    return _hash_cache.lookup(os.path.abspath(file_path), stat).get(hash_type.lower(), "")
+
+
+def _hash_file(file_path: str, total_size: int, hashers: Dict, progress_callback, read_size: int) -> Optional[Dict[str, str]]:
+    """读一遍文件喂给所有hasher，被进度回调叫停返回None"""
+    processed = 0
+    buffers = [bytearray(read_size), bytearray(read_size)] if total_size > read_size else [bytearray(read_size)]
+    views = [memoryview(buffer) for buffer in buffers]
+    pool = ThreadPoolExecutor(max_workers=len(hashers), thread_name_prefix="hash") if len(buffers) > 1 else None
+
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                try:
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)  # 告诉内核顺序读，预读开大
+                except OSError:
+                    pass
+            current = 0
+            size = f.readinto(buffers[current])
+            while size:
+                data = views[current][:size]
+                if pool is None:
+                    for hasher in hashers.values():
+                        hasher.update(data)
+                    next_size = f.readinto(buffers[current])
+                else:
+                    futures = [pool.submit(hasher.update, data) for hasher in hashers.values()]
+                    current ^= 1
+                    next_size = f.readinto(buffers[current])  # 边算这一块边读下一块
+                    for future in futures:
+                        future.result()
+                processed += size
+                if progress_callback and progress_callback(processed, total_size) is False:
+                    return None
+                size = next_size
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    return {hash_type: hasher.hexdigest().lower() for hash_type, hasher in hashers.items()}
+
+
+def calculate_file_hashes(file_path: str,
+                          hash_types: Sequence[str],
+                          progress_callback: Optional[Callable[[int, int], None]] = None,
+                          read_size: int = HASH_READ_SIZE,
+                          use_cache: bool = True) -> Dict[str, str]:
+    """
+    读一遍文件同时算几种哈希
+    Args:
+        file_path: 文件路径
+        hash_types: 哈希类型列表，见 HASH_TYPES
+        progress_callback: 进度回调 callback(processed_bytes, total_bytes)，返回False就中止（返回空dict）
+        read_size: 每次读的字节数
+        use_cache: 先查哈希缓存（文件没变过就不读了）；False表示强制重读（算完照样写回缓存）
+    Returns:
+        {哈希类型: 哈希值（小写16进制）}，失败返回空dict
+
+    老王说：要两种哈希就读两遍盘？几十G的文件可读不起！
+    两块缓冲区轮着用：各个哈希在线程里算这一块（大块数据上都释放GIL，真并行），同时读下一块；
+    文件不到一块就直接算，不开线程。
+    """
+    hash_types = list(dict.fromkeys(hash_type.lower() for hash_type in hash_types))
+    try:
+        hashers = {hash_type: _new_hasher(hash_type) for hash_type in hash_types}
+    except ValueError as e:
+        logger.error("计算哈希失败: %s", e)
+        return {}
+
+    try:
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        result = {}
+        if use_cache and _hash_cache is not None:
+            cached = _hash_cache.lookup(path, stat)
+            for hash_type in hash_types:
+                if hash_type in cached:
+                    result[hash_type] = cached[hash_type]
+                    del hashers[hash_type]
+
+        if hashers:
+            computed = _hash_file(file_path, stat.st_size, hashers, progress_callback, read_size)
+            if computed is None:
+                return {}
+            after = os.stat(file_path)
+            if _hash_cache is not None and (after.st_size, after.st_mtime_ns, after.st_ino) == \
+                    (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                _hash_cache.store(path, stat, computed)  # 算的时候文件被改了就别存
+            result.update(computed)
+        elif progress_callback:
+            progress_callback(stat.st_size, stat.st_size)
+
+        return {hash_type: result[hash_type] for hash_type in hash_types}
+    except Exception as e:
+        logger.error("计算哈希失败: %s: %s", file_path, e)
+        return {}
+
+
 def calculate_file_hash(file_path: str,
                         hash_type: str = "md5",
-                        progress_callback: Optional[Callable[[int, int], None]] = None) -> str:
+                        progress_callback: Optional[Callable[[int, int], None]] = None,
+                        read_size: int = HASH_READ_SIZE,
+                        use_cache: bool = True) -> str:
     """
     计算文件哈希值
     Args:
         file_path: 文件路径
-        hash_type: 哈希类型，支持 md5/sha256
-        progress_callback: 进度回调 callback(processed_bytes, total_bytes)
+        hash_type: 哈希类型，见 HASH_TYPES
+        progress_callback: 进度回调 callback(processed_bytes, total_bytes)，返回False就中止（返回空字符串）
+        read_size: 每次读的字节数
+        use_cache: 先查哈希缓存，False表示强制重读
     Returns:
         哈希值字符串（小写16进制），失败返回空字符串
 
     老王说：大文件哈希计算得分块读，不然内存会爆炸！
     """
     hash_type = hash_type.lower()
-    if hash_type == "md5":
-        hasher = hashlib.md5()
-    elif hash_type == "sha256":
-        hasher = hashlib.sha256()
-    else:
-        print(f"[错误] 不支持的哈希类型: {hash_type}")
-        return ""
-
-    try:
-        total_size = os.path.getsize(file_path)
-        processed = 0
-        chunk_size = 8 * 1024 * 1024  # 8MB一块，平衡速度和内存
-
-        with open(file_path, 'rb') as f:
-            while True:
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                hasher.update(data)
-                processed += len(data)
-                if progress_callback:
-                    progress_callback(processed, total_size)
-
-        return hasher.hexdigest().lower()
-    except Exception as e:
-        print(f"[错误] 计算哈希失败: {e}")
-        return ""
+    return calculate_file_hashes(file_path, [hash_type], progress_callback, read_size, use_cache).get(hash_type, "")
 
 
-def verify_file_hash(file_path: str, expected_hash: str, hash_type: str = "md5") -> bool:
+def verify_file_hash(file_path: str, expected_hash: str, hash_type: str = "md5", use_cache: bool = True) -> bool:
     """
     验证文件哈希
     Args:
         file_path: 文件路径
         expected_hash: 预期哈希值
         hash_type: 哈希类型
+        use_cache: 先查哈希缓存（文件没变过就不读了），False表示强制重读
     Returns:
         True表示匹配，False表示不匹配
     """
-    actual = calculate_file_hash(file_path, hash_type)
+    actual = calculate_file_hash(file_path, hash_type, use_cache=use_cache)
     if not actual:
         return False
     return actual == expected_hash.lower()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+日志
+老王说：下载线程里直接print，失败一多标准输出一堵，下载线程全陪着等；打包成exe连个控制台都没有，出了事往哪看？
+
+- 各模块用 logging.getLogger(__name__)，都挂在 "downloader" 这棵树下
+- 下载线程只管把记录塞进队列（满了就扔，绝不阻塞），后台线程负责写控制台和文件
+- 文件是JSON Lines（一行一条，带模块、线程、extra里的task_id/chunk_id等字段），按大小滚动
+- 同一处代码的警告/错误刷屏时限流：每个窗口只放前几条，省略的条数记在下一条里
+
+没调用 setup_logging() 时（比如被别的程序当库用）走logging的默认行为：警告以上打到标准错误。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+ROOT_LOGGER = 'downloader'
+LOG_FILENAME = 'downloader.log.jsonl'
+
+# 队列最多积压多少条（后台线程写不过来时新日志直接扔）
+QUEUE_SIZE = 10000
+# 限流：同一处代码（logger+消息模板）每个窗口最多放行这么多条警告/错误
+RATE_LIMIT_WINDOW = 60.0
+RATE_LIMIT_BURST = 10
+
+_LEVEL_TAGS = {
+    logging.DEBUG: '调试',
+    logging.INFO: '信息',
+    logging.WARNING: '警告',
+    logging.ERROR: '错误',
+    logging.CRITICAL: '严重',
+}
+
+# LogRecord自带的属性，剩下的就是调用方通过extra塞进来的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'suppressed'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class ConsoleFormatter(logging.Formatter):
+    """控制台：[错误] 分块3下载失败 ...（和以前print出来的样子差不多）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = f"[{_LEVEL_TAGS.get(record.levelno, record.levelname)}] {record.getMessage()}"
+        if getattr(record, 'suppressed', 0):
+            text += f"（同类日志省略了{record.suppressed}条）"
+        if record.exc_text:
+            text += '\n' + record.exc_text
+        return text
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """文件：一条一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    重复日志限流
+    按 (logger, 消息模板) 计数，窗口内超过burst条的直接丢掉，
+    窗口过了之后放行的第一条带上 suppressed=省略条数
+    """
+
+    def __init__(self, window: float = RATE_LIMIT_WINDOW, burst: int = RATE_LIMIT_BURST,
+                 min_level: int = logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.min_level = min_level
+        self._state: Dict[Tuple[str, str], list] = {}  # key -> [窗口开始, 已放行, 已省略]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满了就扔，不让下载线程等"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = 'INFO', log_dir: Optional[str] = None, console: bool = True) -> Optional[str]:
+    """
+    配置 "downloader" 日志树（进程里调一次就行，重复调用会先拆掉上一次的）
+    Args:
+        level: DEBUG/INFO/WARNING/ERROR
+        log_dir: 日志文件目录，None表示不写文件
+        console: 是否输出到标准错误
+    Returns:
+        日志文件路径（不写文件时None）
+    """
+    global _listener
+    handlers = []
+    if console:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(ConsoleFormatter())
+        handlers.append(console_handler)
+
+    log_path = None
+    if log_dir:
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            log_path = os.path.join(log_dir, LOG_FILENAME)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8', delay=True)
+            file_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"[错误] 日志目录不可用，只输出到控制台: {log_dir}: {e}", file=sys.stderr)
+            log_path = None
+
+    with _setup_lock:
+        logger = logging.getLogger(ROOT_LOGGER)
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+        logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+        logger.propagate = False
+        if not handlers:
+            logger.addHandler(logging.NullHandler())
+            return None
+
+        queue_handler = _DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        queue_handler.addFilter(RateLimitFilter())
+        logger.addHandler(queue_handler)
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    return log_path
+
+
+def shutdown_logging():
+    """把队列里剩下的日志写完（退出前调用）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
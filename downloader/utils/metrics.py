@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标（Prometheus文本格式）
+老王说：线上慢了光靠翻 print 日志猜？猜到天亮也猜不出时间花哪儿了！
+引擎各处埋计数器/仪表/直方图，开了 metrics_enabled 后控制接口的 GET /metrics 直接给Prometheus抓。
+
+默认关闭：关闭时 labels() 返回一个什么都不做的空对象，热路径上只多一次函数调用。
+不依赖 prometheus_client，就这点格式自己拼。
+
+用法：
+    BYTES = Counter('downloader_bytes_received_total', '收到的字节数', ['host'])
+    BYTES.labels('example.com').inc(8192)
+    LATENCY = Histogram('downloader_request_ttfb_seconds', '首字节延迟', ['host'])
+    LATENCY.labels(host).observe(0.12)
+"""
+import bisect
+import logging
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 时间类直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_registry: List['_Metric'] = []
+_registry_lock = threading.Lock()
+
+
+def enable():
+    """打开指标采集（进程级，开了就不关）"""
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _NoopChild:
+    """指标没开时的占位：所有操作都是空的"""
+
+    def inc(self, amount: float = 1.0):
+        pass
+
+    def dec(self, amount: float = 1.0):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+_NOOP = _NoopChild()
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', '_upper_bounds', 'bucket_counts', 'sum', 'count')
+
+    def __init__(self, lock: threading.Lock, upper_bounds: Tuple[float, ...]):
+        self._lock = lock
+        self._upper_bounds = upper_bounds
+        self.bucket_counts = [0] * len(upper_bounds)  # 不累加，输出时再累加
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            if index < len(self.bucket_counts):
+                self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    """指标基类：按标签值分子序列"""
+
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """按标签值取子序列（没开指标时返回空对象）"""
+        if not _enabled:
+            return _NOOP
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def _sample_lines(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = self._sample_lines()
+        if not lines:
+            return []
+        return [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.TYPE}"] + lines
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount: float = 1.0):
+        """无标签时的快捷写法"""
+        self.labels().inc(amount)
+
+    def _sample_lines(self) -> List[str]:
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._items()]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值；也可以挂个函数，抓取时现算（队列长度这类）"""
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], Union[float, Dict[Tuple[str, ...], float]]]] = None
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+    def set_function(self, function: Callable[[], Union[float, Dict[Tuple[str, ...], float]]]):
+        """
+        抓取时调用function取值
+        Args:
+            function: 无标签返回数值；有标签返回 {标签值元组: 数值}
+        """
+        self._function = function
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _sample_lines(self) -> List[str]:
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                logger.error("指标取值失败: %s: %s", self.name, e)
+                return []
+            items = result.items() if isinstance(result, dict) else [((), result)]
+            return [f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}"
+                    for values, value in items]
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._items()]
+
+
+class Histogram(_Metric):
+    """分桶统计（延迟、耗时）"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _sample_lines(self) -> List[str]:
+        lines = []
+        for values, child in self._items():
+            with self._lock:
+                counts, total, count = list(child.bucket_counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.upper_bounds, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, values)} {count}")
+        return lines
+
+
+def render() -> str:
+    """所有指标的Prometheus文本（exposition format 0.0.4）"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
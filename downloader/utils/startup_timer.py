@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时统计
+老王说：启动慢不能靠猜，哪一步慢先量出来再说！
+每个阶段结束调一次 mark()，窗口画出来、任务列表加载完以后 report() 打一行汇总
+"""
+import time
+from typing import List, Optional, Tuple
+
+
+class StartupTimer:
+    """按阶段记录启动耗时"""
+
+    def __init__(self, start: Optional[float] = None):
+        """
+        Args:
+            start: 计时起点（time.perf_counter()的值，默认现在）
+        """
+        self._start = start if start is not None else time.perf_counter()
+        self._last = self._start
+        self.phases: List[Tuple[str, float]] = []  # [(阶段名, 耗时秒), ...]
+        self.reported = False
+
+    def mark(self, phase: str):
+        """记一个阶段：从上一次mark（或起点）到现在的耗时"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def elapsed(self) -> float:
+        """从起点到现在的总耗时（秒）"""
+        return time.perf_counter() - self._start
+
+    def report(self):
+        """打印各阶段耗时（只打一次）"""
+        if self.reported:
+            return
+        self.reported = True
+        parts = ' | '.join(f"{phase} {cost * 1000:.0f}ms" for phase, cost in self.phases)
+        print(f"[启动] 启动耗时 {self.elapsed() * 1000:.0f}ms: {parts}")
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+下载时间线追踪（导出Chrome Trace Event JSON，拖进 https://ui.perfetto.dev 或 chrome://tracing 看）
+老王说：下得慢到底慢在哪？探测、首字节、限流、重试、写盘还是某个拖后腿的分块，画成时间线一眼就看出来！
+
+按任务抽样（trace_sample_rate，0关闭）：按task_id算哈希决定，同一个任务重启后还是同样的结果，
+没抽中的任务 trace_for() 直接返回None，热路径上什么都不多做。
+每个任务一个文件：任务本身是第0行（探测/合并/校验），每个分块一行（每次尝试、首字节、限速等待、写盘阻塞、重试退避）。
+
+用法：
+    trace = tracing.trace_for(task_id)
+    if trace:
+        with trace.span('探测', cat='probe'):
+            ...
+"""
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 单个任务最多记这么多事件（限速下载几个小时也不能把内存吃光）
+MAX_EVENTS_PER_TASK = 50000
+# 任务级的事件都画在这一行
+TASK_TID = 0
+
+_sample_rate = 0.0
+_output_dir: Optional[str] = None
+_traces: Dict[str, 'TaskTrace'] = {}
+_traces_lock = threading.Lock()
+_epoch = time.perf_counter()  # 时间戳都相对它算（微秒）
+
+
+def configure(sample_rate: float, output_dir: Optional[str] = None):
+    """
+    设置抽样比例和导出目录（进程级）
+    Args:
+        sample_rate: 0~1，抽中的任务比例，0表示关闭
+        output_dir: 任务结束时trace文件写到这里，None表示只留在内存（通过接口取）
+    """
+    global _sample_rate, _output_dir
+    _sample_rate = min(1.0, max(0.0, float(sample_rate or 0)))
+    _output_dir = output_dir
+
+
+def is_sampled(task_id: str) -> bool:
+    """这个任务要不要追踪（按task_id哈希，结果稳定）"""
+    if _sample_rate <= 0:
+        return False
+    if _sample_rate >= 1:
+        return True
+    return zlib.crc32(task_id.encode('utf-8')) % 10000 < _sample_rate * 10000
+
+
+def trace_for(task_id: str) -> Optional['TaskTrace']:
+    """取任务的追踪记录（没抽中返回None）"""
+    if _sample_rate <= 0:
+        return None
+    trace = _traces.get(task_id)
+    if trace is None:
+        if not is_sampled(task_id):
+            return None
+        with _traces_lock:
+            trace = _traces.setdefault(task_id, TaskTrace(task_id))
+    return trace
+
+
+def now() -> float:
+    """追踪用的时钟（秒，和 TaskTrace.add 的start/end配套）"""
+    return time.perf_counter()
+
+
+class TaskTrace:
+    """一个任务的所有事件"""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self._events: List[Dict] = []
+        self._thread_names: Dict[int, str] = {TASK_TID: '任务'}
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def _append(self, event: Dict):
+        with self._lock:
+            if len(self._events) >= MAX_EVENTS_PER_TASK:
+                self._dropped += 1
+                return
+            self._events.append(event)
+
+    def name_thread(self, tid: int, name: str):
+        """给一行起名（Perfetto里显示在左边）"""
+        self._thread_names[tid] = name
+
+    def add(self, name: str, start: float, end: float, tid: int = TASK_TID, cat: str = '',
+            args: Optional[Dict] = None):
+        """
+        记一段已经结束的区间
+        Args:
+            start/end: now() 取的时间（秒）
+        """
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': round((start - _epoch) * 1e6, 1),
+                 'dur': round(max(0.0, end - start) * 1e6, 1), 'pid': 1, 'tid': tid}
+        if args:
+            event['args'] = args
+        self._append(event)
+
+    def instant(self, name: str, tid: int = TASK_TID, cat: str = '', args: Optional[Dict] = None):
+        """记一个时间点"""
+        event = {'name': name, 'cat': cat, 'ph': 'i', 's': 't',
+                 'ts': round((time.perf_counter() - _epoch) * 1e6, 1), 'pid': 1, 'tid': tid}
+        if args:
+            event['args'] = args
+        self._append(event)
+
+    @contextmanager
+    def span(self, name: str, tid: int = TASK_TID, cat: str = '', **args):
+        """with块包起来的区间；块里可以往yield出来的dict里补参数"""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, start, time.perf_counter(), tid, cat, args)
+
+    def to_chrome(self, label: str = '') -> Dict:
+        """导出成Chrome Trace Event格式"""
+        with self._lock:
+            events = list(self._events)
+            dropped = self._dropped
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': TASK_TID,
+                     'args': {'name': label or self.task_id}}]
+        for tid, name in sorted(self._thread_names.items()):
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+            metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'sort_index': tid}})
+        return {
+            'traceEvents': metadata + events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'task_id': self.task_id, 'dropped_events': dropped},
+        }
+
+
+def get_trace(task_id: str, label: str = '') -> Optional[Dict]:
+    """任务当前的追踪数据（Chrome Trace格式），没有就返回None"""
+    trace = _traces.get(task_id)
+    return trace.to_chrome(label) if trace else None
+
+
+def export(task_id: str, label: str = '', keep: bool = False) -> Optional[str]:
+    """
+    把任务的追踪写到导出目录
+    Args:
+        label: 显示名（一般用文件名）
+        keep: 写完继续记（暂停后还会接着下），False就从内存里扔掉
+    Returns:
+        写出的文件路径，没追踪/没配导出目录返回None
+    """
+    with _traces_lock:
+        trace = _traces.get(task_id) if keep else _traces.pop(task_id, None)
+    if trace is None or not _output_dir:
+        return None
+    path = os.path.join(_output_dir, f"{task_id}.trace.json")
+    try:
+        os.makedirs(_output_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace.to_chrome(label), f, ensure_ascii=False)
+    except OSError as e:
+        logger.error("写入追踪文件失败: %s: %s", path, e)
+        return None
+    return path
+
+
+def discard(task_id: str):
+    """任务删了，追踪也扔掉"""
+    with _traces_lock:
+        _traces.pop(task_id, None)
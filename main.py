@@ -3,51 +3,137 @@
 老王下载器 - 启动入口
 IDM风格的多线程下载器，支持断点续传、队列管理
 
+用法: python main.py [URL ...]
+已经有实例在跑时，URL会交给它处理（窗口调到前台），自己直接退出。
+
 作者：老王
 版本：v1.0
 """
+import time
+_START = time.perf_counter()  # 启动计时起点（越早越准）
+
 import sys
 import os
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from downloader.database.db_manager import DatabaseManager
+# 这里只import轻量模块：第二次启动只转发URL，用不着Tk和下载引擎
 from downloader.utils.config import ConfigManager
-from downloader.core.download_engine import DownloadEngine
-from downloader.core.task_manager import TaskManager
-from downloader.ui.main_window import MainWindow
+from downloader.utils.startup_timer import StartupTimer
+from downloader.service.protocol import MODE_GUI
+from downloader.service.single_instance import InstanceLock, wait_for_instance, forward_urls
 
+# 数据库路径（单实例锁也按它来）
+DB_PATH = "data/downloads.db"
 
-def main():
-    """主函数"""
-    print("[启动] 老王下载器正在启动...")
 
-    # 初始化配置管理器
-    config_manager = ConfigManager()
-    print(f"[配置] 下载目录: {config_manager.download_dir}")
-    print(f"[配置] 默认线程数: {config_manager.thread_count}")
+def run_secondary(config_manager: ConfigManager, urls: list, timer: StartupTimer):
+    """已有实例持有锁：把URL交给它"""
+    client, info = wait_for_instance(config_manager.api_port)
+    if client is None:
+        print("[错误] 已经有一个实例在运行，但连不上它的控制接口")
+        return
+
+    if urls:
+        task_ids = forward_urls(client, [(url, None) for url in urls])
+        print(f"[启动] 已把 {sum(1 for t in task_ids if t)}/{len(urls)} 个任务交给正在运行的实例")
+
+    if info.get('mode') == MODE_GUI:
+        # 对方就是界面，把它的窗口调出来就完事
+        try:
+            client.request('POST', 'window/show')
+        except Exception as e:
+            print(f"[错误] 调出已运行的窗口失败: {e}")
+        return
+
+    # 对方是常驻服务/命令行批量任务：界面只当遥控器连上去
+    from downloader.service.api_client import RemoteTaskManager
+    from downloader.ui.main_window import MainWindow
+    print(f"[服务] 连接到已运行的下载服务: {client.base_url}")
+    timer.mark("导入界面")
+    app = MainWindow(RemoteTaskManager(client.base_url, config_manager), startup_timer=timer)
+    app.mainloop()
+    print("[退出] 老王下载器已关闭（下载服务继续运行）")
+
+
+def run_primary(config_manager: ConfigManager, urls: list, timer: StartupTimer):
+    """持有锁：完整启动引擎和界面，并开控制接口接收后来实例转发的URL"""
+    from downloader.database.db_manager import DatabaseManager
+    from downloader.core.download_engine import DownloadEngine
+    from downloader.core.task_manager import TaskManager
+    from downloader.service.api_server import ApiServer
+    from downloader.ui.main_window import MainWindow
+    from downloader.utils.log import setup_logging
+    timer.mark("导入模块")
+
+    # 日志（只有持有锁的实例写，免得两个进程抢着滚动同一个文件）
+    log_path = setup_logging(config_manager.log_level, os.path.join(os.path.dirname(DB_PATH), "logs"))
+    print(f"[日志] 日志文件: {log_path}")
 
     # 初始化数据库
-    db_manager = DatabaseManager()
+    db_manager = DatabaseManager(DB_PATH)
     print("[数据库] 数据库初始化完成")
+    timer.mark("数据库")
 
-    # 初始化下载引擎
+    # 初始化下载引擎（会把任务记录读进内存）
     download_engine = DownloadEngine(db_manager, config_manager)
     print("[引擎] 下载引擎初始化完成")
+    timer.mark("下载引擎")
 
     # 初始化任务管理器
     task_manager = TaskManager(download_engine, db_manager, config_manager.max_concurrent_downloads)
     print("[管理器] 任务管理器初始化完成")
+    timer.mark("任务管理器")
 
-    # 创建并启动GUI
+    # 创建并启动GUI（任务列表、托盘在窗口画出来以后才加载，耗时由窗口接着记）
     print("[GUI] 启动图形界面...")
-    app = MainWindow(task_manager)
+    app = MainWindow(task_manager, startup_timer=timer)
+
+    # 控制接口（后来的实例靠它转发URL；端口被占就算了，不影响本实例使用）
+    server = None
+    try:
+        server = ApiServer(task_manager, port=config_manager.api_port, mode=MODE_GUI)
+        server.set_show_window_callback(app.show_window)
+        server.start()
+    except OSError as e:
+        print(f"[警告] 控制接口启动失败（端口{config_manager.api_port}被占用？）: {e}")
+
+    for url in urls:
+        task_manager.add_task(url)
+
     app.mainloop()
 
+    if server:
+        server.stop()
     print("[退出] 老王下载器已关闭")
 
 
+def main():
+    """主函数"""
+    print("[启动] 老王下载器正在启动...")
+    timer = StartupTimer(_START)
+
+    # 初始化配置管理器
+    config_manager = ConfigManager()
+    print(f"[配置] 下载目录: {config_manager.download_dir}")
+    print(f"[配置] 默认线程数: {config_manager.thread_count}")
+    timer.mark("读取配置")
+
+    urls = sys.argv[1:]
+
+    # 单实例：同一个数据库只能有一个实例在跑
+    lock = InstanceLock(DB_PATH)
+    if not lock.acquire():
+        run_secondary(config_manager, urls, timer)
+        return
+
+    try:
+        run_primary(config_manager, urls, timer)
+    finally:
+        lock.release()
+
+
 if __name__ == "__main__":
     try:
         main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+测试公用的夹具
+老王说：测试一律用临时目录里的库，别碰 data/downloads.db！
+"""
+import threading
+import time
+
+import pytest
+
+from benchmarks.range_server import RangeServer, ServerOptions
+from downloader.database.db_manager import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    """临时目录里的空数据库"""
+    manager = DatabaseManager(str(tmp_path / 'downloads.db'))
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def start_origin():
+    """起本地源站：start_origin(**ServerOptions参数) -> RangeServer"""
+    servers = []
+
+    def start(**options):
+        server = RangeServer(options=ServerOptions(**options))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def origin(start_origin):
+    """限速源站（每条连接64KB/s，8MB的文件怎么也下不完）"""
+    return start_origin(bandwidth=64 * 1024)
+
+
+@pytest.fixture
+def engine(db, tmp_path):
+    """单独的下载引擎（没有任务管理器，探测完不会自动开始下）"""
+    from downloader.core.download_engine import DownloadEngine
+    from downloader.utils.config import ConfigManager
+    from downloader.utils.file_utils import set_hash_cache
+
+    config = ConfigManager(str(tmp_path / 'config.json'))
+    config.download_dir = str(tmp_path / 'out')
+    config.set('temp_dir', str(tmp_path / 'temp'))
+    engine = DownloadEngine(db, config)
+    yield engine
+    engine.shutdown()
+    set_hash_cache(None)
+
+
+@pytest.fixture
+def make_task_manager(tmp_path):
+    """建一套 数据库+引擎+任务管理器（目录都在临时目录里）；同一个tmp_path再建一套就是“重启”"""
+    from downloader.core.download_engine import DownloadEngine
+    from downloader.core.task_manager import TaskManager
+    from downloader.utils.config import ConfigManager
+    from downloader.utils.file_utils import set_hash_cache
+
+    managers = []
+
+    def make(max_concurrent: int = 3):
+        config = ConfigManager(str(tmp_path / 'config.json'))
+        config.download_dir = str(tmp_path / 'out')
+        config.set('temp_dir', str(tmp_path / 'temp'))
+        db = DatabaseManager(str(tmp_path / 'downloads.db'))
+        manager = TaskManager(DownloadEngine(db, config), db, max_concurrent)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.shutdown()
+    set_hash_cache(None)
+
+
+def wait_until(predicate, timeout: float = 10.0) -> bool:
+    """轮询到条件成立（超时返回False）"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
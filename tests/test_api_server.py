@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""本机下载服务的HTTP接口"""
+import http.client
+import json
+
+import pytest
+
+from downloader.service.api_client import ApiClient
+from downloader.service.api_server import ApiServer
+
+
+@pytest.fixture
+def server(make_task_manager):
+    api = ApiServer(make_task_manager(), port=0)
+    api.start()
+    yield api
+    api.stop()
+
+
+def _request(server, method, path, body=None, headers=None):
+    """原样发请求（能改Host/Origin），返回 (状态码, JSON)"""
+    host, port = server._httpd.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        all_headers = {'Content-Type': 'application/json'} if body is not None else {}
+        all_headers.update(headers or {})
+        conn.request(method, path, body=data, headers=all_headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        conn.close()
+
+
+def test_local_client_is_accepted(server):
+    assert ApiClient(server.address).ping()
+    port = server._httpd.server_address[1]
+    assert _request(server, 'GET', '/api/ping', headers={'Host': f'localhost:{port}'})[0] == 200
+
+
+def test_rebound_host_is_rejected(server):
+    port = server._httpd.server_address[1]
+    status, data = _request(server, 'POST', '/api/tasks', body={'url': 'http://example.com/a', 'save_path': '/tmp'},
+                            headers={'Host': f'evil.example:{port}'})
+    assert status == 403
+    assert server.task_manager.get_all_tasks() == []
+    assert _request(server, 'GET', '/api/ping', headers={'Host': 'localhost:1'})[0] == 403
+
+
+def test_cross_site_origin_is_rejected(server):
+    port = server._httpd.server_address[1]
+    status, _ = _request(server, 'POST', '/api/tasks/pause_all', body={},
+                         headers={'Origin': 'http://evil.example'})
+    assert status == 403
+    status, _ = _request(server, 'POST', '/api/tasks/pause_all', body={},
+                         headers={'Origin': f'http://127.0.0.1:{port}'})
+    assert status == 200
+
+
+def test_post_requires_json(server):
+    assert _request(server, 'POST', '/api/tasks/pause_all', headers={'Content-Length': '0'})[0] == 415
+
+
+def test_unparsable_parameters_are_bad_requests(server):
+    assert _request(server, 'GET', '/api/tasks?limit=abc')[0] == 400
+    assert _request(server, 'GET', '/api/tasks?cursor=%7Bnot-json')[0] == 400
+    assert _request(server, 'GET', '/api/history?limit=1.5')[0] == 400
+    assert _request(server, 'GET', '/api/tasks?limit=10')[0] == 200
+
+
+def test_task_endpoints(server, origin):
+    status, data = _request(server, 'POST', '/api/tasks', body={'url': f"{origin.base_url}/1024/a.bin"})
+    assert status == 201
+    task_id = data['task_id']
+    assert _request(server, 'GET', f'/api/tasks/{task_id}')[1]['task_id'] == task_id
+    assert [task['task_id'] for task in _request(server, 'GET', '/api/tasks?limit=5')[1]['tasks']] == [task_id]
+    assert _request(server, 'GET', '/api/tasks/nope')[0] == 404
+    assert _request(server, 'POST', '/api/tasks', body={})[0] == 400
+    assert _request(server, 'POST', '/api/tasks', body={'url': 'http://a/b', 'hash_type': 'md4'})[0] == 400
+    assert _request(server, 'GET', '/api/nothing')[0] == 404
+
+
+def test_events_stream_starts_with_stats(server):
+    host, port = server._httpd.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request('GET', '/api/events')
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader('Content-Type').startswith('text/event-stream')
+        assert response.fp.readline() == b'event: stats\n'
+        assert json.loads(response.fp.readline().decode('utf-8')[len('data: '):])['total'] == 0
+
+        server.events.publish('status', {'task_id': 't1', 'status': 'paused'})
+        response.fp.readline()
+        assert response.fp.readline() == b'event: status\n'
+        assert json.loads(response.fp.readline().decode('utf-8')[len('data: '):])['task_id'] == 't1'
+    finally:
+        conn.close()
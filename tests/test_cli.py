@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""命令行：参数检查、结果只进标准输出、退出码（成功0/失败1/用法错2）"""
+import json
+import logging
+import socket
+
+import pytest
+
+from downloader import cli
+from downloader.cli import EXIT_FAILED, EXIT_OK, EXIT_USAGE, parse_size, read_url_file
+from downloader.utils import log
+
+SIZE = 256 * 1024
+
+
+@pytest.fixture
+def run(tmp_path, capsys):
+    """main(参数)，数据库/配置/保存目录/端口都隔离在临时目录里；返回(退出码, 标准输出, 标准错误)"""
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'temp_dir': str(tmp_path / 'temp'),
+                                       'download_dir': str(tmp_path / 'out')}), encoding='utf-8')
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    def main(*argv):
+        exit_code = cli.main([*argv, '-q', '--config', str(config_path), '--db', str(tmp_path / 'downloads.db'),
+                              '--port', str(port)])
+        log.shutdown_logging()
+        out, err = capsys.readouterr()
+        return exit_code, out, err
+
+    yield main
+    # main会把"downloader"日志树接管走（不往上传），还给别的测试
+    logger = logging.getLogger(log.ROOT_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.propagate = True
+    logger.setLevel(logging.NOTSET)
+
+
+def test_parse_size():
+    assert parse_size('500K') == 500 * 1024
+    assert parse_size('2m') == 2 * 1024 ** 2
+    assert parse_size('1.5G') == int(1.5 * 1024 ** 3)
+    assert parse_size('1048576') == 1048576
+    for text in ('', 'abc', '5X'):
+        with pytest.raises(Exception):
+            parse_size(text)
+
+
+def test_read_url_file(tmp_path):
+    path = tmp_path / 'urls.txt'
+    path.write_text('# 注释\n\nhttp://a/x.bin\nhttp://b/y.bin  d41d8cd98f00b204e9800998ecf8427e\n', encoding='utf-8')
+    assert read_url_file(str(path)) == [('http://a/x.bin', None),
+                                        ('http://b/y.bin', 'd41d8cd98f00b204e9800998ecf8427e')]
+
+
+def test_usage_errors(run, tmp_path):
+    exit_code, out, _ = run()
+    assert (exit_code, out) == (EXIT_USAGE, '')
+    exit_code, _, err = run('--hash', 'abc', 'http://a/1', 'http://a/2')
+    assert exit_code == EXIT_USAGE and '--hash' in err
+    exit_code, _, _ = run('-i', str(tmp_path / 'missing.txt'))
+    assert exit_code == EXIT_USAGE
+
+
+def test_success_prints_only_saved_paths(run, start_origin, tmp_path):
+    origin = start_origin()
+    urls = [f"{origin.base_url}/{SIZE}/f{index}.bin" for index in range(2)]
+    exit_code, out, _ = run(*urls, '-o', str(tmp_path / 'got'))
+    assert exit_code == EXIT_OK
+    paths = out.splitlines()
+    assert sorted(paths) == sorted(str(tmp_path / 'got' / f'f{index}.bin') for index in range(2))
+    assert all((tmp_path / 'got' / f'f{index}.bin').stat().st_size == SIZE for index in range(2))
+
+
+def test_any_failure_exits_nonzero(run, start_origin, tmp_path):
+    origin = start_origin()
+    good = f"{origin.base_url}/{SIZE}/good.bin"
+    exit_code, out, err = run(good, f"{origin.base_url}/missing", '-o', str(tmp_path / 'got'))
+    assert exit_code == EXIT_FAILED
+    assert out.splitlines() == [str(tmp_path / 'got' / 'good.bin')]
+    assert '[失败]' in err
+
+
+def test_hash_mismatch_exits_nonzero(run, start_origin, tmp_path):
+    origin = start_origin()
+    exit_code, out, _ = run(f"{origin.base_url}/{SIZE}/f.bin", '--hash', '0' * 32, '-o', str(tmp_path / 'got'))
+    assert exit_code == EXIT_FAILED
+    assert out == ''
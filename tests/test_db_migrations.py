@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""老版本数据库升级到当前表结构（PRAGMA user_version）"""
+import sqlite3
+
+from downloader.database.db_manager import SCHEMA_VERSION, DatabaseManager
+
+# 最早版本的任务表（没有校验字段、没有主机字段，也没设user_version）
+V0_SCHEMA = '''
+    CREATE TABLE download_tasks (
+        task_id TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        save_path TEXT NOT NULL,
+        total_size INTEGER DEFAULT 0,
+        downloaded_size INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending',
+        support_range INTEGER DEFAULT 1,
+        thread_count INTEGER DEFAULT 8,
+        speed REAL DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        error_message TEXT
+    );
+    CREATE TABLE download_chunks (
+        chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        start_byte INTEGER NOT NULL,
+        end_byte INTEGER NOT NULL,
+        downloaded_bytes INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending',
+        temp_file TEXT,
+        retry_count INTEGER DEFAULT 0
+    );
+    CREATE TABLE download_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        file_size INTEGER,
+        download_time REAL,
+        avg_speed REAL,
+        completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_task_status ON download_tasks(status);
+'''
+
+# v5的主机画像表（还没有range_refused_path）
+V5_HOST_PROFILES = '''
+    CREATE TABLE host_profiles (
+        host TEXT PRIMARY KEY,
+        final_host TEXT,
+        redirected INTEGER DEFAULT 0,
+        support_range INTEGER,
+        samples INTEGER DEFAULT 0,
+        avg_throughput REAL DEFAULT 0,
+        best_thread_count INTEGER,
+        best_throughput REAL DEFAULT 0,
+        max_thread_count INTEGER,
+        connection_limit INTEGER,
+        ttfb REAL DEFAULT 0,
+        error_rate REAL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+TABLES = {'download_tasks', 'download_chunks', 'download_history', 'host_profiles',
+          'download_pieces', 'file_hashes', 'library_checks'}
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _names(conn, kind):
+    return {row[0] for row in conn.execute('SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+
+
+def _open_raw(path):
+    return sqlite3.connect(str(path))
+
+
+def test_fresh_database_is_current(tmp_path):
+    path = tmp_path / 'downloads.db'
+    DatabaseManager(str(path)).close()
+    conn = _open_raw(path)
+    try:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert TABLES <= _names(conn, 'table')
+        assert {'range_refused_path', 'range_ok_path'} <= _columns(conn, 'host_profiles')
+        assert 'retry_count' in _columns(conn, 'download_pieces')
+    finally:
+        conn.close()
+
+
+def test_upgrade_from_unversioned_database(tmp_path):
+    path = tmp_path / 'downloads.db'
+    conn = _open_raw(path)
+    conn.executescript(V0_SCHEMA)
+    conn.execute("INSERT INTO download_tasks (task_id, url, filename, save_path, status) "
+                 "VALUES ('t1', 'https://Mirror.Example.com:8443/a.iso', 'a.iso', '/tmp/a.iso', 'paused')")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(str(path))
+    try:
+        task = db.get_task('t1')
+        assert task['status'] == 'paused'
+        assert task['host'] == 'mirror.example.com:8443'  # 老数据从url回填
+        assert task['hash_verified'] == 0
+        assert db.create_task('t2', 'http://b.com/x', 'x', '/tmp/x')
+        assert db.create_piece_map('t2', 1024, 4, '/tmp/t2.tmp')
+    finally:
+        db.close()
+
+    conn = _open_raw(path)
+    try:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert TABLES <= _names(conn, 'table')
+        assert {'expected_hash', 'expected_hash_type', 'actual_hash', 'hash_verified', 'host'} <= \
+            _columns(conn, 'download_tasks')
+        assert 'retry_count' in _columns(conn, 'download_pieces')
+        indexes = _names(conn, 'index')
+        assert 'idx_task_status' not in indexes
+        assert {'idx_task_created', 'idx_task_status_created', 'idx_task_host_created',
+                'idx_task_filename', 'idx_history_completed'} <= indexes
+    finally:
+        conn.close()
+
+
+def test_upgrade_from_v5_adds_range_paths(tmp_path):
+    path = tmp_path / 'downloads.db'
+    DatabaseManager(str(path)).close()
+    conn = _open_raw(path)
+    conn.execute('DROP TABLE host_profiles')
+    conn.execute(V5_HOST_PROFILES)
+    conn.execute("INSERT INTO host_profiles (host, support_range, samples) VALUES ('a.com', 0, 3)")
+    conn.execute('PRAGMA user_version = 5')
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(str(path))
+    try:
+        profiles = db.get_host_profiles()
+        assert len(profiles) == 1
+        assert profiles[0]['host'] == 'a.com'
+        assert profiles[0]['samples'] == 3
+        assert profiles[0]['range_refused_path'] is None  # 老画像的“不支持”没有目录
+        assert profiles[0]['range_ok_path'] is None
+    finally:
+        db.close()
+
+    conn = _open_raw(path)
+    try:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def test_upgrade_from_v6_adds_range_ok_path(tmp_path):
+    path = tmp_path / 'downloads.db'
+    DatabaseManager(str(path)).close()
+    conn = _open_raw(path)
+    conn.execute('DROP TABLE host_profiles')
+    conn.execute(V5_HOST_PROFILES)
+    conn.execute('ALTER TABLE host_profiles ADD COLUMN range_refused_path TEXT')
+    conn.execute("INSERT INTO host_profiles (host, support_range, range_refused_path) VALUES ('a.com', 0, '/x/')")
+    conn.execute('PRAGMA user_version = 6')
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(str(path))
+    try:
+        profile = db.get_host_profiles()[0]
+        assert (profile['range_refused_path'], profile['range_ok_path']) == ('/x/', None)
+    finally:
+        db.close()
+
+
+def test_upgrade_from_v7_adds_piece_retry_count(tmp_path):
+    path = tmp_path / 'downloads.db'
+    DatabaseManager(str(path)).close()
+    conn = _open_raw(path)
+    conn.execute('ALTER TABLE download_pieces DROP COLUMN retry_count')
+    conn.execute("INSERT INTO download_tasks (task_id, url, filename, save_path) VALUES ('t1', 'http://a/b', 'b', '/b')")
+    conn.execute("INSERT INTO download_pieces (task_id, piece_size, piece_count, bitfield, temp_file) "
+                 "VALUES ('t1', 10, 1, x'00', '/t1.part')")
+    conn.execute('PRAGMA user_version = 7')
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(str(path))
+    try:
+        assert db.get_piece_map('t1')['retry_count'] == 0
+        assert db.increment_piece_retry('t1')
+        assert db.get_piece_map('t1')['retry_count'] == 1
+    finally:
+        db.close()
+
+
+def test_current_database_skips_schema_checks(tmp_path):
+    path = tmp_path / 'downloads.db'
+    DatabaseManager(str(path)).close()
+    conn = _open_raw(path)
+    conn.execute('CREATE TABLE marker (id INTEGER)')
+    conn.execute('DROP INDEX idx_task_filename')
+    conn.commit()
+    conn.close()
+
+    # 版本对得上就不再逐条检查，删掉的索引也不会被补回来
+    DatabaseManager(str(path)).close()
+    conn = _open_raw(path)
+    try:
+        assert 'idx_task_filename' not in _names(conn, 'index')
+        assert 'marker' in _names(conn, 'table')
+    finally:
+        conn.close()
+
+
+def test_reopen_keeps_data(tmp_path):
+    path = tmp_path / 'downloads.db'
+    db = DatabaseManager(str(path))
+    db.create_task('t1', 'http://a.com/x', 'x', '/tmp/x', total_size=10)
+    db.close()
+
+    db = DatabaseManager(str(path))
+    try:
+        assert db.get_task('t1')['total_size'] == 10
+    finally:
+        db.close()
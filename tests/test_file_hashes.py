@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""一遍读多种哈希：和hashlib/zlib对得上、双缓冲路径、进度中止、不支持的类型"""
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from downloader.utils import file_utils
+from downloader.utils.file_utils import get_hash_types, calculate_file_hash, calculate_file_hashes
+
+
+@pytest.fixture
+def sample(tmp_path):
+    path = tmp_path / 'a.bin'
+    data = os.urandom(10000)
+    path.write_bytes(data)
+    return str(path), data
+
+
+def _expected(data):
+    return {
+        'md5': hashlib.md5(data).hexdigest(),
+        'sha1': hashlib.sha1(data).hexdigest(),
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'crc32': format(zlib.crc32(data) & 0xffffffff, '08x'),
+    }
+
+
+@pytest.mark.parametrize('read_size', [file_utils.HASH_READ_SIZE, 1024, 333])
+def test_hashes_match_hashlib(sample, read_size):
+    path, data = sample
+    expected = _expected(data)
+    result = calculate_file_hashes(path, ['MD5', 'sha1', 'sha256', 'crc32', 'md5'],
+                                   read_size=read_size, use_cache=False)
+    assert result == expected
+
+
+def test_single_hash_wrapper(sample):
+    path, data = sample
+    assert calculate_file_hash(path, 'sha256', use_cache=False) == hashlib.sha256(data).hexdigest()
+
+
+def test_progress_reaches_total_and_can_abort(sample):
+    path, data = sample
+    seen = []
+    calculate_file_hashes(path, ['md5'], lambda done, total: seen.append((done, total)),
+                          read_size=1024, use_cache=False)
+    assert seen[-1] == (len(data), len(data))
+    assert [done for done, _ in seen] == sorted(done for done, _ in seen)
+
+    assert calculate_file_hashes(path, ['md5', 'sha1'], lambda done, total: False,
+                                 read_size=1024, use_cache=False) == {}
+
+
+def test_unsupported_type_and_missing_file(sample, tmp_path, caplog):
+    path, _ = sample
+    assert calculate_file_hashes(path, ['md5', 'nope'], use_cache=False) == {}
+    assert calculate_file_hashes(str(tmp_path / 'missing.bin'), ['md5'], use_cache=False) == {}
+    assert calculate_file_hash(str(tmp_path / 'missing.bin'), 'md5', use_cache=False) == ''
+    assert any('计算哈希失败' in record.getMessage() for record in caplog.records)
+
+
+def test_available_types_are_computable(sample):
+    path, _ = sample
+    types = get_hash_types()
+    result = calculate_file_hashes(path, types, read_size=4096, use_cache=False)
+    assert set(result) == set(types)
+    assert all(result.values())
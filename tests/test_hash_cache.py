@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""文件哈希缓存：大小/修改时间/inode有一个变了就作废"""
+import hashlib
+import os
+
+import pytest
+
+from downloader.core.hash_cache import HashCache
+from downloader.utils import file_utils
+
+
+@pytest.fixture
+def cache(db):
+    return HashCache(db)
+
+
+@pytest.fixture
+def installed_cache(cache):
+    file_utils.set_hash_cache(cache)
+    yield cache
+    file_utils.set_hash_cache(None)
+
+
+@pytest.fixture
+def sample(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'hello world')
+    return str(path)
+
+
+def test_lookup_hits_when_file_unchanged(cache, sample):
+    cache.store(sample, os.stat(sample), {'md5': 'aaa', 'sha1': 'bbb'})
+    assert cache.lookup(sample, os.stat(sample)) == {'md5': 'aaa', 'sha1': 'bbb'}
+
+
+def test_lookup_misses_after_size_change(cache, sample):
+    stat = os.stat(sample)
+    cache.store(sample, stat, {'md5': 'aaa'})
+    with open(sample, 'ab') as f:
+        f.write(b'!')
+    os.utime(sample, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.lookup(sample, os.stat(sample)) == {}
+
+
+def test_lookup_misses_after_mtime_change(cache, sample):
+    stat = os.stat(sample)
+    cache.store(sample, stat, {'md5': 'aaa'})
+    os.utime(sample, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache.lookup(sample, os.stat(sample)) == {}
+
+
+def test_lookup_misses_after_file_replaced(cache, sample, tmp_path):
+    stat = os.stat(sample)
+    cache.store(sample, stat, {'md5': 'aaa'})
+    # 同样大小、同样修改时间的另一个文件换上来，只有inode不一样
+    replacement = tmp_path / 'b.bin'
+    replacement.write_bytes(b'HELLO WORLD')
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, sample)
+    new_stat = os.stat(sample)
+    assert (new_stat.st_size, new_stat.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+    assert new_stat.st_ino != stat.st_ino
+    assert cache.lookup(sample, new_stat) == {}
+
+
+def test_store_drops_hashes_of_old_file(cache, db, sample):
+    old_stat = os.stat(sample)
+    cache.store(sample, old_stat, {'md5': 'aaa', 'sha1': 'bbb'})
+    os.utime(sample, ns=(old_stat.st_atime_ns, old_stat.st_mtime_ns + 1))
+    cache.store(sample, os.stat(sample), {'md5': 'ccc'})
+
+    assert cache.lookup(sample, old_stat) == {}
+    assert cache.lookup(sample, os.stat(sample)) == {'md5': 'ccc'}
+    assert db.get_file_hashes(sample, old_stat.st_size, old_stat.st_mtime_ns, old_stat.st_ino) == {}
+
+
+def test_lookup_returns_empty_on_db_error(cache, sample, monkeypatch):
+    def broken(*args):
+        raise RuntimeError('db gone')
+    monkeypatch.setattr(cache.db, 'get_file_hashes', broken)
+    assert cache.lookup(sample, os.stat(sample)) == {}
+
+
+def test_calculate_file_hash_uses_and_fills_cache(installed_cache, sample, monkeypatch):
+    expected = hashlib.md5(b'hello world').hexdigest()
+    assert file_utils.get_cached_hash(sample, 'md5') == ''
+    assert file_utils.calculate_file_hash(sample, 'md5') == expected
+    assert file_utils.get_cached_hash(sample, 'MD5') == expected
+
+    # 缓存命中就不读文件
+    def no_read(*args):
+        raise AssertionError('should not read the file')
+    monkeypatch.setattr(file_utils, '_hash_file', no_read)
+    assert file_utils.calculate_file_hash(sample, 'md5') == expected
+
+
+def test_calculate_file_hash_rereads_when_asked_or_changed(installed_cache, sample):
+    installed_cache.store(sample, os.stat(sample), {'md5': 'stale'})
+    expected = hashlib.md5(b'hello world').hexdigest()
+    assert file_utils.calculate_file_hash(sample, 'md5') == 'stale'
+    assert file_utils.calculate_file_hash(sample, 'md5', use_cache=False) == expected
+    assert file_utils.get_cached_hash(sample, 'md5') == expected
+
+    with open(sample, 'ab') as f:
+        f.write(b'!')
+    assert file_utils.calculate_file_hash(sample, 'md5') == hashlib.md5(b'hello world!').hexdigest()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""主机熔断与并发控制：加性增/乘性减、连续失败和错误率熔断、半开探测"""
+from types import SimpleNamespace
+
+import pytest
+
+from downloader.core import host_governor
+from downloader.core.host_governor import (
+    OUTCOME_ERROR, OUTCOME_IGNORED, OUTCOME_SUCCESS, OUTCOME_THROTTLED, SLOT_RETRY_DELAY,
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, HostGovernor, get_host_key,
+)
+
+HOST = 'example.com'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可以手动拨的monotonic时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(host_governor, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _request(governor, outcome, host=HOST):
+    assert governor.acquire(host) is None
+    governor.release(host, outcome)
+
+
+def test_get_host_key_keeps_port_and_lowercases():
+    assert get_host_key('https://Example.COM:8443/a/b.iso') == 'example.com:8443'
+
+
+def test_acquire_respects_limit():
+    governor = HostGovernor(max_connections_per_host=2)
+    assert governor.acquire(HOST) is None
+    assert governor.acquire(HOST) is None
+    assert governor.acquire(HOST) == SLOT_RETRY_DELAY
+    governor.release(HOST, OUTCOME_SUCCESS)
+    assert governor.acquire(HOST) is None
+    assert governor.get_host_state(HOST)['active'] == 2
+
+
+def test_throttling_halves_limit_down_to_one():
+    governor = HostGovernor(max_connections_per_host=8, failure_threshold=100)
+    for expected in (4, 2, 1, 1):
+        _request(governor, OUTCOME_THROTTLED)
+        assert governor.get_host_state(HOST)['limit'] == expected
+    assert governor.get_host_state(HOST)['throttled'] == 4
+
+
+def test_successes_add_one_slot_per_limit_in_a_row():
+    governor = HostGovernor(max_connections_per_host=4, failure_threshold=100)
+    _request(governor, OUTCOME_THROTTLED)
+    _request(governor, OUTCOME_THROTTLED)
+    assert governor.get_host_state(HOST)['limit'] == 1
+
+    _request(governor, OUTCOME_SUCCESS)
+    assert governor.get_host_state(HOST)['limit'] == 2
+    _request(governor, OUTCOME_SUCCESS)
+    assert governor.get_host_state(HOST)['limit'] == 2
+    _request(governor, OUTCOME_SUCCESS)
+    assert governor.get_host_state(HOST)['limit'] == 3
+    for _ in range(20):
+        _request(governor, OUTCOME_SUCCESS)
+    assert governor.get_host_state(HOST)['limit'] == 4  # 不超过上限
+
+
+def test_consecutive_failures_trip_then_half_open_probe_recovers(clock):
+    governor = HostGovernor(max_connections_per_host=4, failure_threshold=3, base_cooldown=5.0)
+    for _ in range(3):
+        _request(governor, OUTCOME_ERROR)
+    state = governor.get_host_state(HOST)
+    assert state['state'] == STATE_OPEN
+    assert state['trips'] == 1
+    assert governor.acquire(HOST) == pytest.approx(5.0)
+
+    clock[0] += 5.0
+    # 冷却结束只放一个探测请求
+    assert governor.acquire(HOST) is None
+    assert governor.get_host_state(HOST)['state'] == STATE_HALF_OPEN
+    assert governor.acquire(HOST) == SLOT_RETRY_DELAY
+    governor.release(HOST, OUTCOME_SUCCESS)
+    assert governor.get_host_state(HOST)['state'] == STATE_CLOSED
+
+    # 恢复后冷却时长回到初始值
+    for _ in range(3):
+        _request(governor, OUTCOME_ERROR)
+    assert governor.acquire(HOST) == pytest.approx(5.0)
+
+
+def test_failed_probe_reopens_with_doubled_cooldown_up_to_max(clock):
+    governor = HostGovernor(failure_threshold=1, base_cooldown=5.0, max_cooldown=12.0)
+    _request(governor, OUTCOME_ERROR)
+    for cooldown in (10.0, 12.0, 12.0):
+        clock[0] += 100
+        _request(governor, OUTCOME_ERROR)  # 半开探测失败
+        assert governor.get_host_state(HOST)['state'] == STATE_OPEN
+        assert governor.acquire(HOST) == pytest.approx(cooldown)
+    assert governor.get_host_state(HOST)['trips'] == 4
+
+
+def test_error_rate_trips_only_after_enough_requests():
+    governor = HostGovernor(failure_threshold=100, error_rate_threshold=0.5)
+    for _ in range(9):
+        _request(governor, OUTCOME_ERROR)
+    state = governor.get_host_state(HOST)
+    assert state['error_rate'] > 0.5
+    assert state['state'] == STATE_CLOSED
+    _request(governor, OUTCOME_ERROR)
+    assert governor.get_host_state(HOST)['state'] == STATE_OPEN
+
+
+def test_success_decays_error_rate():
+    governor = HostGovernor(failure_threshold=100)
+    _request(governor, OUTCOME_ERROR)
+    rate = governor.get_host_state(HOST)['error_rate']
+    _request(governor, OUTCOME_SUCCESS)
+    assert governor.get_host_state(HOST)['error_rate'] < rate
+
+
+def test_ignored_outcome_only_frees_the_slot():
+    governor = HostGovernor(max_connections_per_host=1, failure_threshold=1)
+    _request(governor, OUTCOME_IGNORED)
+    state = governor.get_host_state(HOST)
+    assert (state['state'], state['requests'], state['errors'], state['active']) == (STATE_CLOSED, 0, 0, 0)
+
+
+def test_seed_limit_only_for_unseen_hosts_and_clamped():
+    governor = HostGovernor(max_connections_per_host=8)
+    governor.seed_limit('a.com', 3)
+    governor.seed_limit('b.com', 100)
+    governor.seed_limit('c.com', 0)
+    assert governor.get_host_state('a.com')['limit'] == 3
+    assert governor.get_host_state('b.com')['limit'] == 8
+    assert governor.get_host_state('c.com')['limit'] == 1
+    governor.seed_limit('a.com', 6)
+    assert governor.get_host_state('a.com')['limit'] == 3
+
+
+def test_lowering_max_connections_caps_existing_hosts():
+    governor = HostGovernor(max_connections_per_host=8)
+    governor.acquire('a.com')
+    governor.set_max_connections_per_host(2)
+    assert governor.get_host_state('a.com')['limit'] == 2
+    assert set(governor.snapshot()) == {'a.com'}
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""主机画像：学到的Range支持/不支持只管当时的目录、错误率高的主机开局减线程"""
+import pytest
+
+from downloader.core.host_profiles import HostProfiles, get_url_dir
+
+HOST = 'example.com'
+BIG = 1024 ** 3
+
+
+def _state(error_rate=0.0, limit=8, throttled=0, latency=0.0):
+    return {'error_rate': error_rate, 'limit': limit, 'throttled': throttled, 'latency': latency}
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('http://example.com/a/b/c.iso', '/a/b/'),
+    ('http://example.com/c.iso', '/'),
+    ('http://example.com', '/'),
+    ('http://example.com/a/b/', '/a/b/'),
+])
+def test_get_url_dir(url, expected):
+    assert get_url_dir(url) == expected
+
+
+def test_unknown_host_follows_header(db):
+    profiles = HostProfiles(db)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, True, 8) == (True, 8)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, False, 8) == (False, 1)
+
+
+def test_range_refusal_only_applies_under_its_directory(db):
+    profiles = HostProfiles(db)
+    profiles.record_run(HOST, 'http://example.com/dynamic/get?id=1', False, None, 0, 0, None)
+
+    assert profiles.plan(HOST, 'http://example.com/dynamic/other.bin', BIG, True, 8) == (False, 1)
+    assert profiles.plan(HOST, 'http://example.com/dynamic/sub/x.bin', BIG, True, 8) == (False, 1)
+    assert profiles.plan(HOST, 'http://example.com/static/a.iso', BIG, True, 8) == (True, 8)
+    assert profiles.plan(HOST, 'http://example.com/dynamics/a.iso', BIG, True, 8) == (True, 8)
+
+
+def test_learned_support_overrides_missing_header_and_clears_refusal(db):
+    profiles = HostProfiles(db)
+    profiles.record_run(HOST, 'http://example.com/dl/a.iso', False, None, 0, 0, None)
+    profiles.record_run(HOST, 'http://example.com/dl/b.iso', True, None, 0, 0, None)
+    assert profiles.plan(HOST, 'http://example.com/dl/c.iso', BIG, False, 8) == (True, 8)
+    assert profiles.get(HOST)['range_refused_path'] is None
+    assert profiles.get(HOST)['range_ok_path'] == '/dl/'
+
+
+def test_range_support_only_applies_under_its_directory(db):
+    profiles = HostProfiles(db)
+    profiles.record_run(HOST, 'http://example.com/static/a.iso', True, None, 0, 0, None)
+
+    # 响应头没说支持，但这个目录下实际拿到过206
+    assert profiles.plan(HOST, 'http://example.com/static/b.iso', BIG, False, 8) == (True, 8)
+    # 同一主机的别的路径还按响应头来
+    assert profiles.plan(HOST, 'http://example.com/dynamic/get', BIG, False, 8) == (False, 1)
+
+
+def test_refusal_and_support_in_different_directories_coexist(db):
+    profiles = HostProfiles(db)
+    profiles.record_run(HOST, 'http://example.com/static/a.iso', True, None, 0, 0, None)
+    profiles.record_run(HOST, 'http://example.com/dynamic/get', False, None, 0, 0, None)
+    assert profiles.plan(HOST, 'http://example.com/static/b.iso', BIG, False, 8) == (True, 8)
+    assert profiles.plan(HOST, 'http://example.com/dynamic/x', BIG, True, 8) == (False, 1)
+
+
+def test_profile_without_directories_follows_header(db):
+    # 升级前学到的画像只有support_range，没有目录
+    db.save_host_profile({'host': HOST, 'support_range': 1})
+    profiles = HostProfiles(db)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, False, 8) == (False, 1)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, True, 8) == (True, 8)
+
+
+def test_high_error_rate_halves_threads(db):
+    profiles = HostProfiles(db)
+    profiles.record_run(HOST, 'http://example.com/a.iso', True, None, 0, 0, _state(error_rate=0.19))
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, True, 8) == (True, 8)
+    profiles.record_run(HOST, 'http://example.com/a.iso', True, None, 0, 0, _state(error_rate=0.2))
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, True, 8) == (True, 4)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, True, 1) == (True, 1)
+
+
+def test_throttled_limit_caps_threads(db):
+    profiles = HostProfiles(db)
+    profiles.record_run(HOST, 'http://example.com/a.iso', True, None, 0, 0, _state(limit=3, throttled=2))
+    assert profiles.plan(HOST, 'http://example.com/a.iso', BIG, True, 8) == (True, 3)
+
+
+def test_small_files_get_fewer_threads(db):
+    profiles = HostProfiles(db)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', 512 * 1024, True, 8) == (True, 2)
+    assert profiles.plan(HOST, 'http://example.com/a.iso', 1024, True, 8) == (True, 1)
+
+
+def test_profiles_survive_restart(db):
+    HostProfiles(db).record_run(HOST, 'http://example.com/dynamic/x', False, None, 0, 0, _state(error_rate=0.5))
+    profiles = HostProfiles(db)
+    assert profiles.get(HOST)['range_refused_path'] == '/dynamic/'
+    assert profiles.plan(HOST, 'http://example.com/dynamic/y', BIG, True, 8) == (False, 1)
+    assert profiles.plan(HOST, 'http://example.com/static/y', BIG, True, 8) == (True, 4)
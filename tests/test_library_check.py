@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""批量校验下载库：好的/坏的/丢的/没基准的各归各类，坏了的标verify_failed，修好了的恢复，没查完的下次接着查"""
+import hashlib
+
+import pytest
+
+from downloader.core.library_check import LibraryCheck
+from downloader.core.verifier import VerifyQueue
+from downloader.database.task_store import TaskStore
+from tests.conftest import wait_until
+
+
+@pytest.fixture
+def store(db):
+    return TaskStore(db)
+
+
+@pytest.fixture
+def make_check(store, db):
+    queues = []
+
+    def make():
+        queue = VerifyQueue()
+        queues.append(queue)
+        return LibraryCheck(store, db, queue)
+
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def _completed(store, tmp_path, task_id, data=b'payload', expected=None, actual=None, status='completed'):
+    """造一个下完了的任务（data为None表示文件丢了）"""
+    path = tmp_path / f'{task_id}.bin'
+    if data is not None:
+        path.write_bytes(data)
+    assert store.create_task(task_id, f'http://example.com/{task_id}', path.name, str(path), total_size=7)
+    store.update_task_status(task_id, status)
+    if expected:
+        store.set_expected_hash(task_id, expected, 'md5')
+    if actual:
+        store.update_task_hash(task_id, actual, 1)
+    return path
+
+
+def _run(check, **kwargs):
+    assert check.start(**kwargs)
+    assert wait_until(lambda: not check.is_running())
+    return check.report()
+
+
+def test_classifies_every_completed_download(store, make_check, tmp_path):
+    good = hashlib.md5(b'payload').hexdigest()
+    _completed(store, tmp_path, 'ok', expected=good)
+    _completed(store, tmp_path, 'ok_actual', actual=good)
+    _completed(store, tmp_path, 'corrupt', data=b'bit rot', expected=good)
+    _completed(store, tmp_path, 'corrupt_actual', data=b'bit rot', actual=good)
+    _completed(store, tmp_path, 'missing', data=None, expected=good)
+    _completed(store, tmp_path, 'unverified')
+    _completed(store, tmp_path, 'not_done', status='paused')
+
+    report = _run(make_check())
+    assert (report['total'], report['checked']) == (6, 6)
+    assert (report['ok'], report['corrupt'], report['missing'], report['unverified']) == (2, 2, 1, 1)
+    assert sorted(report['corrupt_ids']) == ['corrupt', 'corrupt_actual']
+    assert report['missing_ids'] == ['missing']
+
+    for task_id in ('corrupt', 'corrupt_actual', 'missing'):
+        assert store.get_task(task_id)['status'] == 'verify_failed'
+    assert store.get_task('ok')['status'] == 'completed'
+    assert store.get_task('not_done')['status'] == 'paused'
+    # 没预期哈希的：下载时记的哈希是唯一基准，不能被坏文件的哈希盖掉
+    assert store.get_task('corrupt_actual')['actual_hash'] == good
+    # 没基准的：这次算的记下来当以后的基准
+    assert store.get_task('unverified')['actual_hash'] == good
+
+
+def test_repaired_file_is_restored_and_keeps_completed_at(store, make_check, tmp_path):
+    good = hashlib.md5(b'payload').hexdigest()
+    path = _completed(store, tmp_path, 'a', data=b'bit rot', expected=good)
+    completed_at = store.get_task('a')['completed_at']
+    check = make_check()
+    assert _run(check)['corrupt_ids'] == ['a']
+
+    path.write_bytes(b'payload')
+    report = _run(check, restart=True)
+    assert (report['ok'], report['corrupt_ids']) == (1, [])
+    task = store.get_task('a')
+    assert task['status'] == 'completed'
+    assert task['completed_at'] == completed_at
+
+
+def test_unfinished_round_resumes_where_it_stopped(store, db, make_check, tmp_path):
+    good = hashlib.md5(b'payload').hexdigest()
+    for task_id in ('a', 'b', 'c'):
+        _completed(store, tmp_path, task_id, expected=good)
+    # 上一轮查了a就被杀了
+    db.start_library_check(['a', 'b', 'c'])
+    db.update_library_checks([('a', 'corrupt')])
+
+    report = _run(make_check())
+    assert (report['total'], report['checked'], report['ok'], report['corrupt']) == (3, 3, 2, 1)
+    # 查过的没再查：a的状态没被这一轮改
+    assert store.get_task('a')['status'] == 'completed'
+
+    report = _run(make_check())  # 都查完了：再来就是新的一轮
+    assert (report['total'], report['ok'], report['corrupt']) == (3, 3, 0)
+
+
+def test_stop_then_start_again_finishes_the_round(store, make_check, tmp_path):
+    for index in range(5):
+        _completed(store, tmp_path, f't{index}', data=b'x' * 1024 * 1024)
+    check = make_check()
+    assert check.start()
+    check.stop()
+    assert not check.is_running()
+
+    # 上一轮停下来以后迟到的回调不能把新一轮的计数搅乱
+    report = _run(check)
+    assert (report['total'], report['checked'], report['unverified']) == (5, 5, 5)
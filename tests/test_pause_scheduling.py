@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""暂停让出名额：排队的顶上、点继续的名额满了先排队、有名额时先继续点过的再开新的"""
+from tests.conftest import wait_until
+
+FILE_SIZE = 8 * 1024 * 1024
+
+
+def _status(task_manager, task_id):
+    return task_manager.get_task(task_id)['status']
+
+
+def _downloading(task_manager, task_id):
+    task = task_manager.get_task(task_id)
+    return task['status'] == 'downloading' and task['downloaded_size'] > 0
+
+
+def _add(task_manager, origin, count):
+    """加count个任务，等到一个在下、其余排队；返回[在下的, 排队的...]（探测完成的先后不定，谁先下不一定）"""
+    task_ids = [task_manager.add_task(f"{origin.base_url}/{FILE_SIZE}/f{index}.bin") for index in range(count)]
+    assert wait_until(lambda: sorted(_status(task_manager, task_id) for task_id in task_ids)
+                      == ['downloading'] + ['pending'] * (count - 1))
+    running = next(task_id for task_id in task_ids if _status(task_manager, task_id) == 'downloading')
+    assert wait_until(lambda: _downloading(task_manager, running))
+    return [running] + [task_id for task_id in task_ids if task_id != running]
+
+
+def _pause_and_wait_successor(task_manager, task_id, candidates):
+    """暂停task_id，等排队的某一个顶上来，返回顶上来的那个"""
+    assert task_manager.pause_task(task_id)
+    assert wait_until(lambda: any(_downloading(task_manager, other) for other in candidates))
+    return next(other for other in candidates if _downloading(task_manager, other))
+
+
+def test_pause_releases_slot_to_queued_task(origin, make_task_manager):
+    task_manager = make_task_manager(max_concurrent=1)
+    first, second = _add(task_manager, origin, 2)
+
+    assert _pause_and_wait_successor(task_manager, first, [second]) == second
+    assert _status(task_manager, first) == 'paused'
+    # 下载线程读完手上这块就关连接退出，登记也跟着撤掉；之后断点不再往前走
+    assert wait_until(lambda: first not in task_manager.engine.active_downloaders)
+    paused_at = task_manager.get_task(first)['downloaded_size']
+    assert wait_until(lambda: task_manager.get_task(second)['downloaded_size'] > 64 * 1024)
+    assert task_manager.get_task(first)['downloaded_size'] == paused_at
+
+
+def test_resume_waits_for_slot_and_goes_before_new_tasks(origin, make_task_manager):
+    task_manager = make_task_manager(max_concurrent=1)
+    first, *queued = _add(task_manager, origin, 3)
+    second = _pause_and_wait_successor(task_manager, first, queued)
+    third = next(task_id for task_id in queued if task_id != second)
+    assert wait_until(lambda: first not in task_manager.engine.active_downloaders)
+    paused_at = task_manager.get_task(first)['downloaded_size']
+
+    # 名额被占着：继续不了，还是暂停状态，排队等着
+    assert not task_manager.resume_task(first)
+    assert _status(task_manager, first) == 'paused'
+
+    # 让出名额时先继续点过的，而不是更早排队的新任务
+    assert task_manager.pause_task(second)
+    assert wait_until(lambda: _downloading(task_manager, first)
+                      and task_manager.get_task(first)['downloaded_size'] > paused_at)
+    assert _status(task_manager, second) == 'paused'
+    assert _status(task_manager, third) == 'pending'
+
+
+def test_pause_removes_task_from_resume_queue(origin, make_task_manager):
+    task_manager = make_task_manager(max_concurrent=1)
+    first, *queued = _add(task_manager, origin, 3)
+    second = _pause_and_wait_successor(task_manager, first, queued)
+    third = next(task_id for task_id in queued if task_id != second)
+    assert not task_manager.resume_task(first)
+
+    # 又点了暂停：不排了，名额让出来给新任务
+    task_manager.pause_task(first)
+    assert _pause_and_wait_successor(task_manager, second, [first, third]) == third
+    assert _status(task_manager, first) == 'paused'
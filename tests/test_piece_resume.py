@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""分片断点：刷盘后才落库、下了一半的片从断点接着下"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from downloader.core import download_engine
+from downloader.core.download_engine import _TaskRun
+from downloader.core.pieces import PieceMap
+
+PIECE_SIZE = 1000
+TOTAL_SIZE = 4500  # 5片，最后一片500字节
+
+
+@pytest.fixture
+def task(db, tmp_path):
+    db.create_task('t1', 'http://example.com/dir/a.bin', 'a.bin', str(tmp_path / 'a.bin'),
+                   total_size=TOTAL_SIZE, thread_count=2)
+    return db.get_task('t1')
+
+
+def _new_run(db, task, temp_file):
+    with open(temp_file, 'wb') as f:
+        f.truncate(TOTAL_SIZE)
+    db.create_piece_map(task['task_id'], PIECE_SIZE, 5, temp_file)
+    run = _TaskRun(task, [], 0, single=False)
+    run.pieces = PieceMap(TOTAL_SIZE, PIECE_SIZE)
+    run.pieces_file = temp_file
+    return run
+
+
+def test_flush_persists_bitfield_and_partial_offsets(engine, db, task, tmp_path):
+    run = _new_run(db, task, str(tmp_path / 't1.tmp'))
+    run.pieces.set(0)
+    run.base_downloaded = PIECE_SIZE
+    run.downloaders = [SimpleNamespace(chunk_id=2, downloaded_bytes=300)]
+
+    engine._flush_pieces([run])
+
+    piece_map = db.get_piece_map('t1')
+    assert piece_map['bitfield'] == run.pieces.to_bytes()
+    assert piece_map['partial'] == {2: 300}
+    assert not run.pieces.dirty
+    assert run.synced_size == PIECE_SIZE + 300
+
+
+def test_flush_syncs_only_when_progress_moved(engine, db, task, tmp_path, monkeypatch):
+    run = _new_run(db, task, str(tmp_path / 't1.tmp'))
+    synced = []
+    monkeypatch.setattr(download_engine, '_sync_file', lambda path, task_id: synced.append(path) or True)
+
+    run.downloaders = [SimpleNamespace(chunk_id=1, downloaded_bytes=100)]
+    engine._flush_pieces([run])
+    engine._flush_pieces([run])
+    assert len(synced) == 1
+
+    run.downloaders[0].downloaded_bytes = 200
+    engine._flush_pieces([run])
+    assert len(synced) == 2
+    assert db.get_piece_map('t1')['partial'] == {1: 200}
+
+
+def test_flush_skips_run_when_sync_fails(engine, db, task, tmp_path):
+    run = _new_run(db, task, str(tmp_path / 't1.tmp'))
+    os.remove(run.pieces_file)
+    run.pieces.set(0)
+    run.base_downloaded = PIECE_SIZE
+
+    engine._flush_pieces([run])
+
+    # 没刷上盘的断点不能记
+    assert db.get_piece_map('t1')['bitfield'] == bytes(1)
+    assert run.pieces.dirty
+    assert run.synced_size == -1
+
+
+def test_flush_keeps_bitfield_dirty_when_write_fails(engine, db, task, tmp_path, monkeypatch):
+    run = _new_run(db, task, str(tmp_path / 't1.tmp'))
+    run.pieces.set(1)
+    run.base_downloaded = PIECE_SIZE
+    monkeypatch.setattr(db, 'update_pieces_progress', lambda updates: False)
+
+    engine._flush_pieces([run])
+
+    assert run.pieces.dirty
+    assert run.synced_size == -1
+
+
+def test_resume_continues_partial_piece_from_offset(engine, db, task, tmp_path, monkeypatch):
+    temp_file = str(tmp_path / 't1.tmp')
+    run = _new_run(db, task, temp_file)
+    run.pieces.set(0)
+    run.base_downloaded = PIECE_SIZE
+    run.downloaders = [SimpleNamespace(chunk_id=1, downloaded_bytes=400)]
+    engine._flush_pieces([run])
+
+    launched = []
+    monkeypatch.setattr(engine, '_launch', lambda run, resume: launched.append(run))
+    assert engine._start_piece_download(task, db.get_piece_map('t1'), resume=True)
+    resumed = launched[0]
+    assert resumed.partial == {1: 400}
+    assert resumed.base_downloaded == PIECE_SIZE + 400
+
+    submitted = []
+    monkeypatch.setattr(engine, '_submit_chunk', lambda run, downloader, func: submitted.append(downloader))
+    engine._runs['t1'] = resumed
+    engine._schedule_pieces(resumed)
+
+    first = submitted[0]
+    assert (first.chunk_id, first.start_byte, first.downloaded_bytes) == (1, PIECE_SIZE, 400)
+    assert resumed.downloaded_size() == PIECE_SIZE + 400
+
+
+def test_resume_drops_progress_when_temp_file_is_gone(engine, db, task, tmp_path, monkeypatch):
+    temp_file = str(tmp_path / 't1.tmp')
+    run = _new_run(db, task, temp_file)
+    run.pieces.set(0)
+    run.base_downloaded = PIECE_SIZE
+    run.downloaders = [SimpleNamespace(chunk_id=1, downloaded_bytes=400)]
+    engine._flush_pieces([run])
+    os.remove(temp_file)
+
+    launched = []
+    monkeypatch.setattr(engine, '_launch', lambda run, resume: launched.append(run))
+    assert engine._start_piece_download(task, db.get_piece_map('t1'), resume=True)
+
+    assert launched[0].pieces.completed_count() == 0
+    assert launched[0].partial == {}
+    assert os.path.getsize(temp_file) == TOTAL_SIZE
+    assert db.get_piece_map('t1')['partial'] == {}
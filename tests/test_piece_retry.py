@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""分片下载的重试次数按任务记在分片表里"""
+from tests.conftest import wait_until
+
+FILE_SIZE = 4 * 1024 * 1024
+
+
+def test_piece_retries_are_counted_per_task(start_origin, make_task_manager):
+    server = start_origin(error_rate=0.3, seed=7)  # 三成GET回503（Retry-After: 1）
+    task_manager = make_task_manager()
+    task_manager.config.set('retry_times', 20)
+    task_id = task_manager.add_task(f"{server.base_url}/{FILE_SIZE}/a.bin")
+
+    assert wait_until(lambda: task_manager.get_task(task_id)['status'] in ('completed', 'failed'), timeout=60)
+    assert task_manager.get_task(task_id)['status'] == 'completed'
+    injected = server.stats.snapshot()['injected_errors']
+    assert injected > 0
+    assert task_manager.db.get_piece_map(task_id)['retry_count'] == injected
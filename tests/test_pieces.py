@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""分片位图"""
+from downloader.core.pieces import MAX_PIECES, PieceMap, choose_piece_size
+
+
+def test_choose_piece_size_caps_piece_count():
+    assert choose_piece_size(10 * 1024, 1024, 512) == 1024
+    assert choose_piece_size(10 * 1024, 0, 512) == 512
+    assert choose_piece_size(0, 0, 0) == 1
+    total = 100 * 1024 ** 3
+    size = choose_piece_size(total, 1024 * 1024, 64 * 1024)
+    assert -(-total // size) <= MAX_PIECES
+
+
+def test_piece_ranges_with_short_last_piece():
+    pieces = PieceMap(2500, 1000)
+    assert pieces.piece_count == 3
+    assert pieces.piece_range(0) == (0, 999)
+    assert pieces.piece_range(2) == (2000, 2499)
+    assert pieces.piece_length(2) == 500
+
+
+def test_set_is_high_bit_first_and_counts_once():
+    pieces = PieceMap(10 * 100, 100)
+    pieces.set(0)
+    pieces.set(9)
+    pieces.set(9)
+    assert pieces.to_bytes() == bytes([0x80, 0x40])
+    assert pieces.has(0) and pieces.has(9) and not pieces.has(1)
+    assert pieces.completed_count() == 2
+    assert pieces.missing_count() == 8
+    assert pieces.dirty
+
+
+def test_next_missing_skips_full_bytes():
+    pieces = PieceMap(20 * 10, 10)
+    for index in range(17):
+        pieces.set(index)
+    assert pieces.next_missing() == 17
+    assert pieces.next_missing(18) == 18
+    assert list(pieces.missing()) == [17, 18, 19]
+    for index in (17, 18, 19):
+        pieces.set(index)
+    assert pieces.next_missing() is None
+    assert pieces.next_missing(100) is None
+    assert pieces.is_complete()
+
+
+def test_next_missing_ignores_bits_before_start():
+    pieces = PieceMap(16, 1)
+    pieces.set(5)
+    assert pieces.next_missing(5) == 6
+    assert pieces.next_missing(3) == 3
+
+
+def test_completed_bytes_counts_short_last_piece():
+    pieces = PieceMap(2500, 1000)
+    assert pieces.completed_bytes() == 0
+    pieces.set(0)
+    assert pieces.completed_bytes() == 1000
+    pieces.set(2)
+    assert pieces.completed_bytes() == 1500
+    pieces.set(1)
+    assert pieces.completed_bytes() == 2500
+
+
+def test_round_trip_through_bytes():
+    pieces = PieceMap(13 * 7, 7)
+    for index in (0, 3, 8, 12):
+        pieces.set(index)
+    restored = PieceMap(13 * 7, 7, pieces.to_bytes())
+    assert restored.to_bytes() == pieces.to_bytes()
+    assert [i for i in range(13) if restored.has(i)] == [0, 3, 8, 12]
+    assert restored.completed_count() == 4
+    assert not restored.dirty
+
+
+def test_loaded_bitfield_is_padded_truncated_and_tail_masked():
+    # 位图短了：后面的当没下
+    pieces = PieceMap(20, 1, b'\xff')
+    assert len(pieces.to_bytes()) == 3
+    assert pieces.completed_count() == 8
+    assert pieces.next_missing() == 8
+    # 位图长了、末尾凑整的位被置上：都不算
+    pieces = PieceMap(10, 1, b'\xff\xff\xff')
+    assert pieces.to_bytes() == b'\xff\xc0'
+    assert pieces.completed_count() == 10
+    assert pieces.is_complete()
+
+
+def test_clear_resets_everything():
+    pieces = PieceMap(30, 10, b'\xe0')
+    assert pieces.is_complete()
+    pieces.clear()
+    assert pieces.completed_count() == 0
+    assert pieces.to_bytes() == b'\x00'
+    assert pieces.dirty
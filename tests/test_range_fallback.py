@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""服务器无视Range（分片请求回200）：分片记录作废，改成单线程从头下完"""
+from benchmarks.range_server import _RangeHandler, expected_bytes
+from downloader.core.host_governor import get_host_key
+
+from tests.conftest import wait_until
+
+FILE_SIZE = 4 * 1024 * 1024
+
+
+def _wait_finished(tasks, task_id):
+    assert wait_until(lambda: tasks.get_task(task_id)['status'] in ('completed', 'failed'), timeout=30)
+    return tasks.get_task(task_id)
+
+
+def _assert_downloaded(task):
+    assert task['status'] == 'completed', task['error_message']
+    with open(task['save_path'], 'rb') as f:
+        assert f.read() == expected_bytes(0, FILE_SIZE)
+
+
+def test_piece_download_falls_back_when_server_ignores_range(start_origin, make_task_manager, monkeypatch):
+    # 响应头说支持Range，GET却一律回200整个文件
+    monkeypatch.setattr(_RangeHandler, '_parse_range', lambda self, size: None)
+    server = start_origin()
+    task_manager = make_task_manager()
+    url = f"{server.base_url}/{FILE_SIZE}/lying.bin"
+    task_id = task_manager.add_task(url)
+
+    task = _wait_finished(task_manager, task_id)
+
+    _assert_downloaded(task)
+    assert not task['support_range']
+    assert task_manager.db.get_piece_map(task_id) is None
+    profile = task_manager.engine.profiles.get(get_host_key(url))
+    assert profile['range_refused_path'] == f'/{FILE_SIZE}/'
+
+
+def test_resume_with_stale_piece_map_replans_single_thread(start_origin, engine):
+    server = start_origin()
+    url = f"{server.base_url}/{FILE_SIZE}/a.bin"
+    task_id = engine.create_probing_task(url, None, None, None, 'md5')
+    assert engine.probe_task(task_id)
+    piece_map = engine.db.get_piece_map(task_id)
+    assert piece_map is not None
+
+    # 任务建好之后画像才学到这个目录无视Range
+    engine.profiles.record_run(get_host_key(url), url, False, None, 0, 0, None)
+    assert engine.start_download(task_id, resume=True)
+
+    task = _wait_finished(engine.tasks, task_id)
+    _assert_downloaded(task)
+    assert engine.db.get_piece_map(task_id) is None
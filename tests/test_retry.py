@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""重试退避：全抖动的上下限、Retry-After兜底和封顶、哪些错误值得重试、断点续而不是从头要"""
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from benchmarks.range_server import expected_bytes
+from downloader.core import chunk_downloader
+from downloader.core.chunk_downloader import (
+    BACKOFF_BASE, BACKOFF_CAP, RETRY_AFTER_CAP, ChunkDownloadError, ChunkDownloader,
+    compute_backoff, error_cause, is_transient_error, parse_retry_after,
+)
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """记下每次退避的参数，不真睡"""
+    calls = []
+
+    def fake(attempt, retry_after=None):
+        calls.append((attempt, retry_after))
+        return 0.0
+
+    monkeypatch.setattr(chunk_downloader, 'compute_backoff', fake)
+    return calls
+
+
+def test_backoff_full_jitter_bounds(monkeypatch):
+    monkeypatch.setattr(chunk_downloader.random, 'uniform', lambda low, high: high)
+    assert [compute_backoff(attempt) for attempt in range(4)] == [BACKOFF_BASE * 2 ** n for n in range(4)]
+    assert compute_backoff(20) == BACKOFF_CAP
+
+    monkeypatch.setattr(chunk_downloader.random, 'uniform', lambda low, high: low)
+    assert compute_backoff(5) == 0.0
+
+
+def test_backoff_is_random_within_window():
+    delays = [compute_backoff(3) for _ in range(200)]
+    assert all(0.0 <= delay <= BACKOFF_BASE * 8 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_retry_after_is_floor_and_capped(monkeypatch):
+    monkeypatch.setattr(chunk_downloader.random, 'uniform', lambda low, high: low)
+    assert compute_backoff(0, retry_after=7) == 7
+    assert compute_backoff(0, retry_after=RETRY_AFTER_CAP * 10) == RETRY_AFTER_CAP
+    monkeypatch.setattr(chunk_downloader.random, 'uniform', lambda low, high: high)
+    assert compute_backoff(10, retry_after=2) == BACKOFF_CAP  # 退避比服务器要求的还长就按退避来
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(' 5 ') == 5.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('') is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('-5') is None
+
+    later = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+    assert 55 <= later <= 61
+    assert parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_transient_classification():
+    assert is_transient_error(ChunkDownloadError('HTTP 503', status_code=503))
+    assert not is_transient_error(ChunkDownloadError('HTTP 404', transient=False, status_code=404))
+    assert is_transient_error(requests.ConnectionError())
+    assert is_transient_error(requests.Timeout())
+    assert is_transient_error(requests.exceptions.ChunkedEncodingError())
+    assert not is_transient_error(OSError('disk full'))
+
+    assert error_cause(ChunkDownloadError('HTTP 429', status_code=429)) == 'http_429'
+    assert error_cause(ChunkDownloadError('下载中断')) == 'interrupted'
+    assert error_cause(requests.Timeout()) == 'timeout'
+    assert error_cause(requests.ConnectionError()) == 'connection'
+    assert error_cause(OSError()) == 'io'
+
+
+def _downloader(origin, tmp_path, size, retry_times=3, name='f.bin'):
+    return ChunkDownloader(0, 'task', f'{origin.base_url}/{size}/{name}', 0, size - 1,
+                           str(tmp_path / 'chunk.part'), timeout=5, retry_times=retry_times)
+
+
+def test_dropped_connections_resume_from_checkpoint(start_origin, tmp_path, backoffs):
+    size = 2 * 1024 * 1024
+    origin = start_origin(drop_rate=2.0, seed=7)
+    downloader = _downloader(origin, tmp_path, size, retry_times=5)
+    assert downloader.download()
+    assert downloader.status == 'completed'
+    assert (tmp_path / 'chunk.part').read_bytes() == expected_bytes(0, size)
+
+    stats = origin.stats.snapshot()
+    assert stats['dropped_connections'] > 0
+    assert len(backoffs) == stats['dropped_connections']
+    # 每次重试都从断点续：总共发出去的字节不会比文件多出一整份
+    assert stats['bytes_sent'] < 2 * size
+
+
+def test_503_retries_with_retry_after_then_fails(start_origin, tmp_path, backoffs):
+    origin = start_origin(error_rate=1.0)
+    downloader = _downloader(origin, tmp_path, 4096, retry_times=3)
+    assert not downloader.download()
+    assert downloader.status == 'failed'
+    assert backoffs == [(0, 1.0), (1, 1.0)]
+    assert origin.stats.snapshot()['requests'] == 3
+
+
+def test_404_is_not_retried(start_origin, tmp_path, backoffs):
+    origin = start_origin()
+    downloader = ChunkDownloader(0, 'task', f'{origin.base_url}/missing', 0, 99,
+                                 str(tmp_path / 'chunk.part'), timeout=5, retry_times=5)
+    assert not downloader.download()
+    assert downloader.status == 'failed'
+    assert downloader.last_error == 'HTTP 404'
+    assert backoffs == []
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""退出（Ctrl+C/关窗口/SIGTERM）：在下的暂停、排队的不动，下次都能接着下"""
+import os
+import signal
+import threading
+
+from downloader.cli import RESUMABLE_STATUSES, CliRunner
+
+from tests.conftest import wait_until
+
+FILE_SIZE = 8 * 1024 * 1024
+
+
+def _add_three(runner, origin):
+    for index in range(3):
+        assert runner.add(f"{origin.base_url}/{FILE_SIZE}/f{index}.bin", None, None, 'md5')
+
+
+def _statuses(task_manager, task_ids):
+    return sorted(task_manager.get_task(task_id)['status'] for task_id in task_ids)
+
+
+def _one_running_two_queued(task_manager, task_ids):
+    if _statuses(task_manager, task_ids) != ['downloading', 'pending', 'pending']:
+        return False
+    return any(task_manager.get_task(task_id)['downloaded_size'] for task_id in task_ids)
+
+
+def test_cli_stop_pauses_running_and_leaves_queued_tasks(origin, make_task_manager):
+    task_manager = make_task_manager(max_concurrent=1)
+    runner = CliRunner(task_manager, quiet=True)
+    _add_three(runner, origin)
+    assert wait_until(lambda: _one_running_two_queued(task_manager, runner.watched))
+
+    runner.stop()
+
+    assert _statuses(task_manager, runner.watched) == ['paused', 'pending', 'pending']
+    # 名额让出来也没把排队的拉起来
+    queued = [task_id for task_id in runner.watched if task_manager.get_task(task_id)['status'] == 'pending']
+    assert all(task_manager.get_task(task_id)['downloaded_size'] == 0 for task_id in queued)
+    assert all(task_manager.get_task(task_id)['status'] in RESUMABLE_STATUSES for task_id in runner.watched)
+
+
+def test_pause_all_before_shutdown_cancels_nothing(origin, make_task_manager):
+    task_manager = make_task_manager(max_concurrent=1)
+    runner = CliRunner(task_manager, quiet=True)
+    _add_three(runner, origin)
+    assert wait_until(lambda: _one_running_two_queued(task_manager, runner.watched))
+
+    # 老的退出顺序：先暂停全部再shutdown，让出的名额会拉起排队的任务，shutdown也不能把它取消
+    task_manager.pause_all()
+    task_manager.shutdown()
+
+    assert 'cancelled' not in _statuses(task_manager, runner.watched)
+
+
+def test_resume_after_stop_picks_up_every_task(origin, make_task_manager):
+    task_manager = make_task_manager(max_concurrent=1)
+    runner = CliRunner(task_manager, quiet=True)
+    _add_three(runner, origin)
+    task_ids = list(runner.watched)
+    assert wait_until(lambda: _one_running_two_queued(task_manager, task_ids))
+    runner.stop()
+
+    # 重启后 --resume
+    task_manager = make_task_manager(max_concurrent=1)
+    runner = CliRunner(task_manager, quiet=True)
+    runner.resume_unfinished()
+    assert sorted(runner.watched) == sorted(task_ids)
+    assert wait_until(lambda: _statuses(task_manager, task_ids).count('downloading') == 1)
+
+
+def test_daemon_sigterm_pauses_running_and_leaves_queued_tasks(origin, make_task_manager):
+    from downloader.cli import run_daemon
+
+    task_manager = make_task_manager(max_concurrent=1)
+    task_ids = [task_manager.add_task(f"{origin.base_url}/{FILE_SIZE}/f{index}.bin") for index in range(3)]
+
+    def terminate_when_busy():
+        wait_until(lambda: _one_running_two_queued(task_manager, task_ids))
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    previous = signal.getsignal(signal.SIGTERM)
+    killer = threading.Thread(target=terminate_when_busy, daemon=True)
+    killer.start()
+    try:
+        assert run_daemon(task_manager, 0) == 0
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    killer.join()
+
+    assert _statuses(task_manager, task_ids) == ['paused', 'pending', 'pending']
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""调度器：事件都在调度线程里执行、定时器按到期顺序触发、stop之后不再被拉起来"""
+import threading
+
+import pytest
+
+from downloader.core.supervisor import Supervisor
+from tests.conftest import wait_until
+
+
+@pytest.fixture
+def supervisor():
+    sup = Supervisor(tick_interval=0.05)
+    yield sup
+    sup.stop()
+
+
+def test_post_runs_on_supervisor_thread(supervisor):
+    seen = []
+    supervisor.post(lambda: seen.append(supervisor.is_current_thread()))
+    assert wait_until(lambda: seen)
+    assert seen == [True]
+    assert not supervisor.is_current_thread()
+
+
+def test_call_later_fires_in_due_order(supervisor):
+    order = []
+    supervisor.call_later(0.2, order.append, 'late')
+    supervisor.call_later(0.05, order.append, 'early')
+    supervisor.post(order.append, 'now')
+    assert wait_until(lambda: len(order) == 3)
+    assert order == ['now', 'early', 'late']
+
+
+def test_failing_callback_keeps_loop_alive(supervisor):
+    seen = []
+
+    def boom():
+        raise RuntimeError('boom')
+
+    supervisor.post(boom)
+    supervisor.post(seen.append, 'after')
+    assert wait_until(lambda: seen)
+    assert seen == ['after']
+
+
+def test_tick_only_while_active(supervisor):
+    ticks = []
+    active = threading.Event()
+    supervisor.set_tick_callback(lambda: ticks.append(1), active.is_set)
+    supervisor.post(active.set)
+    assert wait_until(lambda: len(ticks) >= 2)
+
+
+def test_post_after_stop_does_not_restart(supervisor):
+    supervisor.post(lambda: None)
+    thread = supervisor._thread
+    supervisor.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+    seen = []
+    supervisor.post(seen.append, 'late')
+    supervisor.call_later(0, seen.append, 'later')
+    assert supervisor.start() is False
+    assert supervisor._thread is thread
+    assert seen == []
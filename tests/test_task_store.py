@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""任务内存缓存：读走内存、写穿透到数据库，进度攒着flush时批量落库"""
+import pytest
+
+from downloader.database.db_manager import DatabaseManager
+from downloader.database.task_store import TaskStore
+
+
+@pytest.fixture
+def store(db):
+    return TaskStore(db)
+
+
+def _create(store, task_id, status='pending', total_size=1000):
+    assert store.create_task(task_id, f'http://example.com/{task_id}', f'{task_id}.bin',
+                             f'/tmp/{task_id}.bin', total_size=total_size, status=status)
+
+
+def test_writes_go_through_to_database(store, db):
+    _create(store, 'a')
+    assert db.get_task('a')['status'] == 'pending'
+    assert store.update_task_status('a', 'downloading')
+    assert db.get_task('a')['status'] == 'downloading'
+    assert store.get_task('a')['started_at']
+    assert store.update_task_probe('a', 2000, False, 1)
+    assert (db.get_task('a')['total_size'], db.get_task('a')['support_range']) == (2000, 0)
+    assert store.get_task('a')['support_range'] == 0
+
+    assert store.delete_task('a')
+    assert store.get_task('a') is None
+    assert db.get_task('a') is None
+
+
+def test_progress_is_batched_until_flush(store, db):
+    _create(store, 'a', status='downloading')
+    assert store.update_task_progress('a', 400, 100.0)
+    assert store.get_task('a')['downloaded_size'] == 400
+    assert db.get_task('a')['downloaded_size'] == 0  # 还没落库
+
+    assert store.flush()
+    assert db.get_task('a')['downloaded_size'] == 400
+
+    # 状态切换时顺手落库，速度清零
+    store.update_task_progress('a', 600, 100.0)
+    store.update_task_status('a', 'paused')
+    row = db.get_task('a')
+    assert (row['downloaded_size'], row['status']) == (600, 'paused')
+    assert store.get_task('a')['speed'] == 0
+
+
+def test_unknown_task_does_not_enter_cache(store):
+    _create(store, 'a')
+    store.update_task_status('missing', 'paused')
+    assert not store.update_task_progress('missing', 1, 1.0)
+    assert store.get_task('missing') is None
+    assert len(store) == 1
+
+
+def test_reload_sees_persisted_state(store, tmp_path):
+    for task_id in ('a', 'b', 'c'):
+        _create(store, task_id)
+    store.update_task_status('b', 'downloading')
+    store.update_task_progress('b', 500, 10.0)
+    store.flush()
+
+    db = DatabaseManager(str(tmp_path / 'downloads.db'))
+    try:
+        reloaded = TaskStore(db)
+        assert {record['task_id'] for record in reloaded.get_all_tasks()} == {'a', 'b', 'c'}
+        assert reloaded.get_task('b')['downloaded_size'] == 500
+        assert [record['task_id'] for record in reloaded.get_all_tasks('downloading')] == ['b']
+    finally:
+        db.close()
+
+
+# ==================== 统计计数（增量维护） ====================
+
+def _recount(store):
+    """老办法数一遍，和增量维护的对账"""
+    stats = {}
+    for record in store.get_all_tasks():
+        stats[record['status']] = stats.get(record['status'], 0) + 1
+    return stats
+
+
+def test_status_counts_follow_every_transition(store):
+    for task_id in ('a', 'b', 'c', 'd'):
+        _create(store, task_id)
+    store.update_task_status('a', 'downloading')
+    store.update_task_status('b', 'downloading')
+    store.update_task_status('b', 'completed')
+    store.update_task_status('c', 'probing')
+    store.delete_task('d')
+
+    stats = store.get_statistics()
+    assert stats['total'] == 3
+    assert (stats['downloading'], stats['completed'], stats['pending'], stats['paused']) == (1, 1, 0, 0)
+    assert stats['probing'] == 1  # 不在固定列表里的状态也照样计数
+    assert {status: count for status, count in stats.items()
+            if status not in ('total', 'total_speed') and count} == _recount(store)
+
+
+def test_total_speed_counts_only_downloading_tasks(store):
+    _create(store, 'a', status='downloading')
+    _create(store, 'b', status='downloading')
+    store.update_task_progress('a', 100, 100.0)
+    store.update_task_progress('b', 100, 50.0)
+    assert store.get_statistics()['total_speed'] == 150.0
+
+    store.update_task_progress('a', 200, 30.0)  # 速度是替换不是累加
+    assert store.get_statistics()['total_speed'] == 80.0
+
+    store.update_task_status('b', 'paused')
+    assert store.get_statistics()['total_speed'] == 30.0
+    store.delete_task('a')
+    assert store.get_statistics()['total_speed'] == 0.0
+
+
+def test_counts_rebuilt_on_load(store, tmp_path):
+    _create(store, 'a')
+    _create(store, 'b', status='completed')
+    _create(store, 'c', status='failed')
+    db = DatabaseManager(str(tmp_path / 'downloads.db'))
+    try:
+        assert TaskStore(db).get_statistics() == store.get_statistics()
+    finally:
+        db.close()
+
+
+def test_listeners_notified_on_change(store):
+    seen = []
+    store.add_stats_listener(seen.append)
+    _create(store, 'a')
+    store.update_task_status('a', 'downloading')
+    store.update_task_progress('a', 10, 5.0)
+    store.flush()
+    assert [stats['downloading'] for stats in seen] == [0, 1, 1]
+    assert seen[-1]['total_speed'] == 5.0
+
+    # 回调炸了不影响写入
+    store.add_stats_listener(lambda stats: 1 / 0)
+    assert store.update_task_status('a', 'completed')
+    assert seen[-1]['completed'] == 1
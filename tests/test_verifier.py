@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""校验队列：回调一定来一次、shutdown前后交进来的计数都能归零"""
+import hashlib
+import threading
+
+from downloader.core.verifier import VerifyQueue
+from tests.conftest import wait_until
+
+
+def _write(tmp_path, name='a.bin', data=b'x' * 4096):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path), data
+
+
+def test_submit_computes_hash(tmp_path):
+    path, data = _write(tmp_path)
+    queue = VerifyQueue()
+    results = []
+    queue.submit(path, 'sha256', lambda h, elapsed: results.append(h), use_cache=False)
+    assert wait_until(lambda: results)
+    assert results == [hashlib.sha256(data).hexdigest()]
+    assert wait_until(lambda: queue.pending_count() == 0)
+    queue.shutdown()
+
+
+def test_submit_after_shutdown_calls_back_empty(tmp_path):
+    path, _ = _write(tmp_path)
+    queue = VerifyQueue()
+    queue.shutdown()
+    results = []
+    queue.submit(path, 'md5', lambda h, elapsed: results.append(h))
+    assert results == ['']
+    assert queue.pending_count() == 0
+
+
+def test_submit_racing_shutdown_leaves_no_pending(tmp_path):
+    path, _ = _write(tmp_path)
+    for _ in range(20):
+        queue = VerifyQueue()
+        calls = []
+        lock = threading.Lock()
+
+        def done(h, elapsed):
+            with lock:
+                calls.append(h)
+
+        def submitter():
+            for _ in range(25):
+                queue.submit(path, 'md5', done, use_cache=False)
+
+        threads = [threading.Thread(target=submitter) for _ in range(4)]
+        for t in threads:
+            t.start()
+        queue.shutdown()
+        for t in threads:
+            t.join()
+        assert wait_until(lambda: len(calls) == 100)
+        assert wait_until(lambda: queue.pending_count() == 0)